@@ -0,0 +1,190 @@
+# block_guard.py - ОПРЕДЕЛЕНИЕ КАПЧИ/БЛОКИРОВКИ И ПРЕДОХРАНИТЕЛЬ (CIRCUIT BREAKER) ПО МАРКЕТПЛЕЙСАМ
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Дешёвая проверка страницы вместо driver.page_source: адрес, заголовок,
+# наличие элементов капчи и начало видимого текста
+BLOCK_PROBE_JS = """
+const selectors = arguments[0] || [];
+let captcha = false;
+for (const s of selectors) {
+    try { if (document.querySelector(s)) { captcha = true; break; } } catch (e) {}
+}
+const body = document.body ? (document.body.innerText || '') : '';
+return {url: location.href || '', title: document.title || '', captcha: captcha, text: body.slice(0, 1500)};
+"""
+
+# Отметка строки тендера, которую не удалось получить из-за блокировки (как "ОШИБКА")
+BLOCKED_MARK = "БЛОКИРОВКА"
+
+CAPTCHA_SELECTORS = [
+    'form[action*="checkcaptcha"]',
+    '.CheckboxCaptcha', '.AdvancedCaptcha', '.SmartCaptcha',
+    '#checkbox-captcha-form',
+    'iframe[src*="captcha"]',
+]
+CAPTCHA_URL_MARKERS = ("showcaptcha", "smartcaptcha", "checkcaptcha", "/captcha", "/abuse")
+BLOCK_TITLE_MARKERS = ("Ой!", "Вы не робот", "Доступ ограничен", "Access denied", "Too Many Requests",
+                       "403 Forbidden")
+BLOCK_TEXT_MARKERS = ("Вы не робот", "Подтвердите, что запросы", "Доступ ограничен", "Access denied",
+                      "419 Too Many Requests", "429 Too Many Requests", "403 Forbidden")
+
+
+def block_reason_from_probe(probe: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Причина блокировки по результату BLOCK_PROBE_JS или None."""
+    if not isinstance(probe, dict):
+        return None
+    url = str(probe.get("url") or "")
+    title = str(probe.get("title") or "")
+    text = str(probe.get("text") or "")
+
+    for marker in CAPTCHA_URL_MARKERS:
+        if marker in url:
+            return f"капча в адресе ({marker})"
+    if probe.get("captcha"):
+        return "форма капчи на странице"
+    for marker in BLOCK_TITLE_MARKERS:
+        if marker in title:
+            return f"заголовок '{title[:40]}'"
+    for marker in BLOCK_TEXT_MARKERS:
+        if marker in text:
+            return f"текст '{marker}'"
+    return None
+
+
+def detect_block(driver) -> Optional[str]:
+    """Причина блокировки текущей страницы браузера или None (ошибки проверки - не блокировка)."""
+    try:
+        probe = driver.execute_script(BLOCK_PROBE_JS, CAPTCHA_SELECTORS)
+    except Exception as e:
+        logger.debug(f"Проверка блокировки не удалась: {e}")
+        return None
+    return block_reason_from_probe(probe)
+
+
+class CircuitBreaker:
+    """
+    Предохранитель одного маркетплейса, общий для всех воркеров.
+
+    После threshold блокировок подряд цепь размыкается: новые переходы ждут
+    cooldown секунд (каждое следующее срабатывание - вдвое дольше, не больше
+    max_cooldown). Потом один пробный товар проверяет, снята ли блокировка:
+    успех замыкает цепь, новая блокировка - снова пауза. Браузер, поймавший
+    блокировку, помечается driver.blocked и заменяется пулом на свежий профиль.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # Пробный товар, который так и не отчитался, не должен держать всех вечно
+    TRIAL_TIMEOUT = 120.0
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, name: str, threshold: int = 2, cooldown: float = 60.0, max_cooldown: float = 900.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.trips = 0
+        self.blocks = 0
+        self._consecutive = 0
+        self._open_until = 0.0
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def cooldown_left(self) -> float:
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._open_until - time.time())
+
+    def wait(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Ждёт, пока по маркетплейсу можно идти. False - парсинг остановлен во время паузы."""
+        should_stop = should_stop or (lambda: False)
+        while True:
+            if should_stop():
+                return False
+            with self._lock:
+                now = time.time()
+                if self.state == self.CLOSED:
+                    return True
+                if self.state == self.OPEN and now >= self._open_until:
+                    self.state = self.HALF_OPEN
+                    self._trial_started = None
+                    logger.info(f"🔌 {self.name}: пауза закончилась, пробный запрос")
+                if self.state == self.HALF_OPEN:
+                    if self._trial_started is None or now - self._trial_started > self.TRIAL_TIMEOUT:
+                        self._trial_started = now
+                        return True
+            time.sleep(self.POLL_INTERVAL)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                self._trial_started = None
+                logger.info(f"✅ {self.name}: блокировки нет, работа продолжается")
+
+    def record_block(self, reason: str = "") -> None:
+        with self._lock:
+            self.blocks += 1
+            self._consecutive += 1
+            if self.state == self.OPEN:
+                return
+            if self.state == self.CLOSED and self._consecutive < self.threshold:
+                logger.warning(f"🚧 {self.name}: блокировка ({reason}), {self._consecutive}/{self.threshold} до паузы")
+                return
+            self.trips += 1
+            pause = min(self.max_cooldown, self.cooldown * (2 ** (self.trips - 1)))
+            self.state = self.OPEN
+            self._open_until = time.time() + pause
+            self._trial_started = None
+            logger.warning(f"⛔ {self.name}: блокировка ({reason}) - пауза {pause:.0f} с, "
+                           f"браузеры получат свежие профили")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.trips = self.blocks = self._consecutive = 0
+            self._open_until = 0.0
+            self._trial_started = None
+
+    def log_stats(self) -> None:
+        if self.blocks:
+            logger.info(f"⛔ {self.name}: блокировок {self.blocks}, пауз {self.trips}")
+
+
+CIRCUIT_BREAKERS: Dict[str, CircuitBreaker] = {
+    "yandex": CircuitBreaker("yandex"),
+    "ozon": CircuitBreaker("ozon"),
+}
+
+
+def configure_circuit_breaker(marketplace: str, threshold: Optional[int] = None,
+                              cooldown: Optional[float] = None, max_cooldown: Optional[float] = None) -> None:
+    """Пороги предохранителя маркетплейса (None - оставить как есть)."""
+    breaker = CIRCUIT_BREAKERS[marketplace]
+    if threshold is not None:
+        breaker.threshold = max(1, threshold)
+    if cooldown is not None:
+        breaker.cooldown = max(1.0, cooldown)
+    if max_cooldown is not None:
+        breaker.max_cooldown = max(breaker.cooldown, max_cooldown)
+
+
+def report_block(marketplace: str, driver, reason: str) -> None:
+    """Блокировка на браузере: предохранитель + пометка браузера на замену профиля."""
+    if driver is not None:
+        try:
+            driver.blocked = True
+        except AttributeError:
+            pass
+    CIRCUIT_BREAKERS[marketplace].record_block(reason)
@@ -0,0 +1,149 @@
+# candidate_budget.py - АДАПТИВНЫЙ БЮДЖЕТ КАРТОЧЕК: СКОЛЬКО КАНДИДАТОВ ОТКРЫВАТЬ
+
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from work_planner import UNIT_ALIASES
+
+logger = logging.getLogger(__name__)
+
+# Вес каждого совпавшего токена модели поверх обычной релевантности
+MODEL_TOKEN_WEIGHT = 3
+
+_MODEL_TOKEN_RE = re.compile(r"[a-zа-я0-9]+(?:[-/.][a-zа-я0-9]+)*")
+_SPEC_RE = re.compile(r"^(\d+(?:\.\d+)?)([a-zа-я]+)$")
+
+
+def model_tokens(text: str) -> Set[str]:
+    """
+    Токены, похожие на модель/артикул: буквы вместе с цифрами или длинное число
+    ("DGS-1210-28" -> "dgs121028", "XS2000"). Характеристики вида "16Гб",
+    "220В" моделью не считаются. Дефисы и слэши внутри модели не важны.
+    """
+    tokens = set()
+    for raw in _MODEL_TOKEN_RE.findall(str(text or "").lower().replace("ё", "е")):
+        token = re.sub(r"[-/.]", "", raw)
+        if not any(c.isdigit() for c in token):
+            continue
+        spec = _SPEC_RE.match(raw)
+        if spec and spec.group(2) in UNIT_ALIASES:
+            continue
+        if token.isdigit() and len(token) < 4:
+            continue
+        if len(token) >= 3:
+            tokens.add(token)
+    return tokens
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"[^a-zа-я0-9]+", "", str(text or "").lower().replace("ё", "е"))
+
+
+class CandidateBudget:
+    """
+    Решает, сколько карточек выдачи открывать для одного товара.
+
+    Сила кандидата = relevance_score + MODEL_TOKEN_WEIGHT за каждый токен модели
+    из запроса, найденный в названии. Если лидер отрывается от остальных на
+    dominance_gap и больше - открывается только он; иначе (оценки неоднозначны)
+    открываются все равные по релевантности, как раньше, но не больше max_cards.
+    Остальные кандидаты - резерв: их открывают, только если основные не дали цены.
+    """
+
+    def __init__(self, max_cards: int = 5, dominance_gap: int = 2, enabled: bool = True):
+        self.max_cards = max_cards
+        self.dominance_gap = dominance_gap
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.items = 0
+        self.dominant = 0
+        self.baseline_loads = 0
+        self.loads = 0
+
+    def plan(self, scored_products: List[Dict[str, Any]],
+             search_term: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        scored_products - кандидаты с relevance_score (порядок выдачи).
+        Возвращает (открыть сейчас, резерв).
+        """
+        max_score = max((p['relevance_score'] for p in scored_products), default=0)
+        baseline = [p for p in scored_products if p['relevance_score'] == max_score] if max_score > 0 \
+            else list(scored_products)
+        baseline = baseline[:self.max_cards]
+        if not self.enabled or len(scored_products) < 2:
+            return baseline, []
+
+        query_models = model_tokens(search_term)
+        strengths = []
+        for product in scored_products:
+            title = _compact(product.get('title', ''))
+            matched = sum(1 for token in query_models if token in title)
+            strengths.append(product['relevance_score'] + MODEL_TOKEN_WEIGHT * matched)
+
+        top = max(strengths)
+        leaders = [p for p, s in zip(scored_products, strengths) if s == top]
+        runner_up = max((s for s in strengths if s != top), default=None)
+        gap = top - runner_up if runner_up is not None else 0
+
+        if len(leaders) == 1 and gap >= self.dominance_gap:
+            primary = leaders
+            if len(baseline) > 1:
+                with self._lock:
+                    self.dominant += 1
+                logger.info(f"🎯 Явный лидер (отрыв {gap}): открываю 1 карточку вместо {len(baseline)}")
+        elif query_models and top > max_score and len(leaders) < len(baseline):
+            # Модель совпала у нескольких - сравниваем цены только между ними
+            primary = leaders[:self.max_cards]
+            logger.info(f"🎯 Модель совпала у {len(leaders)} карточек: открываю их вместо {len(baseline)}")
+        else:
+            primary = baseline
+
+        primary_urls = {p.get('url') for p in primary}
+        reserve = [p for p in baseline if p.get('url') not in primary_urls]
+        return primary, reserve
+
+    def record(self, baseline: int, loaded: int) -> None:
+        """Учитывает товар: сколько карточек открыли бы без бюджета и сколько открыли."""
+        with self._lock:
+            self.items += 1
+            self.baseline_loads += baseline
+            self.loads += loaded
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.items = self.dominant = self.baseline_loads = self.loads = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "items": self.items,
+                "dominant": self.dominant,
+                "baseline_loads": self.baseline_loads,
+                "loads": self.loads,
+                "saved": self.baseline_loads - self.loads,
+            }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        if not stats["items"]:
+            return
+        logger.info(
+            f"🎯 Бюджет карточек: товаров {stats['items']}, явных лидеров {stats['dominant']}, "
+            f"открыто карточек {stats['loads']} из {stats['baseline_loads']}, "
+            f"сэкономлено {stats['saved']}"
+        )
+
+
+CANDIDATE_BUDGET = CandidateBudget()
+
+
+def configure_candidate_budget(enabled: bool = True, max_cards: Optional[int] = None,
+                               dominance_gap: Optional[int] = None) -> None:
+    """Настройка бюджета карточек из аргументов запуска."""
+    CANDIDATE_BUDGET.enabled = enabled
+    if max_cards is not None:
+        CANDIDATE_BUDGET.max_cards = max(1, max_cards)
+    if dominance_gap is not None:
+        CANDIDATE_BUDGET.dominance_gap = max(1, dominance_gap)
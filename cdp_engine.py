@@ -0,0 +1,464 @@
+# cdp_engine.py - АСИНХРОННЫЙ ДВИЖОК: МНОГО ВКЛАДОК EDGE ИЗ ОДНОГО EVENT LOOP (trio + DevTools)
+
+import itertools
+import json
+import logging
+import shutil
+import subprocess
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import requests
+import trio
+from trio_websocket import ConnectionClosed, open_websocket_url
+
+import tender_parser
+from block_guard import BLOCK_PROBE_JS, CAPTCHA_SELECTORS, CIRCUIT_BREAKERS, block_reason_from_probe
+from candidate_budget import CANDIDATE_BUDGET
+from concurrency_controller import FetchFailed
+from market_helpers import (CARD_UNAVAILABLE_MARKERS, CARD_UNAVAILABLE_SELECTORS, EMPTY_RESULTS_MARKERS,
+                            EMPTY_RESULTS_SELECTORS, PAGE_MARKERS_JS, PRODUCT_LINK_SELECTORS)
+from page_ready import READY_TIMEOUTS, WAIT_FOR_SELECTORS_JS
+from price_cache import (MISS_BLOCKED, MISS_NOT_FOUND, PRICE_CACHE, cached_candidates, cached_card_prices,
+                         cached_miss, cached_prices, price_mode, remember_miss)
+from rate_limiter import limiter_for_url
+from resource_blocking import get_blocking_policy
+from utils import get_browser_paths
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = 8
+CDP_COMMAND_TIMEOUT = 30
+DEVTOOLS_STARTUP_TIMEOUT = 20
+WS_MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+EDGE_FALLBACK_BINARY = Path(r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe")
+# Ошибки CDP, означающие, что документ сменился во время выполнения скрипта
+NAVIGATION_ERRORS = ("Execution context was destroyed", "Cannot find context", "Inspected target navigated")
+
+
+class CDPError(Exception):
+    """Ошибка, которую вернул DevTools-протокол."""
+
+
+def _edge_binary(binary: Optional[str] = None) -> Path:
+    if binary:
+        return Path(binary)
+    bundled = Path(get_browser_paths()["edge"]["binary"])
+    if bundled.exists():
+        return bundled
+    found = shutil.which("msedge")
+    return Path(found) if found else EDGE_FALLBACK_BINARY
+
+
+class CDPConnection:
+    """
+    Одно websocket-соединение с браузером. Вкладки работают через плоские
+    сессии (Target.attachToTarget flatten=True), ответы разбираются по id.
+    """
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, trio.MemorySendChannel] = {}
+
+    async def send(self, method: str, params: Optional[Dict[str, Any]] = None,
+                   session_id: Optional[str] = None, timeout: float = CDP_COMMAND_TIMEOUT) -> Dict[str, Any]:
+        message_id = next(self._ids)
+        send_channel, receive_channel = trio.open_memory_channel(1)
+        self._pending[message_id] = send_channel
+
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+
+        try:
+            await self._ws.send_message(json.dumps(message))
+            with trio.fail_after(timeout):
+                reply = await receive_channel.receive()
+        finally:
+            self._pending.pop(message_id, None)
+
+        if "error" in reply:
+            raise CDPError(reply["error"].get("message", str(reply["error"])))
+        return reply.get("result", {})
+
+    async def reader(self) -> None:
+        """Фоновая задача: раздаёт ответы ожидающим командам. События не нужны - игнорируются."""
+        while True:
+            try:
+                raw = await self._ws.get_message()
+            except ConnectionClosed:
+                break
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            channel = self._pending.get(message.get("id"))
+            if channel is not None:
+                try:
+                    channel.send_nowait(message)
+                except trio.WouldBlock:
+                    pass
+
+        # Соединение закрыто - будим все ожидающие команды ошибкой
+        for message_id, channel in list(self._pending.items()):
+            try:
+                channel.send_nowait({"id": message_id, "error": {"message": "DevTools connection closed"}})
+            except trio.WouldBlock:
+                pass
+
+
+class CDPPage:
+    """Вкладка браузера, управляемая через CDP-сессию."""
+
+    def __init__(self, connection: CDPConnection, target_id: str, session_id: str):
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+
+    async def send(self, method: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return await self.connection.send(method, params, session_id=self.session_id)
+
+    async def navigate(self, url: str) -> None:
+        # Общий лимит хоста; одновременные вкладки и так ограничены max_pages
+        limiter = limiter_for_url(url)
+        if limiter is not None:
+            delay = limiter.reserve()
+            if delay > 0:
+                await trio.sleep(delay)
+        result = await self.send("Page.navigate", {"url": url})
+        if result.get("errorText"):
+            raise CDPError(f"Ошибка перехода: {result['errorText']}")
+
+    async def call(self, function_body: str, *args, timeout: float = CDP_COMMAND_TIMEOUT) -> Any:
+        """
+        Выполняет тело JS-функции (в том же формате, что и driver.execute_script)
+        с аргументами arguments[0..n] и возвращает значение.
+        """
+        expression = f"(function() {{\n{function_body}\n}}).apply(null, {json.dumps(list(args))})"
+        result = await self.connection.send("Runtime.evaluate", {
+            "expression": expression,
+            "returnByValue": True,
+            "awaitPromise": True,
+        }, session_id=self.session_id, timeout=timeout)
+        if result.get("exceptionDetails"):
+            raise CDPError(result["exceptionDetails"].get("text", "JS exception"))
+        return result.get("result", {}).get("value")
+
+    async def wait_for_selector(self, selectors: Sequence[str], timeout: float) -> bool:
+        """Как page_ready.wait_for_any_selector, но без блокировки потока."""
+        # Асинхронный скрипт selenium получает done последним аргументом - заворачиваем в Promise
+        expression_body = (
+            "return new Promise((resolve) => (function() {\n"
+            + WAIT_FOR_SELECTORS_JS
+            + "\n}).apply(null, [arguments[0], arguments[1], resolve]));"
+        )
+        deadline = trio.current_time() + timeout
+        while True:
+            remaining = deadline - trio.current_time()
+            if remaining <= 0:
+                return False
+            try:
+                return bool(await self.call(expression_body, list(selectors), int(remaining * 1000),
+                                            timeout=remaining + 5))
+            except CDPError as e:
+                if not any(marker in str(e) for marker in NAVIGATION_ERRORS):
+                    raise
+                # Документ ещё меняется (about:blank → целевая страница) - ждём новый
+                await trio.sleep(0.1)
+
+
+class CDPBrowser:
+    """Процесс Edge с открытым DevTools и ограничением числа одновременных вкладок."""
+
+    def __init__(self, connection: CDPConnection, max_pages: int = DEFAULT_MAX_PAGES,
+                 blocked_urls: Optional[List[str]] = None, business_auth: bool = False):
+        self.connection = connection
+        self.page_limiter = trio.CapacityLimiter(max(1, int(max_pages or 1)))
+        self.blocked_urls = blocked_urls or []
+        # Профиль с авторизацией: цены кэшируются отдельно от цен без неё
+        self.cache_mode = price_mode(business_auth)
+
+    @asynccontextmanager
+    async def page(self):
+        """Новая вкладка; общее число открытых вкладок ограничено max_pages."""
+        async with self.page_limiter:
+            created = await self.connection.send("Target.createTarget", {"url": "about:blank"})
+            target_id = created["targetId"]
+            try:
+                attached = await self.connection.send("Target.attachToTarget",
+                                                      {"targetId": target_id, "flatten": True})
+                page = CDPPage(self.connection, target_id, attached["sessionId"])
+                if self.blocked_urls:
+                    await page.send("Network.enable")
+                    await page.send("Network.setBlockedURLs", {"urls": self.blocked_urls})
+                yield page
+            finally:
+                with trio.CancelScope(shield=True):
+                    try:
+                        await self.connection.send("Target.closeTarget", {"targetId": target_id}, timeout=5)
+                    except Exception:
+                        pass
+
+
+async def _read_devtools_endpoint(profile_dir: Path, process: subprocess.Popen) -> str:
+    """Ждёт файл DevToolsActivePort и возвращает ws-адрес браузера."""
+    port_file = profile_dir / "DevToolsActivePort"
+    with trio.fail_after(DEVTOOLS_STARTUP_TIMEOUT):
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Edge завершился при запуске (код {process.returncode})")
+            if port_file.exists():
+                lines = port_file.read_text(encoding="utf-8").split()
+                if len(lines) >= 2:
+                    return f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+            await trio.sleep(0.1)
+
+
+@asynccontextmanager
+async def launch_cdp_browser(headless: bool = True, use_business_auth: bool = False,
+                             max_pages: int = DEFAULT_MAX_PAGES, binary: Optional[str] = None):
+    """Запускает Edge с --remote-debugging-port и отдаёт CDPBrowser."""
+    if use_business_auth:
+        profile_dir = tender_parser.AUTH_APP_DIR / f"edge_cdp_{uuid.uuid4().hex[:8]}"
+        template_dir = tender_parser.get_auth_profile_template("edge")
+        if template_dir:
+            tender_parser.clone_profile_template(template_dir, profile_dir)
+        else:
+            logger.warning("Шаблон авторизованного профиля не найден, движок CDP работает без авторизации")
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            use_business_auth = False
+    else:
+        profile_dir = Path(tempfile.mkdtemp(prefix=f"edge_cdp_{uuid.uuid4().hex[:8]}_"))
+    tender_parser.CREATED_PROFILES.add(str(profile_dir))
+
+    args = [
+        str(_edge_binary(binary)),
+        "--remote-debugging-port=0",
+        f"--user-data-dir={profile_dir}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-extensions",
+        "--disable-sync",
+        "--disable-gpu",
+        "--window-size=1280,800",
+        "about:blank",
+    ]
+    if headless:
+        args.insert(1, "--headless=new")
+
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ws_url = await _read_devtools_endpoint(profile_dir, process)
+        async with open_websocket_url(ws_url, max_message_size=WS_MAX_MESSAGE_SIZE) as ws:
+            connection = CDPConnection(ws)
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(connection.reader)
+                yield CDPBrowser(connection, max_pages=max_pages,
+                                 blocked_urls=get_blocking_policy("yandex").url_patterns(),
+                                 business_auth=use_business_auth)
+                with trio.CancelScope(shield=True):
+                    try:
+                        await connection.send("Browser.close", timeout=5)
+                    except Exception:
+                        pass
+                nursery.cancel_scope.cancel()
+    finally:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        tender_parser.PROFILE_REAPER.submit(str(profile_dir), [process.pid])
+
+
+async def _load_card(browser: CDPBrowser, product: Dict[str, Any], index: int,
+                     results: List[Dict[str, Any]]) -> None:
+    try:
+        prices = cached_card_prices(product['url'], f"товар {index}: ", browser.cache_mode)
+        unavailable = False
+        if prices is None:
+            async with browser.page() as page:
+                await page.navigate(product['url'])
+                await page.wait_for_selector(tender_parser.CARD_PRICE_SELECTORS, READY_TIMEOUTS["card"])
+                bulk_data = await page.call(tender_parser.EXTRACT_PRICES_JS)
+                prices = tender_parser.classify_price_lines(bulk_data)
+                if not prices.get('обычная цена'):
+                    unavailable = bool(await page.call(PAGE_MARKERS_JS, CARD_UNAVAILABLE_SELECTORS,
+                                                       CARD_UNAVAILABLE_MARKERS))
+            logger.info(f"  {index}. {tender_parser._short_title(product['title'])}")
+            PRICE_CACHE.put_card(product['url'], prices, browser.cache_mode)
+        results.append(tender_parser._build_card_result(product, index, prices, unavailable))
+    except Exception as e:
+        logger.warning(f"     Ошибка карточки {index}: {e}")
+
+
+async def _load_cards(browser: CDPBrowser, products: List[Dict[str, Any]],
+                      start: int = 1) -> List[Dict[str, Any]]:
+    """Карточки одновременно во вкладках; результат в порядке выдачи."""
+    card_results: List[Dict[str, Any]] = []
+    async with trio.open_nursery() as nursery:
+        for i, product in enumerate(products, start):
+            nursery.start_soon(_load_card, browser, product, i, card_results)
+    card_results.sort(key=lambda p: p['index'])
+    return card_results
+
+
+async def _search_products(browser: CDPBrowser, product_name: str, query: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Первые 5 карточек выдачи маркета по запросу.
+    None - капча/блокировка или выдача не загрузилась, [] - выдача явно пустая.
+    """
+    try:
+        async with browser.page() as page:
+            await page.navigate(tender_parser.SEARCH_URL_TEMPLATE.format(query=requests.utils.quote(query)))
+            if not await page.wait_for_selector(PRODUCT_LINK_SELECTORS, READY_TIMEOUTS["search"]):
+                # Капча выглядит как пустая выдача - проверяем страницу
+                reason = block_reason_from_probe(await page.call(BLOCK_PROBE_JS, CAPTCHA_SELECTORS))
+                if reason:
+                    logger.warning(f"🚧 Маркет заблокировал поиск: {reason}")
+                    remember_miss("yandex", product_name, MISS_BLOCKED)
+                    CIRCUIT_BREAKERS["yandex"].record_block(reason)
+                    return None
+                # Промах "не найдено" - только при явной отметке пустой выдачи
+                if not await page.call(PAGE_MARKERS_JS, EMPTY_RESULTS_SELECTORS, EMPTY_RESULTS_MARKERS):
+                    logger.warning(f"Выдача не загрузилась: {product_name[:40]}")
+                    return None
+                CIRCUIT_BREAKERS["yandex"].record_success()
+                return []
+            products_data = await page.call(tender_parser.EXTRACT_PRODUCTS_JS, PRODUCT_LINK_SELECTORS)
+    except Exception as e:
+        logger.error(f"Ошибка поиска {product_name[:30]}...: {e}")
+        return None
+
+    CIRCUIT_BREAKERS["yandex"].record_success()
+
+    return [
+        {'title': p['title'], 'url': p['url'], 'index': p['index'],
+         'snippet_price': p.get('snippet_price') or ''}
+        for p in (products_data or [])[:5]
+        if p.get('url') and p.get('title')
+    ]
+
+
+async def get_prices_async(product_name: str, browser: Optional[CDPBrowser] = None,
+                           snippet_prices: bool = False, **launch_kwargs) -> Dict[str, str]:
+    """
+    Асинхронный аналог tender_parser.get_prices: поиск и все карточки - вкладки
+    одного браузера, карточки грузятся одновременно.
+    snippet_prices=True - цена из сниппетов выдачи, карточки только если её там нет.
+    """
+    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+
+    mode = browser.cache_mode if browser is not None else price_mode(launch_kwargs.get("use_business_auth", False))
+    cached = cached_prices("yandex", product_name, mode)
+    if cached is not None:
+        return cached
+    if cached_miss("yandex", product_name):
+        return result
+
+    if browser is None:
+        async with launch_cdp_browser(**launch_kwargs) as own_browser:
+            return await get_prices_async(product_name, own_browser, snippet_prices)
+
+    if tender_parser.STOP_PARSING:
+        return result
+
+    query = tender_parser._normalize_search_term(product_name)
+    if not query:
+        return result
+
+    # Предохранитель разомкнут - ждём конца паузы (профиль общего браузера не меняется)
+    while CIRCUIT_BREAKERS["yandex"].cooldown_left() > 0:
+        if tender_parser.STOP_PARSING:
+            return result
+        await trio.sleep(min(CIRCUIT_BREAKERS["yandex"].cooldown_left(), 1.0))
+
+    # Кандидаты из кэша поиска: страницу выдачи не открываем
+    products = cached_candidates("yandex", product_name)
+    if products is None:
+        products = await _search_products(browser, product_name, query)
+        if products is None:
+            # Блокировка уже записана промахом; иначе это сбой - строка уйдёт в ошибки
+            if tender_parser.STOP_PARSING or PRICE_CACHE.get_miss("yandex", product_name) == MISS_BLOCKED:
+                return result
+            raise FetchFailed("поиск не удался")
+        if not products:
+            logger.warning(f"Товары не найдены: {product_name[:40]}")
+            remember_miss("yandex", product_name, MISS_NOT_FOUND)
+            return result
+        PRICE_CACHE.put_candidates("yandex", product_name, products)
+
+    filtered_products = tender_parser.select_relevant_products(products, product_name)
+
+    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+    if snippet_prices:
+        snippet_results = tender_parser.snippet_price_results(filtered_products)
+        if snippet_results:
+            result = tender_parser.choose_best_product(snippet_results)
+
+    if not result["цена"]:
+        # Бюджет: при явном лидере грузим только его, резерв - если у основных нет цены
+        primary, reserve = CANDIDATE_BUDGET.plan(tender_parser.score_products(products, product_name),
+                                                 product_name)
+        card_results = await _load_cards(browser, primary)
+        loaded = len(primary)
+        if reserve and not any(p['regular_price_num'] != float('inf') for p in card_results):
+            card_results += await _load_cards(browser, reserve, start=len(primary) + 1)
+            loaded += len(reserve)
+        CANDIDATE_BUDGET.record(len(filtered_products), loaded)
+        result = tender_parser.choose_best_product(card_results)
+    if any(result.values()):
+        # Цены из сниппетов неполные (без захода в карточку) - в общий кэш не пишем
+        if not snippet_prices:
+            PRICE_CACHE.put("yandex", product_name, result, browser.cache_mode)
+    elif not tender_parser.STOP_PARSING:
+        if not tender_parser.cards_not_available(card_results):
+            # Кандидаты могли устареть - при повторе искать заново
+            PRICE_CACHE.forget_candidates("yandex", product_name)
+            raise FetchFailed("карточки не загрузились")
+        remember_miss("yandex", product_name, MISS_NOT_FOUND)
+    return result
+
+
+async def _run_batch(names: List[str], max_pages: int, headless: bool, use_business_auth: bool,
+                     on_result: Optional[Callable[[str, Optional[Dict[str, str]]], None]],
+                     snippet_prices: bool) -> Dict[str, Optional[Dict[str, str]]]:
+    results: Dict[str, Optional[Dict[str, str]]] = {}
+
+    async def one(name: str) -> None:
+        # Ошибка одного товара не должна отменять весь nursery и остальные вкладки
+        try:
+            prices = await get_prices_async(name, browser, snippet_prices)
+        except Exception as e:
+            logger.error(f"Ошибка товара {name[:30]}...: {e}")
+            prices = None
+        results[name] = prices
+        if on_result:
+            # Автосохранение и журнал - синхронный ввод-вывод, не держим им event loop
+            await trio.to_thread.run_sync(on_result, name, prices)
+
+    async with launch_cdp_browser(headless=headless, use_business_auth=use_business_auth,
+                                  max_pages=max_pages) as browser:
+        async with trio.open_nursery() as nursery:
+            for name in names:
+                nursery.start_soon(one, name)
+
+    return results
+
+
+def run_batch(names: List[str], max_pages: int = DEFAULT_MAX_PAGES, headless: bool = True,
+              use_business_auth: bool = False,
+              on_result: Optional[Callable[[str, Optional[Dict[str, str]]], None]] = None,
+              snippet_prices: bool = False) -> Dict[str, Optional[Dict[str, str]]]:
+    """
+    Синхронная точка входа для parse_tender_excel: парсит все наименования в одном
+    браузере, параллельность ограничена числом вкладок max_pages, а не потоков.
+    on_result(name, prices) вызывается в рабочем потоке по мере готовности каждого
+    товара; prices=None - товар завершился ошибкой.
+    """
+    logger.info(f"⚡ Движок CDP: {len(names)} товаров, до {max_pages} вкладок одновременно")
+    return trio.run(_run_batch, list(names), max_pages, headless, use_business_auth, on_result,
+                    snippet_prices)
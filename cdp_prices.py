@@ -0,0 +1,218 @@
+# cdp_prices.py - ЦЕНЫ ЯНДЕКС МАРКЕТА ИЗ СЕТЕВЫХ ОТВЕТОВ (CDP)
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from resource_blocking import drain_network_events, enable_performance_log, warn_once
+
+logger = logging.getLogger(__name__)
+
+PRICE_ENGINES = ("dom", "cdp")
+
+# Ответы, в которых маркет отдаёт данные карточки
+JSON_MIME_MARKERS = ("json",)
+PRICE_KEY_RE = re.compile(r"price", re.IGNORECASE)
+# Цены, которые не являются ценой продажи
+SKIP_PRICE_KEY_RE = re.compile(
+    r"old|base|strike|discount|unit|min|max|delivery|credit|instal|currency|valid|count|type",
+    re.IGNORECASE,
+)
+# Признаки цены для юрлиц (с НДС / B2B)
+VAT_PATH_RE = re.compile(r"vat|nds|b2b|business|legal|juridical", re.IGNORECASE)
+# Ключи цены с картой / Пэй (целиком, а не подстрока: "productCard" - не цена с картой)
+PAY_KEY_RE = re.compile(r"(yandex)?pay(price)?|price(with)?(yandex)?(pay|card)|card(price)?|plusprice",
+                        re.IGNORECASE)
+# Поля, по которым объект JSON относится к конкретной карточке
+ID_KEY_RE = re.compile(r"id|sku|skuid|marketsku|productid|modelid|offerid", re.IGNORECASE)
+# Параметры ссылки карточки с её идентификаторами
+CARD_ID_PARAMS = ("sku", "productId", "offerid")
+# Расхождение JSON и DOM больше этой доли - цена из JSON не принимается
+PRICE_MISMATCH_TOLERANCE = 0.01
+MAX_RESPONSE_BODIES = 25
+
+
+def enable_network_capture(options) -> None:
+    """Включает журнал performance, из которого берутся CDP-события Network.*"""
+    enable_performance_log(options)
+
+
+def _json_response_ids(events: List[Dict[str, Any]]) -> List[str]:
+    request_ids = []
+    for event in events:
+        if event.get("method") != "Network.responseReceived":
+            continue
+        params = event.get("params", {})
+        response = params.get("response", {})
+        mime = str(response.get("mimeType", "")).lower()
+        if response.get("status") == 200 and any(m in mime for m in JSON_MIME_MARKERS):
+            request_ids.append(params.get("requestId"))
+    return [r for r in request_ids if r]
+
+
+def _load_json_bodies(driver, request_ids: List[str]) -> Iterator[Any]:
+    for request_id in request_ids[-MAX_RESPONSE_BODIES:]:
+        try:
+            body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception:
+            # Тело уже выгружено из буфера браузера или запрос не завершён
+            continue
+        if body.get("base64Encoded"):
+            continue
+        try:
+            yield json.loads(body.get("body") or "")
+        except ValueError:
+            continue
+
+
+def _price_value(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    if isinstance(value, str):
+        cleaned = re.sub(r"[^\d.,]", "", value).replace(",", ".")
+        try:
+            number = float(cleaned) if cleaned else None
+        except ValueError:
+            return None
+        return number if number and number > 0 else None
+    if isinstance(value, dict):
+        for key in ("value", "amount", "price", "current"):
+            if key in value:
+                return _price_value(value[key])
+    return None
+
+
+def card_ids_from_url(url: str) -> Set[str]:
+    """
+    Идентификаторы карточки из ссылки: числовые части пути (id модели/товара)
+    и параметры sku/productId/offerid.
+    """
+    parts = urlsplit(str(url or ""))
+    ids = {segment for segment in parts.path.split("/") if segment.isdigit() and len(segment) >= 5}
+    ids.update(value for key, value in parse_qsl(parts.query) if key in CARD_ID_PARAMS and value)
+    return ids
+
+
+def _node_ids(node: Dict[str, Any]) -> Set[str]:
+    return {
+        str(value) for key, value in node.items()
+        if ID_KEY_RE.fullmatch(str(key)) and isinstance(value, (str, int)) and not isinstance(value, bool)
+    }
+
+
+def _walk_prices(node: Any, card_ids: Set[str], path: Tuple[str, ...] = (),
+                 anchored: bool = False) -> Iterator[Tuple[Tuple[str, ...], float]]:
+    """
+    Обходит JSON и отдаёт (путь ключей, цена) для полей *price* внутри объекта
+    с id карточки. Вложенный объект с другим id (рекомендации, аксессуары) не берётся.
+    """
+    if isinstance(node, dict):
+        own_ids = _node_ids(node)
+        if own_ids & card_ids:
+            anchored = True
+        elif own_ids:
+            anchored = False
+        for key, value in node.items():
+            key = str(key)
+            child_path = path + (key,)
+            if PRICE_KEY_RE.search(key) and not SKIP_PRICE_KEY_RE.search(key):
+                number = _price_value(value)
+                if number is not None:
+                    if anchored:
+                        yield child_path, number
+                    continue
+            yield from _walk_prices(value, card_ids, child_path, anchored)
+    elif isinstance(node, list):
+        for item in node[:50]:
+            yield from _walk_prices(item, card_ids, path, anchored)
+
+
+def _format_price(number: float) -> str:
+    if number == int(number):
+        return f"{int(number):,} ₽".replace(",", " ")
+    return f"{number:,.2f} ₽".replace(",", " ").replace(".", ",")
+
+
+def prices_from_payloads(payloads: List[Any], card_ids: Set[str]) -> Dict[str, str]:
+    """
+    Выбирает обычную цену и цену для юрлиц из JSON-ответов страницы.
+    Берутся только цены объектов с id карточки (card_ids_from_url); без id - ничего.
+    """
+    price_data = {'обычная цена': '', 'цена для юрлиц': ''}
+    if not card_ids:
+        return price_data
+
+    regular: Optional[float] = None
+    pay: Optional[float] = None
+    vat: Optional[float] = None
+
+    for payload in payloads:
+        for path, number in _walk_prices(payload, card_ids):
+            joined = ".".join(path)
+            if VAT_PATH_RE.search(joined):
+                vat = vat if vat is not None else number
+            elif any(PAY_KEY_RE.fullmatch(key) for key in path):
+                pay = pay if pay is not None else number
+            else:
+                regular = regular if regular is not None else number
+
+    # Как и в extract_prices_fast: цена с Пэй приоритетнее первой найденной
+    best_regular = pay if pay is not None else regular
+    if best_regular is not None:
+        price_data['обычная цена'] = _format_price(best_regular)
+    if vat is not None:
+        price_data['цена для юрлиц'] = _format_price(vat)
+    return price_data
+
+
+def prices_disagree(json_price: str, dom_price: str) -> bool:
+    """Цены из JSON и из DOM отличаются больше чем на PRICE_MISMATCH_TOLERANCE."""
+    json_number = _price_value(json_price)
+    dom_number = _price_value(dom_price)
+    if json_number is None or dom_number is None:
+        return False
+    return abs(json_number - dom_number) > dom_number * PRICE_MISMATCH_TOLERANCE
+
+
+class NetworkPriceWatcher:
+    """
+    Цены открытой карточки из сетевых ответов по мере их прихода: каждый poll()
+    забирает новые события журнала и тела завершившихся JSON-ответов.
+    Цены берутся только из объектов с id карточки, поэтому сверка с DOM не нужна.
+    """
+
+    def __init__(self, driver, card_url: Optional[str] = None):
+        self.driver = driver
+        if card_url is None:
+            try:
+                card_url = driver.current_url
+            except Exception:
+                card_url = ""
+        self.card_ids = card_ids_from_url(card_url)
+        self.events: List[Dict[str, Any]] = []
+        self.payloads: List[Any] = []
+        self._json_ids: Set[str] = set()
+        self._finished_ids: Set[str] = set()
+        self._loaded_ids: Set[str] = set()
+
+    def poll(self) -> Dict[str, str]:
+        new_events = drain_network_events(self.driver)
+        if not new_events and not self.events:
+            warn_once("cdp_prices", "CDP: браузер не отдаёт сетевые события - цены берутся из DOM")
+        self.events.extend(new_events)
+        self._json_ids.update(_json_response_ids(new_events))
+        self._finished_ids.update(
+            event.get("params", {}).get("requestId") for event in new_events
+            if event.get("method") == "Network.loadingFinished"
+        )
+        # Тело доступно только после loadingFinished; каждое читаем один раз
+        ready = [r for r in self._json_ids & self._finished_ids if r not in self._loaded_ids]
+        ready = ready[:max(0, MAX_RESPONSE_BODIES - len(self._loaded_ids))]
+        self._loaded_ids.update(ready)
+        self.payloads.extend(_load_json_bodies(self.driver, ready))
+        return prices_from_payloads(self.payloads, self.card_ids)
+
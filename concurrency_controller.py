@@ -0,0 +1,200 @@
+# concurrency_controller.py - АДАПТИВНАЯ ПАРАЛЛЕЛЬНОСТЬ БРАУЗЕРОВ (AIMD) ПО МАРКЕТПЛЕЙСАМ
+
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Deque, Dict, Optional
+
+from price_cache import MISS_BLOCKED, PRICE_CACHE
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_OK = "ok"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_BLOCKED = "blocked"
+OUTCOME_ERROR = "error"
+
+OUTCOME_TEXT = {
+    OUTCOME_TIMEOUT: "слишком долгий товар",
+    OUTCOME_BLOCKED: "блокировка",
+    OUTCOME_ERROR: "много ошибок",
+}
+
+
+class FetchFailed(Exception):
+    """Товар не получен из-за сбоя (ошибка браузера, таймаут), а не потому, что его нет."""
+
+
+class AIMDController:
+    """
+    Сколько товаров маркетплейса парсится одновременно (= сколько браузеров работают).
+
+    Рост аддитивный: после серии здоровых товаров (без ошибок, задержка не хуже
+    latency_factor x лучшей сглаженной) лимит +1, не выше max_limit.
+    Снижение мультипликативное: блокировка, товар дольше slow_seconds или доля
+    ошибок выше error_rate в последних window товарах - лимит x decrease_factor,
+    не ниже min_limit. Одна волна сбоев режет лимит один раз: товары, начатые
+    до последнего снижения, повторно его не снижают.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, name: str, min_limit: int = 1, max_limit: int = 4, initial: Optional[int] = None,
+                 decrease_factor: float = 0.5, slow_seconds: float = 90.0, latency_factor: float = 1.5,
+                 error_rate: float = 0.3, window: int = 20):
+        self.name = name
+        self.decrease_factor = decrease_factor
+        self.slow_seconds = slow_seconds
+        self.latency_factor = latency_factor
+        self.error_rate = error_rate
+        self._cond = threading.Condition()
+        self._recent: Deque[str] = collections.deque(maxlen=window)
+        self.reset(min_limit, max_limit, initial)
+
+    def reset(self, min_limit: int = 1, max_limit: int = 4, initial: Optional[int] = None) -> None:
+        """Новые границы и сброс статистики (в начале каждого прогона)."""
+        with self._cond:
+            self.min_limit = max(1, int(min_limit))
+            self.max_limit = max(self.min_limit, int(max_limit))
+            start = initial if initial is not None else self.min_limit
+            self.limit = float(min(self.max_limit, max(self.min_limit, start)))
+            self.active = 0
+            self.increases = 0
+            self.decreases = 0
+            self.peak = int(self.limit)
+            self._streak = 0
+            self._latency_ewma: Optional[float] = None
+            self._best_latency: Optional[float] = None
+            self._samples = 0
+            self._last_decrease = 0.0
+            self._recent.clear()
+            self._cond.notify_all()
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_limit > self.min_limit
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Ждёт свободного места в лимите. False - парсинг остановлен во время ожидания."""
+        should_stop = should_stop or (lambda: False)
+        with self._cond:
+            while self.active >= int(self.limit):
+                if should_stop():
+                    return False
+                self._cond.wait(timeout=self.POLL_INTERVAL)
+            self.active += 1
+            return True
+
+    def release(self, outcome: str, latency: float, started: float) -> None:
+        """Возвращает место и подстраивает лимит по результату товара."""
+        with self._cond:
+            self.active -= 1
+            self._recent.append(outcome)
+            if outcome == OUTCOME_OK:
+                self._observe_latency(latency)
+
+            if outcome in (OUTCOME_TIMEOUT, OUTCOME_BLOCKED) or self._error_rate_exceeded():
+                self._streak = 0
+                if started >= self._last_decrease:
+                    reason = outcome if outcome != OUTCOME_OK else OUTCOME_ERROR
+                    self._decrease(OUTCOME_TEXT.get(reason, reason))
+            elif outcome == OUTCOME_OK:
+                self._streak += 1
+                if self._streak >= max(3, int(self.limit) * 2) and self._latency_healthy():
+                    self._increase()
+                    self._streak = 0
+            else:
+                self._streak = 0
+            self._cond.notify_all()
+
+    def call(self, fn: Callable[[], Dict[str, str]], product_name: str,
+             should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, str]:
+        """
+        Вызывает fn() в пределах лимита и учитывает результат (для цен маркетплейса self.name).
+        Исключение fn (в том числе FetchFailed) засчитывается как OUTCOME_ERROR и уходит
+        вызывающему: строка отмечается ошибкой и повторяется при --resume.
+        """
+        if not self.acquire(should_stop):
+            return {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+        started = time.time()
+        outcome = OUTCOME_ERROR
+        try:
+            prices = fn()
+            outcome = self.classify(product_name, prices, time.time() - started)
+            return prices
+        finally:
+            self.release(outcome, time.time() - started, started)
+
+    def classify(self, product_name: str, prices: Dict[str, str], latency: float) -> str:
+        if not any(prices.values()) and PRICE_CACHE.get_miss(self.name, product_name) == MISS_BLOCKED:
+            return OUTCOME_BLOCKED
+        if self.slow_seconds and latency > self.slow_seconds:
+            return OUTCOME_TIMEOUT
+        return OUTCOME_OK
+
+    def _observe_latency(self, latency: float) -> None:
+        if self._latency_ewma is None:
+            self._latency_ewma = latency
+        else:
+            self._latency_ewma = 0.7 * self._latency_ewma + 0.3 * latency
+        self._samples += 1
+        if self._samples >= 3 and (self._best_latency is None or self._latency_ewma < self._best_latency):
+            self._best_latency = self._latency_ewma
+
+    def _latency_healthy(self) -> bool:
+        if self._best_latency is None or self._latency_ewma is None:
+            return True
+        return self._latency_ewma <= self._best_latency * self.latency_factor
+
+    def _error_rate_exceeded(self) -> bool:
+        if len(self._recent) < 5:
+            return False
+        errors = sum(1 for outcome in self._recent if outcome == OUTCOME_ERROR)
+        return errors / len(self._recent) > self.error_rate
+
+    def _increase(self) -> None:
+        if self.limit >= self.max_limit:
+            return
+        old = int(self.limit)
+        self.limit = min(float(self.max_limit), float(old + 1))
+        self.increases += 1
+        self.peak = max(self.peak, int(self.limit))
+        latency = f", задержка ~{self._latency_ewma:.1f} с" if self._latency_ewma is not None else ""
+        logger.info(f"📈 {self.name}: параллельность {old} → {int(self.limit)} (товары без сбоев{latency})")
+
+    def _decrease(self, reason: str) -> None:
+        self._last_decrease = time.time()
+        self._recent.clear()
+        if self.limit <= self.min_limit:
+            logger.info(f"📉 {self.name}: {reason}, параллельность уже минимальная ({self.min_limit})")
+            return
+        old = int(self.limit)
+        self.limit = max(float(self.min_limit), float(int(self.limit * self.decrease_factor)))
+        self.decreases += 1
+        logger.warning(f"📉 {self.name}: параллельность {old} → {int(self.limit)} ({reason})")
+
+    def log_stats(self) -> None:
+        if not self.adaptive:
+            return
+        logger.info(
+            f"🎛️ {self.name}: параллельность в конце {int(self.limit)}, максимум {self.peak} "
+            f"(границы {self.min_limit}..{self.max_limit}), повышений {self.increases}, снижений {self.decreases}"
+        )
+
+
+CONCURRENCY_CONTROLLERS: Dict[str, AIMDController] = {
+    "yandex": AIMDController("yandex"),
+    # Ozon блокирует раньше: по умолчанию один браузер, рост только если разрешить
+    "ozon": AIMDController("ozon", max_limit=1),
+}
+
+
+def configure_concurrency(marketplace: str, min_limit: Optional[int] = None, max_limit: Optional[int] = None,
+                          slow_seconds: Optional[float] = None) -> None:
+    """Границы адаптивной параллельности маркетплейса (None - оставить как есть)."""
+    controller = CONCURRENCY_CONTROLLERS[marketplace]
+    if slow_seconds is not None:
+        controller.slow_seconds = slow_seconds
+    controller.reset(min_limit if min_limit is not None else controller.min_limit,
+                     max_limit if max_limit is not None else controller.max_limit)
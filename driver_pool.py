@@ -0,0 +1,155 @@
+# driver_pool.py - ПУЛ ПЕРЕИСПОЛЬЗУЕМЫХ БРАУЗЕРОВ
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPool:
+    """
+    Пул драйверов, живущий всё время парсинга тендера.
+
+    Браузеры создаются лениво через factory (не больше size штук),
+    выдаются через acquire()/borrow() и возвращаются в пул вместе с сессией
+    и cookies. Сломанные драйверы закрываются через finalizer и при следующем
+    запросе заменяются новыми.
+
+    health_check(driver) возвращает причину перезапуска (память, число страниц,
+    ошибки подряд) или None - такой драйвер тоже закрывается и заменяется.
+
+    Ожидающие acquire() просыпаются и при возврате драйвера, и при освобождении
+    места (закрытие сломанного драйвера) - тогда создаётся новый браузер.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int = 1,
+                 finalizer: Optional[Callable[[Any], None]] = None,
+                 health_check: Optional[Callable[[Any], Optional[str]]] = None):
+        self.factory = factory
+        self.finalizer = finalizer
+        self.health_check = health_check
+        self.size = max(1, int(size or 1))
+        self.recycled = 0
+
+        # Свободные драйверы: последний возвращённый выдаётся первым
+        self._idle: List[Any] = []
+        self._all: List[Any] = []
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Берёт свободный драйвер из пула или создаёт новый, если лимит не исчерпан.
+        Иначе ждёт возврата драйвера или освобождения места; по истечении
+        timeout - queue.Empty.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Пул драйверов уже закрыт")
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._all) < self.size:
+                    # Резервируем место до создания, чтобы не превысить size из разных потоков
+                    self._all.append(None)
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._available.wait(remaining)
+
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._available:
+                self._all.remove(None)
+                self._available.notify()
+            raise
+        with self._lock:
+            self._all[self._all.index(None)] = driver
+            created = len(self._all)
+        logger.info(f"🧩 Пул драйверов: создан браузер {created}/{self.size}")
+        return driver
+
+    def release(self, driver, discard: bool = False) -> None:
+        """Возвращает драйвер в пул. discard=True - закрыть и забыть драйвер."""
+        if driver is None:
+            return
+
+        if discard or self._closed:
+            self._dispose(driver)
+            return
+
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None):
+        """Контекстный менеджер: драйвер возвращается в пул даже при ошибке."""
+        driver = self.acquire(timeout=timeout)
+        try:
+            yield driver
+        finally:
+            reason = self.recycle_reason(driver)
+            if reason:
+                self.recycled += 1
+                logger.info(f"♻️ Пул драйверов: браузер заменяется новым ({reason})")
+            self.release(driver, discard=bool(reason))
+
+    def recycle_reason(self, driver) -> Optional[str]:
+        """Причина закрыть драйвер вместо возврата в пул."""
+        if not is_driver_alive(driver):
+            return "браузер не отвечает"
+        if self.health_check is None:
+            return None
+        try:
+            return self.health_check(driver)
+        except Exception as e:
+            logger.debug(f"Проверка состояния драйвера не удалась: {e}")
+            return None
+
+    def close(self) -> None:
+        """Закрывает все браузеры пула."""
+        with self._available:
+            self._closed = True
+            drivers = [d for d in self._all if d is not None]
+            self._idle.clear()
+            self._available.notify_all()
+
+        for driver in drivers:
+            self._dispose(driver)
+
+    def _dispose(self, driver) -> None:
+        with self._available:
+            if driver in self._all:
+                self._all.remove(driver)
+                # Место освободилось - ожидающий acquire() создаст новый браузер
+                self._available.notify()
+        if self.finalizer:
+            try:
+                self.finalizer(driver)
+            except Exception as e:
+                logger.warning(f"Ошибка закрытия драйвера пула: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def is_driver_alive(driver) -> bool:
+    """Проверяет, отвечает ли браузер на команды WebDriver."""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,92 @@
+# driver_watchdog.py - ПЕРЕЗАПУСК БРАУЗЕРОВ ПО ПАМЯТИ, СТРАНИЦАМ И ОШИБКАМ
+
+import logging
+from typing import Optional
+
+from profile_reaper import collect_driver_pids
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # без psutil проверяются только счётчики страниц и ошибок
+    psutil = None
+
+
+class RecyclePolicy:
+    """
+    Когда браузер пула пора заменить новым.
+
+    max_rss_mb - суммарная память дерева процессов (msedgedriver + Edge);
+    max_pages - сколько страниц браузер открыл с момента запуска;
+    max_consecutive_errors - сколько товаров подряд закончились ошибкой.
+    0 или None отключает соответствующую проверку.
+    """
+
+    def __init__(self, max_rss_mb: Optional[float] = 1500, max_pages: Optional[int] = 300,
+                 max_consecutive_errors: Optional[int] = 3):
+        self.max_rss_mb = max_rss_mb
+        self.max_pages = max_pages
+        self.max_consecutive_errors = max_consecutive_errors
+
+
+RECYCLE_POLICY = RecyclePolicy()
+
+
+def configure_recycling(max_rss_mb: Optional[float] = None, max_pages: Optional[int] = None,
+                        max_consecutive_errors: Optional[int] = None) -> None:
+    """Меняет пороги перезапуска (None - оставить как есть, 0 - отключить)."""
+    if max_rss_mb is not None:
+        RECYCLE_POLICY.max_rss_mb = max_rss_mb
+    if max_pages is not None:
+        RECYCLE_POLICY.max_pages = max_pages
+    if max_consecutive_errors is not None:
+        RECYCLE_POLICY.max_consecutive_errors = max_consecutive_errors
+
+
+def process_tree_rss(driver) -> Optional[int]:
+    """RSS (байт) msedgedriver и всех процессов браузера под ним. None - измерить нельзя."""
+    if psutil is None:
+        return None
+
+    total = 0
+    for pid in collect_driver_pids(driver):
+        try:
+            total += psutil.Process(pid).memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total or None
+
+
+def note_page(driver, count: int = 1) -> None:
+    """Учитывает открытые браузером страницы."""
+    driver.pages_loaded = getattr(driver, "pages_loaded", 0) + count
+
+
+def note_result(driver, ok: bool) -> None:
+    """Учитывает результат товара: ошибки подряд сбрасываются первым успехом."""
+    driver.consecutive_errors = 0 if ok else getattr(driver, "consecutive_errors", 0) + 1
+
+
+def recycle_reason(driver, policy: Optional[RecyclePolicy] = None) -> Optional[str]:
+    """Причина вывести браузер из работы или None, если он ещё в норме."""
+    policy = policy or RECYCLE_POLICY
+
+    # Профиль, на котором маркетплейс показал капчу, дальше не используем
+    if getattr(driver, "blocked", False):
+        return "капча/блокировка, нужен свежий профиль"
+
+    errors = getattr(driver, "consecutive_errors", 0)
+    if policy.max_consecutive_errors and errors >= policy.max_consecutive_errors:
+        return f"ошибок подряд: {errors}"
+
+    pages = getattr(driver, "pages_loaded", 0)
+    if policy.max_pages and pages >= policy.max_pages:
+        return f"открыто страниц: {pages}"
+
+    if policy.max_rss_mb:
+        rss = process_tree_rss(driver)
+        if rss is not None and rss >= policy.max_rss_mb * 1024 * 1024:
+            return f"память {rss // (1024 * 1024)} МБ (лимит {int(policy.max_rss_mb)} МБ)"
+
+    return None
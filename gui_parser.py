@@ -3,39 +3,22 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import queue
 import pandas as pd
 import os
-import time
 from datetime import datetime
 
 try:
-    from tender_parser import get_prices as get_prices_yandex
+    from tender_parser import get_prices as get_prices_yandex, create_market_driver, close_market_driver
     from ozon_parser import get_prices as get_prices_ozon
     from utils import extract_products_from_excel, save_results_into_tender_format
+    from run_journal import STATUS_BLOCKED, RunJournal, journal_path_for, restored_rows, tender_fingerprint
+    from block_guard import BLOCKED_MARK
+    from price_cache import MISS_BLOCKED, PRICE_CACHE
 except ImportError as e:
     print(f"Ошибка импорта: {e}")
     exit(1)
 
-def kill_all_edge_processes():
-    """Принудительно убивает все процессы Edge"""
-    try:
-        import psutil
-        killed = 0
-        for proc in psutil.process_iter(['pid', 'name']):
-            try:
-                if proc.info['name'] and 'msedge' in proc.info['name'].lower():
-                    proc.kill()
-                    killed += 1
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
-        if killed > 0:
-            print(f"🔪 Убито {killed} процессов Edge")
-            time.sleep(2)
-        return killed
-    except ImportError:
-        print("⚠️ psutil не установлен, пропускаем убийство процессов")
-        return 0
-
 class ParserGUI:
     def __init__(self, root):
         self.root = root
@@ -49,14 +32,21 @@ class ParserGUI:
         self.output_dir = tk.StringVar(value="./")
         self.headless_mode = tk.BooleanVar(value=False)
         self.marketplace = tk.StringVar(value="yandex")  # yandex, ozon, both
+        self.resume = tk.BooleanVar(value=False)
         
         # Данные
         self.products_list = []
         self.yandex_results = {}
         self.ozon_results = {}
         self.is_parsing = False
+        # Настройки прогона, снятые с виджетов в главном потоке
+        self.settings = {}
+        # Tk работает только из главного потока: воркеры кладут строки лога
+        # и вызовы интерфейса в очередь, главный поток разбирает её через after()
+        self.ui_queue = queue.Queue()
         
         self.create_ui()
+        self.drain_ui_queue()
     
     def create_ui(self):
         # ==================== ВХОДНОЙ ФАЙЛ ====================
@@ -85,6 +75,8 @@ class ParserGUI:
         
  #       ttk.Checkbutton(settings_frame, text="Headless режим (без окна браузера)",
  #                      variable=self.headless_mode).pack(anchor=tk.W)
+        ttk.Checkbutton(settings_frame, text="Продолжить прерванный прогон (готовые строки из журнала)",
+                        variable=self.resume).pack(anchor=tk.W)
         
          # Маркетплейс
         mp_frame = ttk.LabelFrame(self.root, text="Маркетплейс", padding=10)
@@ -94,7 +86,7 @@ class ParserGUI:
                        variable=self.marketplace, value="yandex").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(mp_frame, text="Ozon",
                        variable=self.marketplace, value="ozon").pack(side=tk.LEFT, padx=5)
-        ttk.Radiobutton(mp_frame, text="Оба (последовательно)",
+        ttk.Radiobutton(mp_frame, text="Оба (параллельно)",
                        variable=self.marketplace, value="both").pack(side=tk.LEFT, padx=5)
 
         # ==================== КНОПКИ ====================
@@ -106,7 +98,7 @@ class ParserGUI:
         self.start_btn.pack(side=tk.LEFT, padx=5)
         
         ttk.Button(btn_frame, text="💾 Сохранить вручную", 
-                  command=self.save_results).pack(side=tk.LEFT, padx=5)
+                  command=self.save_clicked).pack(side=tk.LEFT, padx=5)
         
         # ==================== ЛОГ ====================
         log_frame = ttk.LabelFrame(self.root, text="Лог парсинга", padding=5)
@@ -126,9 +118,24 @@ class ParserGUI:
             self.output_dir.set(d)
     
     def log_msg(self, msg):
-        self.log.insert(tk.END, f"{msg}\n")
-        self.log.see(tk.END)
-        self.root.update()
+        self.ui_queue.put(msg)
+    
+    def call_in_ui(self, func, *args):
+        self.ui_queue.put((func, args))
+    
+    def drain_ui_queue(self):
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                if isinstance(item, tuple):
+                    func, args = item
+                    func(*args)
+                else:
+                    self.log.insert(tk.END, f"{item}\n")
+                    self.log.see(tk.END)
+        except queue.Empty:
+            pass
+        self.root.after(100, self.drain_ui_queue)
     
     def start_parsing(self):
         if self.is_parsing:
@@ -144,6 +151,13 @@ class ParserGUI:
         self.yandex_results.clear()
         self.ozon_results.clear()
         self.log.delete(1.0, tk.END)
+        self.settings = {
+            "input_file": self.input_file.get(),
+            "output_path": os.path.join(self.output_dir.get(), self.output_file.get()),
+            "mode": self.marketplace.get(),
+            "headless": self.headless_mode.get(),
+            "resume": self.resume.get(),
+        }
         
         thread = threading.Thread(target=self.parse_worker, daemon=True)
         thread.start()
@@ -151,62 +165,27 @@ class ParserGUI:
     def parse_worker(self):
         try:
             # Читаем товары
-            df = extract_products_from_excel(self.input_file.get())
+            df = extract_products_from_excel(self.settings["input_file"])
             self.products_list = df["name"].tolist()
             self.log_msg(f"✅ Найдено {len(self.products_list)} товаров\n")
             
-            mode = self.marketplace.get()
-            headless = self.headless_mode.get()
+            mode = self.settings["mode"]
+            headless = self.settings["headless"]
+            resume = self.settings["resume"]
             
-            # Парсим каждый товар
-            for i, name in enumerate(self.products_list, 1):
-                self.log_msg(f"[{i}/{len(self.products_list)}] {name[:50]}...")
-                
-                # Яндекс Маркет
-                if mode in ["yandex", "both"]:
-                    self.log_msg("  🔍 Яндекс Маркет...")
-                    try:
-                        result = get_prices_yandex(name, headless=headless, timeout=20, use_business_auth=True)
-                        self.yandex_results[i] = {
-                            "цена": result.get("цена", ""),
-                            "цена для юрлиц": result.get("цена для юрлиц", ""),
-                            "ссылка": result.get("ссылка", "")
-                        }
-                        
-                        if result.get("цена"):
-                            self.log_msg(f"  ✅ {result['цена']}")
-                        else:
-                            self.log_msg("  ❌ Не найдено")
-                    except Exception as e:
-                        self.log_msg(f"  ❌ Ошибка: {e}")
-                        self.yandex_results[i] = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
-                
-                # Убиваем Edge процессы перед Ozon
-                if mode == "both":
-                    self.log_msg("  🔪 Очистка Edge процессов...")
-                    kill_all_edge_processes()
-                    time.sleep(2)
-                
-                # Ozon
-                if mode in ["ozon", "both"]:
-                    self.log_msg("  🔍 Ozon...")
-                    try:
-                        result = get_prices_ozon(name, headless, None, 20)
-                        self.ozon_results[i] = {
-                            "цена": result.get("цена", ""),
-                            "цена для юрлиц": result.get("цена для юрлиц", ""),
-                            "ссылка": result.get("ссылка", "")
-                        }
-                        
-                        if result.get("цена"):
-                            self.log_msg(f"  ✅ {result['цена']}")
-                        else:
-                            self.log_msg("  ❌ Не найдено")
-                    except Exception as e:
-                        self.log_msg(f"  ❌ Ошибка: {e}")
-                        self.ozon_results[i] = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
-                
-                self.log_msg("")
+            # Каждый маркетплейс - отдельный поток со своим браузером;
+            # в режиме "both" они идут одновременно, время ~ max(Яндекс, Ozon)
+            workers = []
+            if mode in ["yandex", "both"]:
+                workers.append(threading.Thread(target=self.yandex_worker, args=(headless, resume),
+                                                name="gui-yandex", daemon=True))
+            if mode in ["ozon", "both"]:
+                workers.append(threading.Thread(target=self.ozon_worker, args=(headless, resume),
+                                                name="gui-ozon", daemon=True))
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
             
             self.log_msg("\n✅ Парсинг завершён!")
             self.save_results()
@@ -217,27 +196,107 @@ class ParserGUI:
             traceback.print_exc()
         finally:
             self.is_parsing = False
-            self.start_btn.config(state=tk.NORMAL)
-            
-            # Финальная очистка всех Edge процессов
-#            kill_all_edge_processes()
+            self.call_in_ui(self.start_btn.config, {"state": tk.NORMAL})
+    
+    def yandex_worker(self, headless, resume=False):
+        """Все товары на Яндекс Маркете в одном браузере (сессия и cookies переиспользуются)."""
+        state = {"driver": None}
+        
+        def start_driver():
+            try:
+                state["driver"] = create_market_driver(headless=headless, use_business_auth=True)
+            except Exception as e:
+                state["driver"] = None
+                self.log_msg(f"  ❌ Яндекс Маркет: браузер не запущен ({e}), каждый товар - в своём браузере")
+        
+        def fetch(name):
+            result = get_prices_yandex(name, headless=headless, timeout=20,
+                                       use_business_auth=True, driver=state["driver"])
+            # На профиле показали капчу - дальше работаем со свежим браузером
+            if getattr(state["driver"], "blocked", False):
+                self.log_msg("  🔄 Яндекс Маркет: капча, перезапускаю браузер со свежим профилем")
+                close_market_driver(state["driver"])
+                start_driver()
+            return result
+        
+        start_driver()
+        try:
+            self.run_marketplace("Яндекс Маркет", "yandex", self.yandex_results, fetch, resume)
+        finally:
+            if state["driver"] is not None:
+                close_market_driver(state["driver"])
+    
+    def ozon_worker(self, headless, resume=False):
+        self.run_marketplace("Ozon", "ozon", self.ozon_results,
+                             lambda name: get_prices_ozon(name, headless, None, 20),
+                             resume)
+    
+    def run_marketplace(self, title, marketplace, results, fetch, resume=False):
+        total = len(self.products_list)
+        # Журнал готовых строк: после падения или закрытия окна можно продолжить
+        journal = RunJournal(journal_path_for(self.settings["input_file"], marketplace),
+                             tender_fingerprint(self.products_list))
+        if resume:
+            names = {i: name for i, name in enumerate(self.products_list, 1)}
+            results.update(restored_rows(journal, names))
+            self.log_msg(f"⏯️ {title}: из журнала восстановлено строк {len(results)} из {total}")
+        journal.open(resume=resume)
+        try:
+            self.parse_rows(title, marketplace, results, fetch, journal)
+        finally:
+            journal.close()
+    
+    def parse_rows(self, title, marketplace, results, fetch, journal):
+        total = len(self.products_list)
+        for i, name in enumerate(self.products_list, 1):
+            if i in results:
+                continue
+            try:
+                result = fetch(name)
+                results[i] = {
+                    "цена": result.get("цена", ""),
+                    "цена для юрлиц": result.get("цена для юрлиц", ""),
+                    "ссылка": result.get("ссылка", "")
+                }
+                
+                if not any(results[i].values()) and PRICE_CACHE.get_miss(marketplace, name) == MISS_BLOCKED:
+                    # Пустой ответ из-за капчи - отмечаем строку, повторится при продолжении прогона
+                    # Вместо цены в сохранённый файл пишется отметка блокировки
+                    results[i]["статус"] = BLOCKED_MARK
+                    journal.record(i, name, results[i], status=STATUS_BLOCKED)
+                    self.log_msg(f"[{title} {i}/{total}] {name[:50]}... 🚧 Блокировка")
+                    continue
+                journal.record(i, name, results[i])
+                
+                if result.get("цена"):
+                    self.log_msg(f"[{title} {i}/{total}] {name[:50]}... ✅ {result['цена']}")
+                else:
+                    self.log_msg(f"[{title} {i}/{total}] {name[:50]}... ❌ Не найдено")
+            except Exception as e:
+                self.log_msg(f"[{title} {i}/{total}] {name[:50]}... ❌ Ошибка: {e}")
+                results[i] = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+                journal.record(i, name, None)
+    
+    def save_clicked(self):
+        # Кнопка - главный поток: путь вывода берём с виджетов заново
+        if self.settings:
+            self.settings["output_path"] = os.path.join(self.output_dir.get(), self.output_file.get())
+        self.save_results()
     
     def save_results(self):
         if not self.products_list:
-            messagebox.showwarning("Внимание", "Нет данных для сохранения")
+            self.call_in_ui(messagebox.showwarning, "Внимание", "Нет данных для сохранения")
             return
         
         try:
             self.log_msg("\n💾 Сохранение результатов...")
             
             # Конечный путь файла
-            output_dir = self.output_dir.get()
-            output_filename = self.output_file.get()
-            output_path = os.path.join(output_dir, output_filename)
+            output_path = self.settings["output_path"]
             
             self.log_msg(f"📁 Путь вывода: {output_path}")
             
-            mode = self.marketplace.get()
+            mode = self.settings["mode"]
             
             # Сохраняем Яндекс Маркет
             if mode in ["yandex", "both"] and self.yandex_results:
@@ -248,14 +307,15 @@ class ParserGUI:
                         "наименование": name,
                         "цена": res["цена"],
                         "цена для юрлиц": res["цена для юрлиц"],
-                        "ссылка": res["ссылка"]
+                        "ссылка": res["ссылка"],
+                        "статус": res.get("статус", "")
                     })
                 
                 df_y = pd.DataFrame(y_data)
                 
                 # Используем НОВЫЙ utils с расчётом разницы
                 save_results_into_tender_format(
-                    self.input_file.get(),
+                    self.settings["input_file"],
                     output_path,
                     df_y,
                     column_name="Яндекс Маркет"
@@ -272,14 +332,15 @@ class ParserGUI:
                         "наименование": name,
                         "цена": res["цена"],
                         "цена для юрлиц": res["цена для юрлиц"],
-                        "ссылка": res["ссылка"]
+                        "ссылка": res["ссылка"],
+                        "статус": res.get("статус", "")
                     })
                 
                 df_o = pd.DataFrame(o_data)
                 
                 # Используем НОВЫЙ utils с расчётом разницы
                 save_results_into_tender_format(
-                    self.input_file.get(),
+                    self.settings["input_file"],
                     output_path,
                     df_o,
                     column_name="Ozon"
@@ -288,7 +349,7 @@ class ParserGUI:
                 self.log_msg("✅ Колонка 'Ozon' + 'Разница' сохранена")
             
             self.log_msg(f"\n🎉 Файл сохранён: {output_path}")
-            messagebox.showinfo("Успех", f"Результаты сохранены!\n\n{output_path}")
+            self.call_in_ui(messagebox.showinfo, "Успех", f"Результаты сохранены!\n\n{output_path}")
             
         except Exception as e:
             self.log_msg(f"\n❌ Ошибка сохранения: {e}")
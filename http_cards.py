@@ -0,0 +1,159 @@
+# http_cards.py - ЛЁГКАЯ ЗАГРУЗКА КАРТОЧЕК ПО HTTP С СЕССИЕЙ БРАУЗЕРА
+
+import json
+import logging
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cdp_prices import card_ids_from_url, prices_disagree, prices_from_payloads
+from rate_limiter import throttle
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = 10
+ANTIBOT_MARKERS = ("showcaptcha", "smartcaptcha", "checkcaptcha", "Вы не робот", "Подтвердите, что запросы")
+JSON_SCRIPT_TYPES = ("application/ld+json", "application/json")
+
+
+def session_from_driver(driver) -> requests.Session:
+    """
+    requests.Session с cookies и User-Agent браузера. Создаётся один раз
+    на драйвер и переиспользуется (пул соединений keep-alive).
+    """
+    session = getattr(driver, "http_session", None)
+    if session is not None:
+        return session
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    try:
+        user_agent = driver.execute_script("return navigator.userAgent;")
+        if user_agent:
+            session.headers["User-Agent"] = user_agent.replace("HeadlessChrome", "Chrome")
+    except Exception:
+        pass
+    session.headers["Accept-Language"] = "ru-RU,ru;q=0.9"
+
+    try:
+        for cookie in driver.get_cookies():
+            session.cookies.set(cookie["name"], cookie["value"],
+                                domain=cookie.get("domain"), path=cookie.get("path", "/"))
+    except Exception as e:
+        logger.debug(f"Не удалось перенести cookies в HTTP-сессию: {e}")
+
+    driver.http_session = session
+    return session
+
+
+class _CardHTMLParser(HTMLParser):
+    """Собирает JSON из <script> и текст span.ds-valueLine за один проход."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_blobs: List[str] = []
+        self.value_lines: List[str] = []
+        self._script_buffer: Optional[List[str]] = None
+        self._value_depth = 0
+        self._value_buffer: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "script" and attrs.get("type") in JSON_SCRIPT_TYPES:
+            self._script_buffer = []
+        elif tag == "span":
+            if self._value_depth:
+                self._value_depth += 1
+            elif "ds-valueLine" in (attrs.get("class") or "").split():
+                self._value_depth = 1
+                self._value_buffer = []
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._script_buffer is not None:
+            self.json_blobs.append("".join(self._script_buffer))
+            self._script_buffer = None
+        elif tag == "span" and self._value_depth:
+            self._value_depth -= 1
+            if not self._value_depth:
+                text = re.sub(r"\s+", " ", "".join(self._value_buffer)).strip()
+                if text:
+                    self.value_lines.append(text)
+
+    def handle_data(self, data):
+        if self._script_buffer is not None:
+            self._script_buffer.append(data)
+        elif self._value_depth:
+            self._value_buffer.append(data)
+
+
+def looks_like_captcha_url(url: str) -> bool:
+    """Редирект на страницу капчи Яндекса."""
+    return any(marker in str(url or "") for marker in ANTIBOT_MARKERS[:3])
+
+
+def looks_like_antibot(response: requests.Response) -> bool:
+    if response.status_code in (403, 429):
+        return True
+    if looks_like_captcha_url(response.url):
+        return True
+    head = response.text[:20000]
+    return any(marker in head for marker in ANTIBOT_MARKERS)
+
+
+def parse_card_html(html: str, url: str = "") -> Dict[str, str]:
+    """
+    Цены из HTML карточки: встроенный JSON (только объекты с id карточки из url),
+    сверенный с первым span.ds-valueLine; при расхождении верится вёрстке.
+    """
+    parser = _CardHTMLParser()
+    try:
+        parser.feed(html)
+    except Exception as e:
+        logger.debug(f"Ошибка разбора HTML карточки: {e}")
+
+    payloads: List[Any] = []
+    for blob in parser.json_blobs:
+        try:
+            payloads.append(json.loads(blob))
+        except ValueError:
+            continue
+
+    prices = prices_from_payloads(payloads, card_ids_from_url(url))
+    if parser.value_lines and (not prices['обычная цена']
+                               or prices_disagree(prices['обычная цена'], parser.value_lines[0])):
+        prices['обычная цена'] = parser.value_lines[0]
+    return prices
+
+
+def fetch_card_prices(driver, url: str, timeout: float = HTTP_TIMEOUT) -> Optional[Dict[str, str]]:
+    """
+    Загружает карточку обычным HTTP-запросом с cookies браузера.
+    None - нужен браузер (ошибка, антибот или в ответе нет цены; в сессии
+    с авторизацией юрлица - нет цены для юрлиц).
+    """
+    session = session_from_driver(driver)
+    try:
+        with throttle(url):
+            response = session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        logger.debug(f"HTTP-загрузка карточки не удалась: {e}")
+        return None
+
+    if response.status_code != 200 or looks_like_antibot(response):
+        logger.info(f"     HTTP: ответ {response.status_code} (ошибка или антибот), открываю в браузере")
+        return None
+
+    prices = parse_card_html(response.text, url)
+    if not prices.get('обычная цена'):
+        return None
+    # В авторизованной сессии нужна и цена для юрлиц; без неё карточку снимает браузер
+    if getattr(driver, "business_auth", False) and not prices.get('цена для юрлиц'):
+        logger.info("     HTTP: в ответе нет цены для юрлиц, открываю в браузере")
+        return None
+    return prices
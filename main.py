@@ -10,6 +10,13 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from tender_parser import parse_tender_excel
 from utils import extract_products_from_excel
+from resource_blocking import BLOCKING_POLICIES, set_blocking_enabled
+from driver_watchdog import configure_recycling
+from price_cache import configure_price_cache
+from candidate_budget import configure_candidate_budget
+from rate_limiter import configure_rate_limit
+from block_guard import BLOCKED_MARK, configure_circuit_breaker
+from concurrency_controller import configure_concurrency
 
 def show_banner():
     banner = f"""
@@ -79,6 +86,74 @@ def main():
     parser.add_argument("-o", "--output", default="auto")
     parser.add_argument("--gui", action="store_true", help="Запустить графический интерфейс")
     parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--pool-size", type=int, default=1,
+                        help="Сколько браузеров держать открытыми на весь прогон")
+    parser.add_argument("--parallel-tabs", action="store_true",
+                        help="Открывать карточки товара одновременно во вкладках")
+    parser.add_argument("--no-block-resources", action="store_true",
+                        help="Не блокировать картинки/шрифты/видео/трекеры в браузере")
+    parser.add_argument("--report-blocking", action="store_true",
+                        help="Писать в лог экономию трафика по каждой карточке")
+    parser.add_argument("--price-engine", choices=["dom", "cdp"], default="dom",
+                        help="Откуда брать цены карточки: разметка (dom) или сетевые ответы (cdp)")
+    parser.add_argument("--http-cards", action="store_true",
+                        help="Грузить карточки по HTTP с cookies браузера (браузер - только fallback)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Продолжить прерванный прогон: готовые строки берутся из журнала, парсятся остальные")
+    parser.add_argument("--snippet-prices", action="store_true",
+                        help="Брать цены из сниппетов выдачи без захода в карточки (не работает с --auth)")
+    parser.add_argument("--no-card-budget", action="store_true",
+                        help="Открывать все равные по релевантности карточки, даже при явном лидере")
+    parser.add_argument("--dominance-gap", type=int, default=None,
+                        help="Во сколько баллов лидер должен опережать остальных, чтобы открыть только его (по умолчанию 2)")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="Переходов в секунду на Яндекс Маркет на все браузеры вместе (по умолчанию 2, 0 - без лимита)")
+    parser.add_argument("--rate-burst", type=int, default=None,
+                        help="Сколько переходов подряд можно без паузы после простоя (по умолчанию 4)")
+    parser.add_argument("--rate-jitter", type=float, default=None,
+                        help="Случайная добавка к паузе между переходами, с (по умолчанию 0.3)")
+    parser.add_argument("--host-concurrency", type=int, default=None,
+                        help="Сколько страниц маркета грузится одновременно (по умолчанию 6, 0 - без лимита)")
+    parser.add_argument("--block-threshold", type=int, default=None,
+                        help="После скольких блокировок подряд ставить маркет на паузу (по умолчанию 2)")
+    parser.add_argument("--block-cooldown", type=float, default=None,
+                        help="Первая пауза после блокировки, с; каждая следующая вдвое дольше (по умолчанию 60)")
+    parser.add_argument("--fixed-workers", action="store_true",
+                        help="Всегда держать --workers браузеров в работе, без адаптивной параллельности")
+    parser.add_argument("--min-workers", type=int, default=1,
+                        help="Нижняя граница адаптивной параллельности (верхняя - --workers)")
+    parser.add_argument("--slow-item-seconds", type=float, default=None,
+                        help="Товар дольше N с считается зависанием и снижает параллельность (по умолчанию 90)")
+    parser.add_argument("--max-browser-rss", type=int, default=None,
+                        help="Перезапускать браузер, если его процессы заняли больше N МБ (0 - без лимита)")
+    parser.add_argument("--max-browser-pages", type=int, default=None,
+                        help="Перезапускать браузер после N открытых страниц (0 - без лимита)")
+    parser.add_argument("--max-browser-errors", type=int, default=None,
+                        help="Перезапускать браузер после N ошибок подряд (0 - без лимита)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Не использовать кэш цен прошлых запусков")
+    parser.add_argument("--cache-ttl", type=float, default=None,
+                        help="Сколько часов цены из кэша считаются актуальными (по умолчанию 24)")
+    parser.add_argument("--search-cache-ttl", type=float, default=None,
+                        help="Сколько часов хранить результаты поиска (по умолчанию 72)")
+    parser.add_argument("--card-cache-ttl", type=float, default=None,
+                        help="Сколько часов хранить цены отдельных карточек (по умолчанию 2)")
+    parser.add_argument("--not-found-ttl", type=float, default=None,
+                        help="Сколько часов не искать повторно ненайденный товар (по умолчанию 6)")
+    parser.add_argument("--blocked-ttl", type=float, default=None,
+                        help="Сколько часов не повторять товар после блокировки маркетплейса (по умолчанию 0.5)")
+    parser.add_argument("--cache-path", default=None,
+                        help="Файл SQLite кэша цен (по умолчанию рядом с программой)")
+    parser.add_argument("--scheduler", choices=["rows", "pipeline"], default="rows",
+                        help="rows - воркер ведёт товар целиком; pipeline - отдельные воркеры поиска и карточек")
+    parser.add_argument("--search-workers", type=int, default=1,
+                        help="Браузеров на этапе поиска (--scheduler pipeline)")
+    parser.add_argument("--card-workers", type=int, default=2,
+                        help="Браузеров на этапе карточек (--scheduler pipeline)")
+    parser.add_argument("--engine", choices=["selenium", "async"], default="selenium",
+                        help="selenium - потоки и пул браузеров; async - один браузер, вкладки из одного event loop")
+    parser.add_argument("--max-pages", type=int, default=8,
+                        help="Сколько вкладок одновременно открывает движок async")
     parser.add_argument("--no-headless", action="store_true")
     parser.add_argument("--driver-path", default=None)
     parser.add_argument("--auth", action="store_true")
@@ -87,6 +162,20 @@ def main():
 
     args = parser.parse_args()
     use_business_auth = args.auth
+
+    for marketplace in BLOCKING_POLICIES:
+        set_blocking_enabled(marketplace, not args.no_block_resources)
+        BLOCKING_POLICIES[marketplace].report = args.report_blocking
+    configure_recycling(max_rss_mb=args.max_browser_rss, max_pages=args.max_browser_pages,
+                        max_consecutive_errors=args.max_browser_errors)
+    configure_price_cache(enabled=not args.no_cache, ttl_hours=args.cache_ttl, path=args.cache_path,
+                          search_ttl_hours=args.search_cache_ttl, card_ttl_hours=args.card_cache_ttl,
+                          not_found_ttl_hours=args.not_found_ttl, blocked_ttl_hours=args.blocked_ttl)
+    configure_candidate_budget(enabled=not args.no_card_budget, dominance_gap=args.dominance_gap)
+    configure_concurrency("yandex", slow_seconds=args.slow_item_seconds)
+    configure_circuit_breaker("yandex", threshold=args.block_threshold, cooldown=args.block_cooldown)
+    configure_rate_limit("yandex", rate=args.rate_limit, burst=args.rate_burst, jitter=args.rate_jitter,
+                         max_concurrent=args.host_concurrency)
     
     print("🔍 Проверяю зависимости...")
     
@@ -162,6 +251,7 @@ def main():
         
         print(f"\n⚙️ Настройки:")
         print(f"  🧵 Потоков: {args.workers}")
+        print(f"  🧩 Браузеров в пуле: {args.pool_size}")
         print(f"  👁️ Режим: {'скрытый' if headless else 'видимый'}")
         print(f"  🔐 Авторизация: {'да' if args.auth else 'нет'}")
         print(f"  💾 Автосохранение: {'да' if auto_save else 'нет'}")
@@ -177,7 +267,20 @@ def main():
             workers=args.workers,
             driver_path=args.driver_path,
             auto_save=auto_save,
-            use_business_auth=args.auth
+            use_business_auth=args.auth,
+            pool_size=args.pool_size,
+            parallel_tabs=args.parallel_tabs,
+            price_engine=args.price_engine,
+            http_cards=args.http_cards,
+            engine=args.engine,
+            max_pages=args.max_pages,
+            scheduler=args.scheduler,
+            search_workers=args.search_workers,
+            card_workers=args.card_workers,
+            snippet_prices=args.snippet_prices,
+            resume=args.resume,
+            adaptive_workers=not args.fixed_workers,
+            min_workers=args.min_workers
         )
         
         end_time = time.time()
@@ -185,12 +288,15 @@ def main():
         
         total = len(result_df)
         regular_count = len([r for r in result_df['цена'] if r and r != 'ОШИБКА'])
+        blocked_count = len([r for r in result_df.get('статус', []) if r == BLOCKED_MARK])
         
         print(f"\n🎉 Парсинг завершен!")
         print(f"⏱️ Время: {duration:.1f} сек")
         print(f"📊 Статистика:")
         print(f"  📦 Всего товаров: {total}")
         print(f"  💰 Обычных цен: {regular_count}")
+        if blocked_count:
+            print(f"  🚧 Заблокировано маркетом: {blocked_count} (повторить: --resume)")
         
         if args.auth:
             business_count = len([r for r in result_df.get('цена для юрлиц', []) if r and r != 'ОШИБКА'])
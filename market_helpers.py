@@ -1,10 +1,12 @@
 import re
-import time
 from typing import Callable, List, Optional, Sequence, Tuple
 
 import requests
 from selenium.webdriver.common.by import By
 
+from page_ready import wait_for_any_selector
+from rate_limiter import throttled_get
+
 SEARCH_URL_TEMPLATE = "https://market.yandex.ru/search?text={query}"
 SEARCH_INPUT_SELECTORS: List[str] = [
     "input[name=\"text\"]",
@@ -30,6 +32,54 @@ PRODUCT_LINK_SELECTORS: List[str] = [
     "span[role=\"link\"][data-auto=\"snippet-title\"]",
 ]
 
+# Явные отметки "ничего нет": только они дают право запомнить промах "товар не найден"
+EMPTY_RESULTS_SELECTORS: List[str] = [
+    "[data-auto=\"emptySearchResult\"]",
+    "[data-auto=\"empty-search\"]",
+    "[data-apiary-widget-name*=\"EmptySearch\"]",
+]
+EMPTY_RESULTS_MARKERS: List[str] = [
+    "Ничего не нашли",
+    "ничего не нашлось",
+    "ничего не найдено",
+    "Нет подходящих товаров",
+]
+CARD_UNAVAILABLE_SELECTORS: List[str] = [
+    "[data-auto=\"soldOut\"]",
+    "[data-auto=\"offer-unavailable\"]",
+]
+CARD_UNAVAILABLE_MARKERS: List[str] = [
+    "Нет в продаже",
+    "Товар закончился",
+    "Нет в наличии",
+]
+PAGE_MARKERS_JS = """
+const selectors = arguments[0] || [];
+for (const s of selectors) {
+    try { if (document.querySelector(s)) return true; } catch (e) {}
+}
+const text = document.body ? (document.body.innerText || '').slice(0, 5000) : '';
+return (arguments[1] || []).some((m) => text.includes(m));
+"""
+
+
+def page_has_markers(driver, selectors: Sequence[str], markers: Sequence[str]) -> bool:
+    """На странице есть один из узлов или текстов-отметок (ошибка проверки - нет)."""
+    try:
+        return bool(driver.execute_script(PAGE_MARKERS_JS, list(selectors), list(markers)))
+    except Exception:
+        return False
+
+
+def search_results_empty(driver) -> bool:
+    """Выдача явно сообщает, что по запросу ничего не найдено."""
+    return page_has_markers(driver, EMPTY_RESULTS_SELECTORS, EMPTY_RESULTS_MARKERS)
+
+
+def card_unavailable(driver) -> bool:
+    """Карточка явно сообщает, что товара нет в продаже."""
+    return page_has_markers(driver, CARD_UNAVAILABLE_SELECTORS, CARD_UNAVAILABLE_MARKERS)
+
 
 def normalize_search_term(search_term: str, max_len: int = 120) -> str:
     """Нормализует строку поиска перед вводом в маркет."""
@@ -45,8 +95,8 @@ def perform_direct_search_navigation(driver, search_term: str, log_warning: Opti
 
     try:
         encoded_query = requests.utils.quote(normalized)
-        driver.get(SEARCH_URL_TEMPLATE.format(query=encoded_query))
-        time.sleep(1.2)
+        throttled_get(driver, SEARCH_URL_TEMPLATE.format(query=encoded_query))
+        wait_for_any_selector(driver, PRODUCT_LINK_SELECTORS, stage="search")
         return "search" in (driver.current_url or "")
     except Exception as exc:
         if log_warning:
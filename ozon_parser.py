@@ -1,6 +1,5 @@
 # ozon_parser.py - С ПРАВИЛЬНЫМИ СЕЛЕКТОРАМИ И JS
 
-import time
 import logging
 import re
 import os
@@ -14,6 +13,12 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 
 from utils import get_browser_paths
+from resource_blocking import get_blocking_policy, log_blocked_requests
+from page_ready import configure_driver_waits, use_eager_loading, wait_for_any_selector
+from rate_limiter import throttled_get, wait_turn
+from block_guard import CIRCUIT_BREAKERS, detect_block, report_block
+from concurrency_controller import CONCURRENCY_CONTROLLERS, FetchFailed
+from price_cache import MISS_BLOCKED, MISS_NOT_FOUND, PRICE_CACHE, cached_card_prices, cached_miss, cached_prices, remember_miss
 
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -21,17 +26,34 @@ logger = logging.getLogger(__name__)
 
 STOP_PARSING = False
 
+OZON_SEARCH_INPUT_SELECTORS = ['input[name="text"]']
+OZON_CARD_PRICE_SELECTORS = [
+    'span.pdp_b7f.tsHeadline500Medium',
+    'div[data-widget="webPrice"]',
+    'span.tsHeadline500Medium',
+    'span.tsHeadline600Large',
+]
+
 
 def _normalize_ozon_query(product_name: str, max_len: int = 120) -> str:
     return re.sub(r"\s+", " ", str(product_name or "")).strip()[:max_len]
 
 
+def _score_ozon_relevance(query: str, title: str) -> int:
+    """Оценка релевантности карточки Ozon по пересечению токенов запроса и названия."""
+    query_tokens = {t for t in re.split(r"[^a-zA-Zа-яА-Я0-9]+", str(query).lower()) if len(t) >= 3}
+    title_tokens = {t for t in re.split(r"[^a-zA-Zа-яА-Я0-9]+", str(title).lower()) if len(t) >= 3}
+    if not query_tokens or not title_tokens:
+        return 0
+    return len(query_tokens & title_tokens)
+
+
 def _go_to_ozon_search(driver, query: str) -> bool:
     if not query:
         return False
     try:
         encoded_query = requests.utils.quote(query)
-        driver.get(f"https://www.ozon.ru/search/?text={encoded_query}")
+        throttled_get(driver, f"https://www.ozon.ru/search/?text={encoded_query}")
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, 'a[href*="/product/"]'))
         )
@@ -65,11 +87,17 @@ def create_ozon_edge_driver(headless: bool = False):
         "Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0"
     )
 
+    use_eager_loading(options)
+
+    blocking_policy = get_blocking_policy("ozon")
+    blocking_policy.apply_to_options(options)
+
     service = EdgeService(str(paths["driver"]))
 
     driver = webdriver.Edge(service=service, options=options)
     driver.set_page_load_timeout(30)
-    driver.implicitly_wait(5)
+    configure_driver_waits(driver)
+    blocking_policy.apply_to_driver(driver)
 
     return driver
 
@@ -181,6 +209,45 @@ def extract_prices_ozon(driver) -> Dict[str, str]:
         logger.warning(f"Ошибка извлечения цены: {e}")
         return result
 
+OZON_EMPTY_RESULTS_JS = """
+if (document.querySelector('[data-widget="searchResultsError"]')) return true;
+const text = document.body ? (document.body.innerText || '').slice(0, 3000) : '';
+return arguments[0].some((m) => text.includes(m));
+"""
+OZON_EMPTY_RESULTS_MARKERS = [
+    "По вашему запросу товаров сейчас нет",
+    "По вашему запросу ничего не найдено",
+    "ничего не нашлось",
+]
+
+
+def _ozon_results_empty(driver) -> bool:
+    """На странице есть явная отметка пустой выдачи (а не просто ничего не успело загрузиться)."""
+    try:
+        return bool(driver.execute_script(OZON_EMPTY_RESULTS_JS, OZON_EMPTY_RESULTS_MARKERS))
+    except Exception as e:
+        logger.debug(f"Проверка пустой выдачи Ozon не удалась: {e}")
+        return False
+
+
+def _remember_ozon_miss(driver, product_name: str, confirmed_not_found: bool = False) -> bool:
+    """
+    Пустой результат: капча/блокировка (пауза предохранителя) или товар не найден.
+    "Не найдено" записывается, только если выдача явно пуста или confirmed_not_found;
+    иначе (медленная страница, сбой) промах не кэшируется и возвращается False.
+    """
+    reason = detect_block(driver)
+    if reason:
+        logger.error(f"❌ Ozon блокирует: {reason}")
+        remember_miss("ozon", product_name, MISS_BLOCKED)
+        report_block("ozon", driver, reason)
+        return True
+    if confirmed_not_found or _ozon_results_empty(driver):
+        remember_miss("ozon", product_name, MISS_NOT_FOUND)
+        return True
+    return False
+
+
 def get_prices(product_name: str, headless: bool = True, driver_path: Optional[str] = None,
               timeout: int = 20, **kwargs) -> Dict[str, str]:
     """Получение цен с Ozon через undetected-chromedriver"""
@@ -190,6 +257,29 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
     if STOP_PARSING:
         return result
     
+    # Постоянный кэш прошлых запусков - до запуска браузера
+    cached = cached_prices("ozon", product_name)
+    if cached is not None:
+        return cached
+    if cached_miss("ozon", product_name):
+        return result
+    # Ozon блокирует - ждём конца паузы, а не поднимаем браузер впустую
+    if not CIRCUIT_BREAKERS["ozon"].wait(lambda: STOP_PARSING):
+        return result
+    
+    # Сколько браузеров Ozon работает одновременно, решает AIMD-контроллер
+    return CONCURRENCY_CONTROLLERS["ozon"].call(lambda: _get_prices_in_browser(product_name, headless),
+                                                product_name, should_stop=lambda: STOP_PARSING)
+
+
+def _get_prices_in_browser(product_name: str, headless: bool = True) -> Dict[str, str]:
+    """
+    Поиск и карточки Ozon в собственном браузере (кэш уже проверен в get_prices).
+    Сбой (браузер, поиск, ошибка страницы) поднимается как FetchFailed, а не
+    превращается в пустой результат - контроллер параллельности считает его ошибкой.
+    """
+    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+    
     try:
         # Пробуем импортировать undetected-chromedriver
         # try:
@@ -205,6 +295,8 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
         #     return result
         
         query = _normalize_ozon_query(product_name)
+        if not query:
+            return result
         logger.info(f"🔍 Поиск на Ozon: {query[:40]}...")
         
         # Создаём UNDETECTED браузер
@@ -215,29 +307,21 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
             logger.debug("✅ Undetected браузер создан")
         except Exception as e:
             logger.error(f"Ошибка создания браузера: {e}")
-            return result
+            raise FetchFailed(f"браузер не создан: {e}") from e
         
         try:
             # Переход на Ozon
             logger.debug("Переход на https://www.ozon.ru")
-            driver.get("https://www.ozon.ru")
-            time.sleep(3)
-            
-            # Проверяем что НЕ заблокировано
-            page_source = driver.page_source
-            current_url = driver.current_url
-            page_title = driver.title
-            
-            logger.debug(f"📍 URL: {current_url}")
-            logger.debug(f"📄 Title: {page_title}")
+            throttled_get(driver, "https://www.ozon.ru")
+            wait_for_any_selector(driver, OZON_SEARCH_INPUT_SELECTORS, stage="home")
             
-            # Проверяем на реальные ошибки
-            block_indicators = ["Доступ ограничен", "Access denied", "403 Forbidden", "419 Too Many Requests"]
-            
-            for indicator in block_indicators:
-                if indicator in page_source:
-                    logger.error(f"❌ Найден индикатор блокировки: {indicator}")
-                    return result
+            # Проверяем что НЕ заблокировано (короткая JS-проверка вместо всего page_source)
+            reason = detect_block(driver)
+            if reason:
+                logger.error(f"❌ Найден индикатор блокировки: {reason}")
+                remember_miss("ozon", product_name, MISS_BLOCKED)
+                report_block("ozon", driver, reason)
+                return result
             
             logger.debug("✅ Ozon не блокирует")
             
@@ -252,22 +336,21 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
             except Exception as e:
                 logger.error(f"❌ Поле поиска не найдено: {e}")
                 if not _go_to_ozon_search(driver, query):
-                    return result
+                    if _remember_ozon_miss(driver, product_name):
+                        return result
+                    raise FetchFailed("поиск Ozon не открылся")
                 search_input = None
             
             # Клик и ввод поиска (если нашли поле на главной)
             if search_input is not None:
                 logger.debug("Начинаю ввод поиска...")
                 search_input.click()
-                time.sleep(0.5)
                 search_input.clear()
-                time.sleep(0.3)
                 search_input.send_keys(query[:50])
                 logger.debug(f"✅ Введён текст: {query[:50]}")
-                time.sleep(0.5)
+                wait_turn("https://www.ozon.ru/search/")
                 search_input.send_keys(Keys.RETURN)
                 logger.debug("✅ Нажал Enter")
-                time.sleep(4)
             
             if STOP_PARSING:
                 return result
@@ -281,7 +364,10 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
                 logger.debug("✅ Результаты загрузились")
             except Exception as e:
                 logger.warning(f"❌ Результаты не загрузились: {e}")
-                return result
+                if _remember_ozon_miss(driver, product_name):
+                    return result
+                raise FetchFailed("результаты Ozon не загрузились")
+            CIRCUIT_BREAKERS["ozon"].record_success()
             
             # Находим товары (через JS, чтобы меньше ловить stale-элементы)
             candidates_data = driver.execute_script("""
@@ -315,37 +401,22 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
 
             if not candidates_data:
                 logger.warning("❌ Товары не найдены")
-                return result
+                if _remember_ozon_miss(driver, product_name):
+                    return result
+                raise FetchFailed("в выдаче Ozon нет товаров и нет отметки пустой выдачи")
             
-            logger.info(f"✅ Найдено товаров: {len(product_links)}")
+            logger.info(f"✅ Найдено товаров: {len(candidates_data)}")
             
-            # Собираем и ранжируем кандидатов по релевантности
-            candidates = []
-            seen = set()
-            for link in product_links[:40]:
-                try:
-                    url = link.get_attribute('href')
-                    if not url or '/product/' not in url:
-                        continue
-                    normalized_url = url.split('?')[0]
-                    if normalized_url in seen:
-                        continue
-
-                    title = (link.text or '').strip()
-                    if not title:
-                        title = (link.get_attribute('title') or '').strip()
-                    if not title:
-                        title = (link.get_attribute('aria-label') or '').strip()
-
-                    score = _score_ozon_relevance(query, title)
-                    candidates.append({
-                        'url': normalized_url,
-                        'title': title,
-                        'score': score,
-                    })
-                    seen.add(normalized_url)
-                except Exception:
-                    continue
+            # Ранжируем кандидатов по релевантности (ссылки уже без дублей и параметров)
+            candidates = [
+                {
+                    'url': item['url'],
+                    'title': item.get('title') or '',
+                    'score': _score_ozon_relevance(query, item.get('title') or ''),
+                }
+                for item in candidates_data[:40]
+                if item.get('url')
+            ]
 
             if not candidates:
                 logger.warning("❌ Не удалось сформировать список кандидатов")
@@ -371,11 +442,15 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
                 
                 try:
                     logger.debug(f"Товар {i}/{len(selected)}: {url[:50]}...")
-                    driver.get(url)
-                    time.sleep(1.5)
-                    
-                    # Извлекаем цену с НОВЫМИ селекторами
-                    prices = extract_prices_ozon(driver)
+                    prices = cached_card_prices(url, f"Ozon товар {i}: ")
+                    if prices is None:
+                        throttled_get(driver, url)
+                        wait_for_any_selector(driver, OZON_CARD_PRICE_SELECTORS, stage="card")
+                        
+                        # Извлекаем цену с НОВЫМИ селекторами
+                        prices = extract_prices_ozon(driver)
+                        PRICE_CACHE.put_card(url, prices)
+                        log_blocked_requests(driver, f"Ozon товар {i}: ")
                     
                     if prices['цена']:
                         price_clean = re.sub(r'[^\d]', '', prices['цена'])
@@ -404,8 +479,11 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
                     "ссылка": best['url']
                 }
                 logger.info(f"🎯 ЛУЧШАЯ: {best['price']}")
+                PRICE_CACHE.put("ozon", product_name, result)
             else:
                 logger.warning("⚠️ Цены не найдены ни на одном товаре")
+                if not STOP_PARSING:
+                    _remember_ozon_miss(driver, product_name, confirmed_not_found=True)
             
             return result
         
@@ -418,11 +496,13 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
                 except Exception as e:
                     logger.warning(f"⚠️ Ошибка при закрытии браузера: {e}")
     
+    except FetchFailed:
+        raise
     except Exception as e:
         logger.error(f"❌ Критическая ошибка: {e}")
         import traceback
         traceback.print_exc()
-        return result
+        raise FetchFailed(str(e)) from e
 
 if __name__ == "__main__":
     result = get_prices("Коммутатор", headless=False)
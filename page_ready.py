@@ -0,0 +1,90 @@
+# page_ready.py - ОЖИДАНИЕ ГОТОВНОСТИ СТРАНИЦЫ ПО СОБЫТИЯМ ВМЕСТО sleep
+
+import logging
+import time
+from typing import Dict, Sequence
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+logger = logging.getLogger(__name__)
+
+# Таймауты по этапам (сек). Ожидание заканчивается сразу, как только нужные узлы появились.
+READY_TIMEOUTS: Dict[str, float] = {
+    "home": 6,
+    "search": 8,
+    "card": 6,
+}
+SCRIPT_TIMEOUT = 30
+
+WAIT_FOR_SELECTORS_JS = """
+const selectors = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+
+const found = () => selectors.some((s) => {
+    try { return !!document.querySelector(s); } catch (e) { return false; }
+});
+if (found()) { done(true); return; }
+
+let finished = false;
+let timer = null;
+const observer = new MutationObserver(() => { if (found()) finish(true); });
+const finish = (value) => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    done(value);
+};
+observer.observe(document.documentElement || document, { childList: true, subtree: true });
+timer = setTimeout(() => finish(found()), timeoutMs);
+"""
+
+
+def use_eager_loading(options) -> None:
+    """driver.get() возвращается после DOMContentLoaded, не дожидаясь картинок и скриптов."""
+    options.page_load_strategy = "eager"
+
+
+def configure_driver_waits(driver) -> None:
+    """
+    Явные ожидания вместо неявных: implicit wait превращает каждый
+    отсутствующий селектор в find_elements в скрытый sleep.
+    """
+    driver.implicitly_wait(0)
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+
+
+def wait_for_any_selector(driver, selectors: Sequence[str], timeout: float = None,
+                          stage: str = "card") -> bool:
+    """
+    Ждёт появления хотя бы одного из CSS-селекторов (MutationObserver в странице).
+    Возвращает True сразу, как только узел найден, False - по таймауту этапа.
+    """
+    if timeout is None:
+        timeout = READY_TIMEOUTS.get(stage, 6)
+
+    try:
+        return bool(driver.execute_async_script(WAIT_FOR_SELECTORS_JS, list(selectors), int(timeout * 1000)))
+    except TimeoutException:
+        return False
+    except WebDriverException as e:
+        # Документ сменился во время ожидания (редирект) - дожидаемся опросом
+        logger.debug(f"Ожидание '{stage}' прервано навигацией, перехожу на опрос: {e}")
+        return _poll_for_selectors(driver, selectors, time.time() + timeout)
+
+
+def _poll_for_selectors(driver, selectors: Sequence[str], deadline: float) -> bool:
+    script = """
+    return arguments[0].some((s) => {
+        try { return !!document.querySelector(s); } catch (e) { return false; }
+    });
+    """
+    while time.time() < deadline:
+        try:
+            if driver.execute_script(script, list(selectors)):
+                return True
+        except WebDriverException:
+            pass
+        time.sleep(0.1)
+    return False
@@ -0,0 +1,204 @@
+# pipeline_scheduler.py - ДВУХЭТАПНЫЙ КОНВЕЙЕР: ВОРКЕРЫ ПОИСКА И ВОРКЕРЫ КАРТОЧЕК
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUE_POLL_INTERVAL = 0.5
+
+
+class StageStats:
+    """Счётчики одного этапа конвейера."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_seconds += seconds
+            if not ok:
+                self.errors += 1
+
+    def utilisation(self, elapsed: float) -> float:
+        """Доля времени, которое воркеры этапа были заняты (0..1)."""
+        if elapsed <= 0 or not self.workers:
+            return 0.0
+        return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+
+class PipelineScheduler:
+    """
+    Конвейер из двух этапов со своими лимитами параллельности.
+
+    search_fn(item) -> (candidates, prices): воркеры поиска находят кандидатов
+    и кладут их в очередь карточек; если prices не None (кэш, промах, ошибка
+    поиска), товар сразу считается готовым и на этап карточек не попадает.
+    card_fn(item, candidates) -> prices: воркеры карточек разбирают очередь.
+    on_result(item, prices) вызывается для каждого товара; prices=None - ошибка.
+
+    Очередь кандидатов ограничена queue_size: если карточки не успевают,
+    поиск ждёт, а не копит устаревающие выдачи.
+    """
+
+    def __init__(self, search_fn: Callable[[Any], Tuple[Optional[List[Dict[str, Any]]], Optional[Dict[str, str]]]],
+                 card_fn: Callable[[Any, List[Dict[str, Any]]], Dict[str, str]],
+                 on_result: Callable[[Any, Optional[Dict[str, str]]], None],
+                 search_workers: int = 1, card_workers: int = 2, queue_size: Optional[int] = None,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        self.search_fn = search_fn
+        self.card_fn = card_fn
+        self.on_result = on_result
+        self.search_workers = max(1, int(search_workers or 1))
+        self.card_workers = max(1, int(card_workers or 1))
+        self.queue_size = queue_size or self.card_workers * 2
+        self.should_stop = should_stop or (lambda: False)
+
+        self.search_stats = StageStats("поиск", self.search_workers)
+        self.card_stats = StageStats("карточки", self.card_workers)
+        self.max_queue_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+        self._depth_lock = threading.Lock()
+        self._started_at = 0.0
+        self._finished_at = 0.0
+
+        self._search_queue: "queue.Queue[Any]" = queue.Queue()
+        self._card_queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=self.queue_size)
+
+    def run(self, items: Iterable[Any]) -> None:
+        """Прогоняет все товары через оба этапа и ждёт завершения."""
+        for item in items:
+            self._search_queue.put(item)
+
+        self._started_at = time.time()
+        searchers = [
+            threading.Thread(target=self._search_loop, name=f"pipeline-search-{i}", daemon=True)
+            for i in range(1, self.search_workers + 1)
+        ]
+        card_threads = [
+            threading.Thread(target=self._card_loop, name=f"pipeline-cards-{i}", daemon=True)
+            for i in range(1, self.card_workers + 1)
+        ]
+        for thread in searchers + card_threads:
+            thread.start()
+
+        # join с таймаутом, чтобы главный поток продолжал принимать сигналы
+        for thread in searchers:
+            while thread.is_alive():
+                thread.join(timeout=QUEUE_POLL_INTERVAL)
+        # Поиск закончился - по одному маркеру конца на каждого воркера карточек
+        for _ in card_threads:
+            self._put_candidates(None)
+        for thread in card_threads:
+            while thread.is_alive():
+                thread.join(timeout=QUEUE_POLL_INTERVAL)
+        self._finished_at = time.time()
+
+    def _put_candidates(self, entry: Optional[tuple]) -> None:
+        while True:
+            try:
+                self._card_queue.put(entry, timeout=QUEUE_POLL_INTERVAL)
+                break
+            except queue.Full:
+                if self.should_stop():
+                    return
+        if entry is not None:
+            depth = self._card_queue.qsize()
+            with self._depth_lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                self._depth_total += depth
+                self._depth_samples += 1
+
+    def _search_loop(self) -> None:
+        while not self.should_stop():
+            try:
+                item = self._search_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            started = time.time()
+            try:
+                candidates, prices = self.search_fn(item)
+            except Exception as e:
+                logger.error(f"Ошибка этапа поиска: {e}")
+                self.search_stats.record(time.time() - started, ok=False)
+                self.on_result(item, None)
+                continue
+            self.search_stats.record(time.time() - started)
+
+            if prices is not None or not candidates:
+                self.on_result(item, prices or {"цена": "", "цена для юрлиц": "", "ссылка": ""})
+            else:
+                self._put_candidates((item, candidates))
+
+    def _card_loop(self) -> None:
+        while True:
+            try:
+                entry = self._card_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                if self.should_stop():
+                    return
+                continue
+            if entry is None:
+                return
+            if self.should_stop():
+                continue
+
+            item, candidates = entry
+            started = time.time()
+            try:
+                prices = self.card_fn(item, candidates)
+            except Exception as e:
+                logger.error(f"Ошибка этапа карточек: {e}")
+                self.card_stats.record(time.time() - started, ok=False)
+                self.on_result(item, None)
+                continue
+            self.card_stats.record(time.time() - started)
+            self.on_result(item, prices)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._card_queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика конвейера: загрузка этапов и глубина очереди кандидатов."""
+        elapsed = (self._finished_at or time.time()) - self._started_at if self._started_at else 0.0
+        with self._depth_lock:
+            avg_depth = self._depth_total / self._depth_samples if self._depth_samples else 0.0
+        return {
+            "elapsed": elapsed,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_depth": avg_depth,
+            "stages": {
+                stage.name: {
+                    "workers": stage.workers,
+                    "items": stage.items,
+                    "errors": stage.errors,
+                    "utilisation": stage.utilisation(elapsed),
+                }
+                for stage in (self.search_stats, self.card_stats)
+            },
+        }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        for name, stage in stats["stages"].items():
+            logger.info(
+                f"⚙️ Этап '{name}': воркеров {stage['workers']}, товаров {stage['items']}, "
+                f"ошибок {stage['errors']}, загрузка {stage['utilisation'] * 100:.0f}%"
+            )
+        logger.info(
+            f"⚙️ Очередь кандидатов: средняя глубина {stats['avg_queue_depth']:.1f}, "
+            f"максимум {stats['max_queue_depth']}, за {stats['elapsed']:.0f} с"
+        )
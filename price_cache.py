@@ -0,0 +1,417 @@
+# price_cache.py - ПОСТОЯННЫЙ КЭШ ЦЕН МЕЖДУ ЗАПУСКАМИ (SQLite)
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from utils import get_app_dir
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_NAME = "price_cache.sqlite3"
+DEFAULT_TTL_HOURS = 24
+# Выдача по запросу меняется медленнее цен
+DEFAULT_SEARCH_TTL_HOURS = 72
+# Цена конкретной карточки живёт недолго
+DEFAULT_CARD_TTL_HOURS = 2
+# Параметры ссылки, которые определяют сам товар (остальные - трекинг)
+CARD_URL_KEEP_PARAMS = ("sku",)
+
+# Отрицательные результаты: код причины -> срок хранения (часы).
+# Блокировка снимается быстрее, чем товар появляется на маркетплейсе.
+MISS_NOT_FOUND = "not_found"
+MISS_BLOCKED = "blocked"
+MISS_TTL_HOURS: Dict[str, float] = {
+    MISS_NOT_FOUND: 6,
+    MISS_BLOCKED: 0.5,
+}
+MISS_REASON_TEXT = {
+    MISS_NOT_FOUND: "товар не найден",
+    MISS_BLOCKED: "маркетплейс блокировал запросы",
+}
+DEFAULT_MAX_ENTRIES = 50000
+
+# Режим получения цены: без авторизации в карточке нет цены для юрлиц,
+# поэтому такие записи не должны отдаваться прогону с авторизацией (и наоборот)
+PRICE_MODE_PUBLIC = "public"
+PRICE_MODE_AUTH = "auth"
+
+# Версия схемы (PRAGMA user_version): при смене ключей старые таблицы цен сбрасываются
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    marketplace TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    price       TEXT NOT NULL DEFAULT '',
+    price_vat   TEXT NOT NULL DEFAULT '',
+    url         TEXT NOT NULL DEFAULT '',
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (marketplace, mode, name_key)
+);
+CREATE INDEX IF NOT EXISTS prices_created_at ON prices (created_at);
+CREATE TABLE IF NOT EXISTS searches (
+    marketplace TEXT NOT NULL,
+    query_key   TEXT NOT NULL,
+    candidates  TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (marketplace, query_key)
+);
+CREATE TABLE IF NOT EXISTS cards (
+    url_key    TEXT NOT NULL,
+    mode       TEXT NOT NULL,
+    prices     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (url_key, mode)
+);
+CREATE TABLE IF NOT EXISTS misses (
+    marketplace TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    reason      TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    PRIMARY KEY (marketplace, name_key)
+);
+"""
+
+
+def normalize_name_key(product_name: str) -> str:
+    """Ключ товара: регистр и пробелы не важны."""
+    return re.sub(r"\s+", " ", str(product_name or "")).strip().lower()
+
+
+def price_mode(use_business_auth: bool) -> str:
+    """Режим записи кэша по тому, с авторизацией ли получены цены."""
+    return PRICE_MODE_AUTH if use_business_auth else PRICE_MODE_PUBLIC
+
+
+def normalize_card_url(url: str) -> str:
+    """Ключ карточки: без трекинговых параметров, якоря и завершающего слэша."""
+    parts = urlsplit(str(url or "").strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if k in CARD_URL_KEEP_PARAMS])
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", parts.netloc.lower().replace("www.", "", 1), path, query, ""))
+
+
+class PriceCache:
+    """
+    Кэш найденных цен по маркетплейсу, режиму (PRICE_MODE_*) и наименованию товара.
+
+    Записи старше ttl_hours не отдаются и удаляются при открытии базы;
+    если записей больше max_entries, удаляются самые старые.
+    Отдельная таблица searches хранит кандидатов выдачи (запрос → карточки)
+    со своим сроком search_ttl_hours, чтобы повторный прогон не открывал поиск.
+    Таблица cards - цены отдельных карточек по ссылке и режиму (card_ttl_hours):
+    разные наименования тендера часто ведут на одну и ту же карточку.
+    Таблица misses - отрицательные результаты с кодом причины и коротким сроком
+    по MISS_TTL_HOURS; они же держатся в памяти, чтобы повтор промаха в том же
+    прогоне не стоил даже запроса к базе.
+    Любая ошибка SQLite отключает кэш до конца прогона - парсинг важнее кэша.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl_hours: float = DEFAULT_TTL_HOURS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, enabled: bool = True,
+                 search_ttl_hours: float = DEFAULT_SEARCH_TTL_HOURS,
+                 card_ttl_hours: float = DEFAULT_CARD_TTL_HOURS):
+        self.path = Path(path) if path else get_app_dir() / CACHE_FILE_NAME
+        self.ttl_hours = ttl_hours
+        self.search_ttl_hours = search_ttl_hours
+        self.card_ttl_hours = card_ttl_hours
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._memory_misses: Dict[tuple, tuple] = {}
+        self._memory_lock = threading.Lock()
+
+    @property
+    def ttl_seconds(self) -> float:
+        return float(self.ttl_hours) * 3600
+
+    @property
+    def search_ttl_seconds(self) -> float:
+        return float(self.search_ttl_hours) * 3600
+
+    @property
+    def card_ttl_seconds(self) -> float:
+        return float(self.card_ttl_hours) * 3600
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if not self.enabled:
+            return None
+        if self._conn is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                self._migrate(conn)
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+                self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"Кэш цен недоступен ({self.path}): {e}")
+                self.enabled = False
+                return None
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Кэш старой схемы (цены без режима) сбрасывается: записи нельзя отнести к режиму."""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        existed = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prices'").fetchall()
+        conn.executescript("DROP TABLE IF EXISTS prices; DROP TABLE IF EXISTS cards;")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if existed:
+            logger.info("🗄️ Кэш цен старого формата сброшен")
+
+    def _evict(self) -> None:
+        """Удаляет устаревшие записи и самые старые сверх max_entries."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._conn:
+            removed = self._conn.execute("DELETE FROM prices WHERE created_at < ?", (cutoff,)).rowcount
+            if self.max_entries:
+                removed += self._conn.execute(
+                    "DELETE FROM prices WHERE rowid IN ("
+                    " SELECT rowid FROM prices ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (int(self.max_entries),),
+                ).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM searches WHERE created_at < ?", (time.time() - self.search_ttl_seconds,)
+            ).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM cards WHERE created_at < ?", (time.time() - self.card_ttl_seconds,)
+            ).rowcount
+            for reason in MISS_TTL_HOURS:
+                removed += self._conn.execute(
+                    "DELETE FROM misses WHERE reason = ? AND created_at < ?",
+                    (reason, time.time() - _miss_ttl_seconds(reason)),
+                ).rowcount
+        if removed:
+            logger.info(f"🗄️ Кэш цен: удалено устаревших записей: {removed}")
+
+    def _execute(self, sql: str, params: tuple = ()) -> Optional[list]:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                with conn:
+                    return conn.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Ошибка кэша цен, кэш отключён: {e}")
+                self.enabled = False
+                return None
+
+    def get(self, marketplace: str, product_name: str,
+            mode: str = PRICE_MODE_PUBLIC) -> Optional[Dict[str, str]]:
+        """Цены из кэша или None, если записи нет или она устарела."""
+        rows = self._execute(
+            "SELECT price, price_vat, url FROM prices"
+            " WHERE marketplace = ? AND mode = ? AND name_key = ? AND created_at >= ?",
+            (marketplace, mode, normalize_name_key(product_name), time.time() - self.ttl_seconds),
+        )
+        if not rows:
+            return None
+        price, price_vat, url = rows[0]
+        return {"цена": price, "цена для юрлиц": price_vat, "ссылка": url}
+
+    def put(self, marketplace: str, product_name: str, prices: Dict[str, str],
+            mode: str = PRICE_MODE_PUBLIC) -> None:
+        """Сохраняет найденные цены. Пустой результат не кэшируется."""
+        if not any(prices.get(k) for k in ("цена", "цена для юрлиц", "ссылка")):
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO prices (marketplace, mode, name_key, price, price_vat, url, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (marketplace, mode, normalize_name_key(product_name), prices.get("цена", ""),
+             prices.get("цена для юрлиц", ""), prices.get("ссылка", ""), time.time()),
+        )
+        self.forget_miss(marketplace, product_name)
+
+    def get_miss(self, marketplace: str, product_name: str) -> Optional[str]:
+        """Код причины недавнего промаха (MISS_*) или None."""
+        key = (marketplace, normalize_name_key(product_name))
+        now = time.time()
+
+        with self._memory_lock:
+            memo = self._memory_misses.get(key)
+        if memo and now - memo[1] < _miss_ttl_seconds(memo[0]):
+            return memo[0]
+
+        rows = self._execute("SELECT reason, created_at FROM misses WHERE marketplace = ? AND name_key = ?", key)
+        if not rows:
+            return None
+        reason, created_at = rows[0]
+        if now - created_at >= _miss_ttl_seconds(reason):
+            return None
+        with self._memory_lock:
+            self._memory_misses[key] = (reason, created_at)
+        return reason
+
+    def put_miss(self, marketplace: str, product_name: str, reason: str) -> None:
+        """Запоминает, что товар не найден (MISS_NOT_FOUND) или запрос заблокирован (MISS_BLOCKED)."""
+        key = (marketplace, normalize_name_key(product_name))
+        created_at = time.time()
+        with self._memory_lock:
+            self._memory_misses[key] = (reason, created_at)
+        self._execute(
+            "INSERT OR REPLACE INTO misses (marketplace, name_key, reason, created_at) VALUES (?, ?, ?, ?)",
+            key + (reason, created_at),
+        )
+
+    def forget_miss(self, marketplace: str, product_name: str) -> None:
+        key = (marketplace, normalize_name_key(product_name))
+        with self._memory_lock:
+            self._memory_misses.pop(key, None)
+        self._execute("DELETE FROM misses WHERE marketplace = ? AND name_key = ?", key)
+
+    def get_candidates(self, marketplace: str, query: str) -> Optional[List[Dict[str, Any]]]:
+        """Кандидаты выдачи (title, url, index, snippet_price) по запросу или None."""
+        rows = self._execute(
+            "SELECT candidates, created_at FROM searches"
+            " WHERE marketplace = ? AND query_key = ? AND created_at >= ?",
+            (marketplace, normalize_name_key(query), time.time() - self.search_ttl_seconds),
+        )
+        if not rows:
+            return None
+        try:
+            candidates = json.loads(rows[0][0])
+        except ValueError:
+            return None
+        if not isinstance(candidates, list) or not candidates:
+            return None
+        # Цена из сниппета стареет как цена карточки, а не как сам список кандидатов
+        if rows[0][1] < time.time() - self.card_ttl_seconds:
+            for candidate in candidates:
+                if isinstance(candidate, dict):
+                    candidate.pop("snippet_price", None)
+        return candidates
+
+    def put_candidates(self, marketplace: str, query: str, candidates: List[Dict[str, Any]]) -> None:
+        if not candidates:
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO searches (marketplace, query_key, candidates, created_at)"
+            " VALUES (?, ?, ?, ?)",
+            (marketplace, normalize_name_key(query), json.dumps(candidates, ensure_ascii=False), time.time()),
+        )
+
+    def forget_candidates(self, marketplace: str, query: str) -> None:
+        self._execute("DELETE FROM searches WHERE marketplace = ? AND query_key = ?",
+                      (marketplace, normalize_name_key(query)))
+
+    def get_card(self, url: str, mode: str = PRICE_MODE_PUBLIC) -> Optional[Dict[str, str]]:
+        """Цены карточки (в формате extract_prices_*) по ссылке или None."""
+        rows = self._execute(
+            "SELECT prices FROM cards WHERE url_key = ? AND mode = ? AND created_at >= ?",
+            (normalize_card_url(url), mode, time.time() - self.card_ttl_seconds),
+        )
+        if not rows:
+            return None
+        try:
+            prices = json.loads(rows[0][0])
+        except ValueError:
+            return None
+        return prices if isinstance(prices, dict) else None
+
+    def put_card(self, url: str, prices: Dict[str, str], mode: str = PRICE_MODE_PUBLIC) -> None:
+        """Сохраняет цены карточки. Карточка без цен не кэшируется."""
+        if not url or not any(prices.values()):
+            return
+        self._execute(
+            "INSERT OR REPLACE INTO cards (url_key, mode, prices, created_at) VALUES (?, ?, ?, ?)",
+            (normalize_card_url(url), mode, json.dumps(prices, ensure_ascii=False), time.time()),
+        )
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM prices")
+        self._execute("DELETE FROM searches")
+        self._execute("DELETE FROM cards")
+        self._execute("DELETE FROM misses")
+        with self._memory_lock:
+            self._memory_misses.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _miss_ttl_seconds(reason: str) -> float:
+    return float(MISS_TTL_HOURS.get(reason, 0)) * 3600
+
+
+PRICE_CACHE = PriceCache()
+
+
+def configure_price_cache(enabled: Optional[bool] = None, ttl_hours: Optional[float] = None,
+                          path: Optional[str] = None, search_ttl_hours: Optional[float] = None,
+                          card_ttl_hours: Optional[float] = None,
+                          not_found_ttl_hours: Optional[float] = None,
+                          blocked_ttl_hours: Optional[float] = None) -> None:
+    """Настройки кэша из командной строки / GUI (None - оставить как есть)."""
+    if path is not None:
+        PRICE_CACHE.close()
+        PRICE_CACHE.path = Path(path)
+    if ttl_hours is not None:
+        PRICE_CACHE.ttl_hours = ttl_hours
+    if search_ttl_hours is not None:
+        PRICE_CACHE.search_ttl_hours = search_ttl_hours
+    if card_ttl_hours is not None:
+        PRICE_CACHE.card_ttl_hours = card_ttl_hours
+    if not_found_ttl_hours is not None:
+        MISS_TTL_HOURS[MISS_NOT_FOUND] = not_found_ttl_hours
+    if blocked_ttl_hours is not None:
+        MISS_TTL_HOURS[MISS_BLOCKED] = blocked_ttl_hours
+    if enabled is not None:
+        PRICE_CACHE.enabled = enabled
+
+
+def cached_prices(marketplace: str, product_name: str,
+                  mode: str = PRICE_MODE_PUBLIC) -> Optional[Dict[str, str]]:
+    """Поиск в постоянном кэше с записью в лог попадания."""
+    prices = PRICE_CACHE.get(marketplace, product_name, mode)
+    if prices is not None:
+        logger.info(f"🗄️ Цены из кэша ({marketplace}): {str(product_name)[:40]}...")
+    return prices
+
+
+def cached_candidates(marketplace: str, query: str) -> Optional[List[Dict[str, Any]]]:
+    """Кандидаты выдачи из кэша поиска с записью в лог попадания."""
+    candidates = PRICE_CACHE.get_candidates(marketplace, query)
+    if candidates is not None:
+        logger.info(f"🗄️ Выдача из кэша ({marketplace}), поиск пропущен: {len(candidates)} карточек")
+    return candidates
+
+
+def cached_card_prices(url: str, label: str = "",
+                       mode: str = PRICE_MODE_PUBLIC) -> Optional[Dict[str, str]]:
+    """Цены карточки из кэша с записью в лог попадания."""
+    prices = PRICE_CACHE.get_card(url, mode)
+    if prices is not None:
+        logger.info(f"     🗄️ {label}цены карточки из кэша, страница не загружается")
+    return prices
+
+
+def cached_miss(marketplace: str, product_name: str) -> Optional[str]:
+    """Код причины недавнего промаха с записью в лог."""
+    reason = PRICE_CACHE.get_miss(marketplace, product_name)
+    if reason is not None:
+        logger.info(f"🗄️ Известный промах ({marketplace}: {MISS_REASON_TEXT.get(reason, reason)}), "
+                    f"пропускаю: {str(product_name)[:40]}...")
+    return reason
+
+
+def remember_miss(marketplace: str, product_name: str, reason: str) -> None:
+    PRICE_CACHE.put_miss(marketplace, product_name, reason)
+    logger.info(f"🗄️ Промах сохранён ({marketplace}: {MISS_REASON_TEXT.get(reason, reason)})")
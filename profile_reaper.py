@@ -0,0 +1,133 @@
+# profile_reaper.py - ФОНОВАЯ ОЧИСТКА ПРОФИЛЕЙ БРАУЗЕРА
+
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:  # psutil опционален: без него просто ждём фиксированную паузу
+    psutil = None
+
+
+def collect_driver_pids(driver) -> List[int]:
+    """
+    PID процессов драйвера: сам msedgedriver и дерево браузера под ним.
+    Собирается до driver.quit(), пока процессы ещё живы.
+    """
+    pids: List[int] = []
+    try:
+        service_pid = driver.service.process.pid
+    except Exception:
+        return pids
+
+    pids.append(service_pid)
+    if psutil is not None:
+        try:
+            pids.extend(p.pid for p in psutil.Process(service_pid).children(recursive=True))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return pids
+
+
+class ProfileReaper:
+    """
+    Фоновый поток, удаляющий папки профилей после выхода их браузеров.
+
+    Вместо обхода всей таблицы процессов следит только за PID владельцев,
+    переданными в submit(). Если процессы не завершились за max_wait секунд,
+    папка удаляется принудительно (ignore_errors).
+    """
+
+    def __init__(self, poll_interval: float = 0.5, max_wait: float = 30.0,
+                 on_removed: Optional[Callable[[str], None]] = None):
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.on_removed = on_removed
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: List[dict] = []
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, profile_path: str, pids: Iterable[int] = ()) -> None:
+        """Ставит профиль в очередь на удаление."""
+        if not profile_path:
+            return
+        now = time.time()
+        with self._lock:
+            self._idle.clear()
+            self._queue.put({
+                'path': profile_path,
+                'pids': list(pids),
+                'grace': now + 1.0,
+                'deadline': now + self.max_wait,
+            })
+        self._ensure_started()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока все поставленные профили будут удалены."""
+        return self._idle.wait(timeout)
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-reaper", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                timeout = self.poll_interval if self._pending else None
+                self._pending.append(self._queue.get(timeout=timeout))
+                # Забираем всё, что накопилось, одним проходом
+                while True:
+                    self._pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            still_pending = []
+            for item in self._pending:
+                if self._owners_alive(item) and time.time() < item['deadline']:
+                    still_pending.append(item)
+                    continue
+                self._remove(item['path'])
+            self._pending = still_pending
+
+            with self._lock:
+                if not self._pending and self._queue.empty():
+                    self._idle.set()
+
+    @staticmethod
+    def _owners_alive(item: dict) -> bool:
+        if psutil is None:
+            # Без psutil даём браузеру короткую паузу на освобождение файлов
+            return time.time() < item['grace']
+        for pid in item['pids']:
+            try:
+                proc = psutil.Process(pid)
+                if proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE:
+                    return True
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+        return False
+
+    def _remove(self, profile_path: str) -> None:
+        if os.path.exists(profile_path):
+            shutil.rmtree(profile_path, ignore_errors=True)
+        if os.path.exists(profile_path):
+            logger.debug(f"Профиль не удалён полностью: {profile_path}")
+            return
+        if self.on_removed:
+            try:
+                self.on_removed(profile_path)
+            except Exception:
+                pass
@@ -0,0 +1,159 @@
+# rate_limiter.py - ОБЩИЙ ЛИМИТ ЗАПРОСОВ К МАРКЕТПЛЕЙСАМ (TOKEN BUCKET НА ХОСТ)
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """
+    Token bucket одного маркетплейса, общий для всех воркеров и браузеров.
+
+    rate - сколько переходов в секунду в среднем; burst - сколько можно сделать
+    подряд без ожидания после простоя; jitter - случайная добавка к паузе (с),
+    чтобы запросы не шли с ровным шагом; max_concurrent - сколько загрузок
+    страниц хоста одновременно (None - без лимита).
+    Токены выдаются в долг: каждый следующий запрос ждёт своей очереди,
+    поэтому порядок примерно сохраняется и воркеры не соревнуются за токен.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, jitter: float = 0.3,
+                 max_concurrent: Optional[int] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.max_concurrent = max_concurrent
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.requests = 0
+        self.waited_seconds = 0.0
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд подождать перед запросом."""
+        if not self.rate or self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if self.jitter:
+                delay += random.uniform(0, self.jitter)
+            self.requests += 1
+            self.waited_seconds += delay
+        return delay
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Ожидание токена и место в лимите одновременных загрузок на время запроса."""
+        slots = self._slots  # configure() может заменить семафор, пока запрос идёт
+        if slots is not None:
+            slots.acquire()
+        try:
+            delay = self.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            yield
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def configure(self, rate: Optional[float] = None, burst: Optional[int] = None,
+                  jitter: Optional[float] = None, max_concurrent: Optional[int] = None) -> None:
+        with self._lock:
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = max(1, burst)
+                self._tokens = min(self._tokens, float(self.burst))
+            if jitter is not None:
+                self.jitter = max(0.0, jitter)
+            if max_concurrent is not None:
+                self.max_concurrent = max_concurrent or None
+                self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.waited_seconds = 0.0
+
+    def log_stats(self) -> None:
+        if not self.requests:
+            return
+        logger.info(
+            f"🚦 Лимит {self.name}: переходов {self.requests}, ожидание {self.waited_seconds:.0f} с "
+            f"(~{self.waited_seconds / self.requests:.2f} с на переход, лимит {self.rate}/с, burst {self.burst})"
+        )
+
+
+# Хост -> лимитер. Ozon защищается от ботов строже, чем Яндекс Маркет
+RATE_LIMITERS: Dict[str, HostRateLimiter] = {
+    "yandex": HostRateLimiter("yandex", rate=2.0, burst=4, jitter=0.3, max_concurrent=6),
+    "ozon": HostRateLimiter("ozon", rate=1.0, burst=2, jitter=0.5, max_concurrent=3),
+}
+
+HOST_MARKETPLACES = {
+    "market.yandex.ru": "yandex",
+    "ozon.ru": "ozon",
+}
+
+
+def marketplace_for_url(url: str) -> Optional[str]:
+    """Маркетплейс по адресу (поддомены и www. учитываются)."""
+    host = (urlsplit(str(url or "")).hostname or "").lower()
+    for suffix, marketplace in HOST_MARKETPLACES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return marketplace
+    return None
+
+
+def limiter_for_url(url: str) -> Optional[HostRateLimiter]:
+    marketplace = marketplace_for_url(url)
+    return RATE_LIMITERS.get(marketplace) if marketplace else None
+
+
+@contextmanager
+def throttle(url: str) -> Iterator[None]:
+    """Ждёт разрешения лимитера хоста на запрос к url (чужие хосты не ограничиваются)."""
+    limiter = limiter_for_url(url)
+    if limiter is None:
+        yield
+        return
+    with limiter.slot():
+        yield
+
+
+def wait_turn(url: str) -> None:
+    """Только очередь токенов, без места в лимите одновременных загрузок (фоновые вкладки)."""
+    limiter = limiter_for_url(url)
+    if limiter is not None:
+        delay = limiter.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def throttled_get(driver, url: str) -> None:
+    """driver.get через лимитер хоста."""
+    with throttle(url):
+        driver.get(url)
+
+
+def configure_rate_limit(marketplace: str, rate: Optional[float] = None, burst: Optional[int] = None,
+                         jitter: Optional[float] = None, max_concurrent: Optional[int] = None) -> None:
+    """Меняет лимит маркетплейса (None - оставить как есть, rate=0 - без лимита)."""
+    RATE_LIMITERS[marketplace].configure(rate=rate, burst=burst, jitter=jitter, max_concurrent=max_concurrent)
+
+
+def log_rate_stats() -> None:
+    for limiter in RATE_LIMITERS.values():
+        limiter.log_stats()
@@ -0,0 +1,208 @@
+# resource_blocking.py - БЛОКИРОВКА ТЯЖЁЛЫХ РЕСУРСОВ ДЛЯ ПАРСЕРОВ
+
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Имя capability журнала performance зависит от драйвера: msedgedriver читает только ms:loggingPrefs
+LOGGING_PREFS_CAPABILITIES = {"MicrosoftEdge": "ms:loggingPrefs"}
+DEFAULT_LOGGING_PREFS_CAPABILITY = "goog:loggingPrefs"
+
+_WARNED: set = set()
+_WARNED_LOCK = threading.Lock()
+
+IMAGE_PATTERNS = ["*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.ico"]
+FONT_PATTERNS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"]
+MEDIA_PATTERNS = ["*.mp4", "*.webm", "*.m3u8", "*.ts", "*.mp3", "*.ogg"]
+TRACKER_PATTERNS = [
+    "*mc.yandex.ru*",
+    "*an.yandex.ru*",
+    "*mc.webvisor.org*",
+    "*ads.adfox.ru*",
+    "*googletagmanager.com*",
+    "*google-analytics.com*",
+    "*doubleclick.net*",
+    "*top-fwz1.mail.ru*",
+]
+
+# Примерный вес заблокированного запроса по типу ресурса (для оценки экономии)
+AVERAGE_BLOCKED_BYTES = {
+    "Image": 40 * 1024,
+    "Font": 30 * 1024,
+    "Media": 500 * 1024,
+    "Script": 20 * 1024,
+    "XHR": 2 * 1024,
+    "Fetch": 2 * 1024,
+    "Ping": 512,
+    "Other": 5 * 1024,
+}
+
+
+class BlockingPolicy:
+    """
+    Что не грузить в браузере парсера.
+
+    Картинки отключаются через prefs браузера, остальное - через CDP
+    Network.setBlockedURLs. enabled=False полностью выключает блокировку
+    (на случай, если маркетплейс без неё не рисует цены).
+    """
+
+    def __init__(self, enabled: bool = True, block_images: bool = True, block_fonts: bool = True,
+                 block_media: bool = True, block_trackers: bool = True,
+                 extra_patterns: Optional[List[str]] = None, report: bool = False):
+        self.enabled = enabled
+        self.block_images = block_images
+        self.block_fonts = block_fonts
+        self.block_media = block_media
+        self.block_trackers = block_trackers
+        self.extra_patterns = list(extra_patterns or [])
+        self.report = report
+
+    def url_patterns(self) -> List[str]:
+        if not self.enabled:
+            return []
+        patterns: List[str] = []
+        if self.block_images:
+            patterns += IMAGE_PATTERNS
+        if self.block_fonts:
+            patterns += FONT_PATTERNS
+        if self.block_media:
+            patterns += MEDIA_PATTERNS
+        if self.block_trackers:
+            patterns += TRACKER_PATTERNS
+        return patterns + self.extra_patterns
+
+    def apply_to_options(self, options) -> None:
+        """Настройки, которые задаются до запуска браузера."""
+        if not self.enabled:
+            return
+        if self.block_images:
+            options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+            })
+        if self.report:
+            # Журнал сетевых событий нужен для подсчёта заблокированных запросов
+            enable_performance_log(options)
+
+    def apply_to_driver(self, driver) -> None:
+        """Включает блокировку URL через CDP у уже запущенного браузера."""
+        patterns = self.url_patterns()
+        if not patterns:
+            return
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            driver.blocking_policy = self
+        except Exception as e:
+            logger.warning(f"Не удалось включить блокировку ресурсов через CDP: {e}")
+
+
+# Политики по маркетплейсам. Ozon чувствителен к антиботу - трекеры на нём не режем.
+BLOCKING_POLICIES: Dict[str, BlockingPolicy] = {
+    "yandex": BlockingPolicy(),
+    "ozon": BlockingPolicy(block_trackers=False),
+}
+
+
+def get_blocking_policy(marketplace: str) -> BlockingPolicy:
+    return BLOCKING_POLICIES.get(marketplace) or BlockingPolicy(enabled=False)
+
+
+def set_blocking_enabled(marketplace: str, enabled: bool) -> None:
+    """Включает/выключает блокировку ресурсов для маркетплейса."""
+    policy = BLOCKING_POLICIES.setdefault(marketplace, BlockingPolicy(enabled=enabled))
+    policy.enabled = enabled
+
+
+def enable_performance_log(options) -> None:
+    """Включает журнал performance (CDP-события Network.*) под capability своего браузера."""
+    browser = str(options.capabilities.get("browserName", ""))
+    capability = LOGGING_PREFS_CAPABILITIES.get(browser, DEFAULT_LOGGING_PREFS_CAPABILITY)
+    options.set_capability(capability, {"performance": "ALL"})
+
+
+def warn_once(key: str, message: str) -> None:
+    """Предупреждение, которое достаточно увидеть один раз за прогон."""
+    with _WARNED_LOCK:
+        if key in _WARNED:
+            return
+        _WARNED.add(key)
+    logger.warning(message)
+
+
+def drain_network_events(driver) -> List[Dict[str, Any]]:
+    """Забирает накопленные CDP-события Network.* из журнала performance."""
+    events = []
+    try:
+        entries = driver.get_log("performance")
+    except Exception as e:
+        warn_once("performance_log", f"Журнал performance недоступен, сетевые события не собираются: {e}")
+        return events
+
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        if str(message.get("method", "")).startswith("Network."):
+            events.append(message)
+    return events
+
+
+def blocked_requests_report(driver, events: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Сколько запросов на текущей странице заблокировано и сколько байт это сэкономило
+    (оценка по среднему весу типа ресурса), плюс реально скачанный объём страницы.
+    """
+    report = {"blocked_requests": 0, "bytes_saved": 0, "bytes_transferred": 0}
+
+    if events is None:
+        events = drain_network_events(driver)
+
+    request_types: Dict[str, str] = {}
+    for event in events:
+        params = event.get("params", {})
+        if event.get("method") == "Network.requestWillBeSent":
+            request_types[params.get("requestId")] = params.get("type", "Other")
+        elif event.get("method") == "Network.loadingFailed" and params.get("blockedReason"):
+            resource_type = params.get("type") or request_types.get(params.get("requestId"), "Other")
+            report["blocked_requests"] += 1
+            report["bytes_saved"] += AVERAGE_BLOCKED_BYTES.get(resource_type, AVERAGE_BLOCKED_BYTES["Other"])
+
+    try:
+        report["bytes_transferred"] = int(driver.execute_script("""
+            const entries = performance.getEntriesByType('navigation')
+                .concat(performance.getEntriesByType('resource'));
+            return entries.reduce((sum, e) => sum + (e.transferSize || 0), 0);
+        """) or 0)
+    except Exception:
+        pass
+
+    return report
+
+
+def log_blocked_requests(driver, label: str = "",
+                         events: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Пишет в лог экономию трафика по странице, если у драйвера включён отчёт.
+    events - уже забранные из журнала события (журнал читается только один раз).
+    """
+    policy = getattr(driver, "blocking_policy", None)
+    if policy is None or not policy.report:
+        return None
+
+    if events is None:
+        events = drain_network_events(driver)
+    report = blocked_requests_report(driver, events)
+    if not events:
+        warn_once("blocking_report", "Нет сетевых событий страницы - отчёт о блокировке будет нулевым "
+                                     "(проверьте журнал performance браузера)")
+    logger.info(
+        f"🚫 {label}заблокировано запросов: {report['blocked_requests']}, "
+        f"сэкономлено ~{report['bytes_saved'] // 1024} КБ, "
+        f"скачано {report['bytes_transferred'] // 1024} КБ"
+    )
+    return report
@@ -0,0 +1,155 @@
+# run_journal.py - ЖУРНАЛ ГОТОВЫХ СТРОК ДЛЯ ПРОДОЛЖЕНИЯ ПРЕРВАННОГО ПРОГОНА (JSONL)
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from utils import get_app_dir
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR_NAME = "journals"
+
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+STATUS_BLOCKED = "blocked"
+
+
+def tender_fingerprint(names: Iterable[str]) -> str:
+    """Отпечаток списка наименований: журнал чужого/изменённого тендера не применяется."""
+    digest = hashlib.sha1()
+    for name in names:
+        digest.update(str(name or "").encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def journal_path_for(input_file: str, marketplace: str = "yandex") -> Path:
+    """Файл журнала тендера: папка journals рядом с программой, отдельно по маркетплейсам."""
+    source = Path(input_file).resolve()
+    suffix = hashlib.sha1(str(source).encode("utf-8")).hexdigest()[:8]
+    return get_app_dir() / JOURNAL_DIR_NAME / f"{source.stem}_{suffix}.{marketplace}.jsonl"
+
+
+class RunJournal:
+    """
+    Журнал прогона только на дозапись: первая строка - заголовок с отпечатком
+    тендера, дальше по записи на каждую готовую строку таблицы. Каждая запись
+    сразу сбрасывается на диск (fsync), поэтому переживает падение процесса
+    и перезагрузку; оборванная последняя строка при чтении пропускается.
+    """
+
+    def __init__(self, path: Path, fingerprint: str):
+        self.path = Path(path)
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """Готовые строки прошлого прогона {номер строки: запись} (последняя запись строки побеждает)."""
+        if not self.path.exists():
+            return {}
+
+        rows: Dict[int, Dict[str, Any]] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            logger.warning(f"Журнал не прочитан ({self.path}): {e}")
+            return {}
+
+        header_ok = False
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # запись, оборванная при падении
+            if not isinstance(record, dict):
+                continue
+            if "fingerprint" in record:
+                header_ok = record["fingerprint"] == self.fingerprint
+                continue
+            if header_ok and isinstance(record.get("row"), int):
+                rows[record["row"]] = record
+
+        if not header_ok and lines:
+            logger.warning("Журнал относится к другому содержимому тендера - продолжить нельзя, начинаю заново")
+            return {}
+        return rows
+
+    def open(self, resume: bool = False) -> None:
+        """Открывает журнал на дозапись; без resume старый журнал начинается заново."""
+        with self._lock:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+            except OSError as e:
+                logger.warning(f"Журнал прогона не создан ({self.path}): {e}")
+                return
+            # После падения последняя запись может быть оборвана - начинаем с новой строки
+            if resume and self._file.tell() and not self._ends_with_newline():
+                self._file.write("\n")
+            self._append({"fingerprint": self.fingerprint, "started_at": time.time()})
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def record(self, row: int, name: str, prices: Optional[Dict[str, str]],
+               status: Optional[str] = None) -> None:
+        """Пишет готовую строку (prices=None - строка завершилась ошибкой)."""
+        record = {
+            "row": row,
+            "name": str(name),
+            "status": status or (STATUS_DONE if prices is not None else STATUS_ERROR),
+            "цена": (prices or {}).get("цена", ""),
+            "цена для юрлиц": (prices or {}).get("цена для юрлиц", ""),
+            "ссылка": (prices or {}).get("ссылка", ""),
+            "at": time.time(),
+        }
+        with self._lock:
+            if self._file is not None:
+                self._append(record)
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Журнал отключён, запись не удалась: {e}")
+            self._close()
+
+    def _close(self) -> None:
+        try:
+            self._file.close()
+        except (OSError, AttributeError):
+            pass
+        self._file = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+def restored_rows(journal: RunJournal, names: Dict[int, str]) -> Dict[int, Dict[str, str]]:
+    """
+    Строки, которые можно не парсить повторно: успешные записи журнала,
+    у которых наименование совпадает со строкой тендера. Ошибки и блокировки повторяются.
+    """
+    restored = {}
+    for row, record in journal.load().items():
+        if record.get("status") != STATUS_DONE or str(names.get(row)) != record.get("name"):
+            continue
+        restored[row] = {
+            "цена": record.get("цена", ""),
+            "цена для юрлиц": record.get("цена для юрлиц", ""),
+            "ссылка": record.get("ссылка", ""),
+        }
+    return restored
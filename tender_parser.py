@@ -5,10 +5,14 @@ import re
 import tempfile
 import shutil
 import uuid
+import hashlib
 import atexit
 import signal
 import os
 import sys
+import itertools
+import queue
+import threading
 from typing import Dict, Optional, List, Any
 import pandas as pd
 from selenium import webdriver
@@ -18,12 +22,30 @@ from selenium.webdriver.edge.service import Service
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
 from utils import extract_products_from_excel, save_results_into_tender_format
+from driver_pool import DriverPool
+from driver_watchdog import note_page, note_result, recycle_reason
+from price_cache import (MISS_BLOCKED, MISS_NOT_FOUND, PRICE_CACHE, cached_candidates, cached_card_prices,
+                         cached_miss, cached_prices, price_mode, remember_miss)
+from profile_reaper import ProfileReaper, collect_driver_pids
+from resource_blocking import drain_network_events, get_blocking_policy, log_blocked_requests
+from cdp_prices import PRICE_ENGINES, NetworkPriceWatcher, enable_network_capture
+from http_cards import fetch_card_prices
+from page_ready import READY_TIMEOUTS, configure_driver_waits, use_eager_loading, wait_for_any_selector
+from market_helpers import PRODUCT_LINK_SELECTORS, SEARCH_INPUT_SELECTORS, card_unavailable, search_results_empty
+from work_planner import WorkItem, build_work_plan
+from pipeline_scheduler import PipelineScheduler
+from candidate_budget import CANDIDATE_BUDGET
+from concurrency_controller import CONCURRENCY_CONTROLLERS, FetchFailed
+from block_guard import BLOCKED_MARK, CIRCUIT_BREAKERS, detect_block, report_block
+from rate_limiter import RATE_LIMITERS, log_rate_stats, throttled_get, wait_turn
+from run_journal import STATUS_BLOCKED, RunJournal, journal_path_for, restored_rows, tender_fingerprint
 import subprocess
 import requests
 import zipfile
 import io
 from pathlib import Path
 SEARCH_URL_TEMPLATE = "https://market.yandex.ru/search?text={query}"
+CARD_PRICE_SELECTORS = ["span.ds-valueLine"]
 
 
 def _normalize_search_term(search_term: str, max_len: int = 120) -> str:
@@ -40,8 +62,8 @@ def _perform_direct_search_navigation(driver, search_term: str) -> bool:
 
     try:
         encoded_query = requests.utils.quote(normalized)
-        driver.get(SEARCH_URL_TEMPLATE.format(query=encoded_query))
-        time.sleep(1.2)
+        throttled_get(driver, SEARCH_URL_TEMPLATE.format(query=encoded_query))
+        wait_for_any_selector(driver, PRODUCT_LINK_SELECTORS, stage="search")
         return "search" in driver.current_url
     except Exception as e:
         logger.warning(f"Не удалось перейти по прямому URL поиска: {e}")
@@ -132,9 +154,13 @@ def cleanup_single_profile(profile_path: str) -> bool:
     except Exception as e:
         return False
 
+PROFILE_REAPER = ProfileReaper(on_removed=CREATED_PROFILES.discard)
+
 def cleanup_profiles():
     """Глобальная очистка всех профилей"""
     global CREATED_PROFILES
+    # Даём фоновому уборщику дочистить профили закрытых браузеров
+    PROFILE_REAPER.flush(timeout=5)
     cleanup_count = 0
     for profile_path in CREATED_PROFILES.copy():
         try:
@@ -168,34 +194,138 @@ def kill_zombie_edges():
         pass
 
 EDGE_VERSION = "144.0.3719.82"
+DRIVER_MANIFEST_NAME = "driver_manifest.json"
 
-def ensure_edgedriver(driver_dir: Path) -> Path:
-    driver_dir.mkdir(parents=True, exist_ok=True)
-    driver_path = driver_dir / "msedgedriver.exe"
+# Драйверы, уже проверенные в этом процессе: (браузер, папка) -> путь
+_RESOLVED_DRIVERS: Dict[tuple, Path] = {}
+_DRIVER_MANIFEST_LOCK = threading.Lock()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_driver_manifest(driver_dir: Path) -> Dict[str, Any]:
+    manifest_path = driver_dir / DRIVER_MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _write_driver_manifest(driver_dir: Path, browser: str, driver_path: Path, version: str) -> None:
+    manifest = _read_driver_manifest(driver_dir)
+    manifest[browser] = {
+        'path': driver_path.name,
+        'version': version,
+        'sha256': _file_sha256(driver_path),
+        'checked_at': time.time(),
+    }
+    manifest_path = driver_dir / DRIVER_MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def _manifest_driver(driver_dir: Path, browser: str, expected_major: Optional[str] = None) -> Optional[Path]:
+    """Путь к драйверу из манифеста, если бинарник на месте и не изменился."""
+    entry = _read_driver_manifest(driver_dir).get(browser)
+    if not isinstance(entry, dict) or not entry.get('path'):
+        return None
+
+    driver_path = driver_dir / entry['path']
+    if not driver_path.exists():
+        return None
+    if expected_major and not str(entry.get('version', '')).startswith(f"{expected_major}."):
+        return None
+    try:
+        if _file_sha256(driver_path) != entry.get('sha256'):
+            return None
+    except OSError:
+        return None
+    return driver_path
+
+
+def _get_driver_version(driver_path: Path) -> str:
+    out = subprocess.check_output([str(driver_path), "--version"], text=True, timeout=15)
+    match = re.search(r'(\d+(?:\.\d+)+)', out)
+    return match.group(1) if match else ""
 
+
+def _resolve_driver(browser: str, driver_dir: Path, resolver) -> Path:
+    """
+    Общая обёртка: драйвер проверяется один раз на процесс, дальше берётся из памяти.
+    resolver вызывается только если манифест отсутствует или не совпал.
+    """
+    key = (browser, str(driver_dir))
+    cached = _RESOLVED_DRIVERS.get(key)
+    if cached is not None:
+        return cached
+
+    with _DRIVER_MANIFEST_LOCK:
+        cached = _RESOLVED_DRIVERS.get(key)
+        if cached is not None:
+            return cached
+
+        driver_dir.mkdir(parents=True, exist_ok=True)
+        driver_path = resolver()
+        _RESOLVED_DRIVERS[key] = driver_path
+        return driver_path
+
+
+def forget_resolved_driver(browser: str, driver_dir: Path) -> None:
+    """Сбрасывает проверенный драйвер (например, после ошибки запуска браузера)."""
+    _RESOLVED_DRIVERS.pop((browser, str(driver_dir)), None)
+    with _DRIVER_MANIFEST_LOCK:
+        manifest = _read_driver_manifest(driver_dir)
+        if manifest.pop(browser, None) is not None:
+            try:
+                with open(driver_dir / DRIVER_MANIFEST_NAME, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+            except OSError:
+                pass
+
+
+def ensure_edgedriver(driver_dir: Path) -> Path:
     # Берём основную часть версии для скачивания
     edge_major = EDGE_VERSION.split('.')[0]
 
-    # Проверяем, есть ли драйвер и совпадает ли версия
-    if driver_path.exists():
-        try:
-            out = subprocess.check_output(
-                f'"{driver_path}" --version', shell=True, text=True
-            )
-            if edge_major in out:
-                return driver_path
-        except Exception:
-            pass
+    def resolve() -> Path:
+        driver_path = driver_dir / "msedgedriver.exe"
+
+        manifest_path = _manifest_driver(driver_dir, "edge", edge_major)
+        if manifest_path:
+            return manifest_path
 
-    # Скачиваем нужный драйвер
-    url = f"https://msedgedriver.azureedge.net/{EDGE_VERSION}/edgedriver_win64.zip"
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
+        # Проверяем, есть ли драйвер и совпадает ли версия
+        if driver_path.exists():
+            try:
+                version = _get_driver_version(driver_path)
+                if version.startswith(f"{edge_major}."):
+                    _write_driver_manifest(driver_dir, "edge", driver_path, version)
+                    return driver_path
+            except Exception:
+                pass
 
-    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-        z.extract("msedgedriver.exe", driver_dir)
+        # Скачиваем нужный драйвер
+        url = f"https://msedgedriver.azureedge.net/{EDGE_VERSION}/edgedriver_win64.zip"
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
 
-    return driver_path
+        with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+            z.extract("msedgedriver.exe", driver_dir)
+
+        _write_driver_manifest(driver_dir, "edge", driver_path, EDGE_VERSION)
+        return driver_path
+
+    return _resolve_driver("edge", driver_dir, resolve)
 
 def _get_chrome_major_version() -> str:
     output = subprocess.check_output(
@@ -206,44 +336,51 @@ def _get_chrome_major_version() -> str:
     return re.search(r'(\d+)\.', output).group(1)
 
 def ensure_chromedriver(driver_dir: Path) -> Path:
-    driver_dir.mkdir(parents=True, exist_ok=True)
-    driver_path = driver_dir / "chromedriver.exe"
+    def resolve() -> Path:
+        driver_path = driver_dir / "chromedriver.exe"
 
-    chrome_major = _get_chrome_major_version()
+        # Манифест проверяем до обращения к реестру и сети
+        manifest_path = _manifest_driver(driver_dir, "chrome")
+        if manifest_path:
+            return manifest_path
 
-    if driver_path.exists():
-        try:
-            out = subprocess.check_output(
-                f'"{driver_path}" --version', shell=True, text=True
-            )
-            if chrome_major in out:
-                return driver_path
-        except Exception:
-            pass
+        chrome_major = _get_chrome_major_version()
 
-    # Получаем актуальную версию Chrome for Testing
-    versions_url = "https://googlechromelabs.github.io/chrome-for-testing/latest-patch-versions-per-build.json"
-    data = requests.get(versions_url, timeout=30).json()
+        if driver_path.exists():
+            try:
+                version = _get_driver_version(driver_path)
+                if version.startswith(f"{chrome_major}."):
+                    _write_driver_manifest(driver_dir, "chrome", driver_path, version)
+                    return driver_path
+            except Exception:
+                pass
 
-    full_version = data["builds"][chrome_major]["version"]
+        # Получаем актуальную версию Chrome for Testing
+        versions_url = "https://googlechromelabs.github.io/chrome-for-testing/latest-patch-versions-per-build.json"
+        data = requests.get(versions_url, timeout=30).json()
 
-    download_url = (
-        f"https://storage.googleapis.com/chrome-for-testing-public/"
-        f"{full_version}/win64/chromedriver-win64.zip"
-    )
+        full_version = data["builds"][chrome_major]["version"]
 
-    r = requests.get(download_url, timeout=30)
-    r.raise_for_status()
+        download_url = (
+            f"https://storage.googleapis.com/chrome-for-testing-public/"
+            f"{full_version}/win64/chromedriver-win64.zip"
+        )
 
-    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-        for name in z.namelist():
-            if name.endswith("chromedriver.exe"):
-                z.extract(name, driver_dir)
-                extracted = driver_dir / name
-                extracted.replace(driver_path)
-                break
+        r = requests.get(download_url, timeout=30)
+        r.raise_for_status()
 
-    return driver_path
+        with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+            for name in z.namelist():
+                if name.endswith("chromedriver.exe"):
+                    z.extract(name, driver_dir)
+                    extracted = driver_dir / name
+                    extracted.replace(driver_path)
+                    break
+
+        _write_driver_manifest(driver_dir, "chrome", driver_path, full_version)
+        return driver_path
+
+    return _resolve_driver("chrome", driver_dir, resolve)
 
 
 
@@ -252,14 +389,21 @@ def create_driver(
     headless: bool = True,
     driver_path: Optional[str] = None,
     use_auth: bool = False,
-    browser: str = "edge"
+    browser: str = "edge",
+    use_template: bool = True,
+    capture_network: bool = False
 ):
     """
-    Создание драйвера Edge / Chrome с автоподбором WebDriver
+    Создание драйвера Edge / Chrome с автоподбором WebDriver.
+
+    При use_auth=True профиль стартует с копии запечённого шаблона
+    (см. bake_auth_profile_template), если он есть.
+    capture_network=True - журнал CDP-событий сети для движка цен "cdp".
     """
     global CREATED_PROFILES
 
     profile_dir = None
+    template_dir = None
 
     if browser == "edge":
         options = webdriver.EdgeOptions()
@@ -290,11 +434,15 @@ def create_driver(
     if use_auth:
         timestamp = int(time.time() * 1000)
         worker_id = uuid.uuid4().hex[:8]
-        app_dir = Path.home() / ".yandex_parser_auth"
+        app_dir = AUTH_APP_DIR
         app_dir.mkdir(exist_ok=True)
 
         profile_dir = app_dir / f"{browser}_profile_{worker_id}_{timestamp}"
-        profile_dir.mkdir(parents=True, exist_ok=True)
+        template_dir = get_auth_profile_template(browser) if use_template else None
+        if template_dir:
+            clone_profile_template(template_dir, profile_dir)
+        else:
+            profile_dir.mkdir(parents=True, exist_ok=True)
         options.add_argument(f"--user-data-dir={profile_dir}")
         CREATED_PROFILES.add(str(profile_dir))
     else:
@@ -307,6 +455,14 @@ def create_driver(
         options.add_argument("--headless=new")
         options.add_argument("--window-size=1280,800")
 
+    use_eager_loading(options)
+
+    blocking_policy = get_blocking_policy("yandex")
+    blocking_policy.apply_to_options(options)
+
+    if capture_network:
+        enable_network_capture(options)
+
     try:
         base_dir = Path(__file__).parent / "browserdriver"
         base_dir.mkdir(exist_ok=True)
@@ -327,8 +483,10 @@ def create_driver(
             driver = webdriver.Chrome(service=service, options=options)
 
         driver.set_page_load_timeout(15)
-        driver.implicitly_wait(3)
+        configure_driver_waits(driver)
+        blocking_policy.apply_to_driver(driver)
         driver.profile_path = str(profile_dir) if profile_dir else temp_dir
+        driver.auth_from_template = template_dir is not None
 
         return driver
 
@@ -340,18 +498,30 @@ def create_driver(
             except:
                 pass
 
+        # Драйвер из манифеста мог устареть после обновления браузера - перепроверим в следующий раз
+        if not driver_path:
+            forget_resolved_driver(browser, Path(__file__).parent / "browserdriver")
+
         logger.error(f"Ошибка создания драйвера ({browser}): {e}")
         raise
 
 
 
-def load_cookies_for_auth(driver):
-    """ЗАГРУЗКА COOKIES ИЗ ПАПКИ ПРИЛОЖЕНИЯ (ИЗМЕНЕНО ТОЛЬКО ЭТО)"""
-    from pathlib import Path
+AUTH_APP_DIR = Path.home() / ".yandex_parser_auth"
+PROFILE_TEMPLATE_MARKER = "template.json"
+# Кэши и служебные файлы, которые не нужны в шаблоне профиля
+PROFILE_TEMPLATE_SKIP = {
+    "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache", "DawnCache",
+    "Service Worker", "Crashpad", "BrowserMetrics", "component_crx_cache",
+    "SingletonLock", "SingletonCookie", "SingletonSocket", "lockfile",
+}
+
+_COOKIES_CACHE: Dict[str, Any] = {}
+_TEMPLATE_LOCK = threading.Lock()
 
-    if STOP_PARSING:
-        return False
 
+def _find_cookies_file() -> Optional[Path]:
+    """Ищет cookies.json в папке приложения, затем в ~/.yandex_parser_auth"""
     # Определяем директорию приложения (.exe или .py)
     if getattr(sys, 'frozen', False):
         app_dir = Path(sys.executable).parent
@@ -363,25 +533,49 @@ def load_cookies_for_auth(driver):
 
     # Вариант 2: если нет в корне, ищем в .yandex_parser_auth (для совместимости)
     if not cookies_file.exists():
-        cookies_file = Path.home() / ".yandex_parser_auth" / "cookies.json"
+        cookies_file = AUTH_APP_DIR / "cookies.json"
 
-    if not cookies_file.exists():
+    return cookies_file if cookies_file.exists() else None
+
+
+def _read_cookies(cookies_file: Path) -> List[Dict[str, Any]]:
+    """Читает cookies.json один раз на процесс (перечитывает только при изменении файла)."""
+    stat = cookies_file.stat()
+    signature = (str(cookies_file), stat.st_mtime, stat.st_size)
+    if _COOKIES_CACHE.get('signature') == signature:
+        return _COOKIES_CACHE['cookies']
+
+    with open(cookies_file, 'r', encoding='utf-8') as f:
+        cookies_data = json.loads(f.read().strip())
+
+    if isinstance(cookies_data, list):
+        cookies = cookies_data
+    elif isinstance(cookies_data, dict) and 'cookies' in cookies_data:
+        cookies = cookies_data['cookies']
+    else:
+        cookies = []
+
+    _COOKIES_CACHE['signature'] = signature
+    _COOKIES_CACHE['cookies'] = cookies
+    return cookies
+
+
+def load_cookies_for_auth(driver):
+    """ЗАГРУЗКА COOKIES ИЗ ПАПКИ ПРИЛОЖЕНИЯ (ИЗМЕНЕНО ТОЛЬКО ЭТО)"""
+    if STOP_PARSING:
+        return False
+
+    cookies_file = _find_cookies_file()
+    if cookies_file is None:
         logger.warning(f"Cookies НЕ найдены")
         return False
 
     try:
-        with open(cookies_file, 'r', encoding='utf-8') as f:
-            cookies_data = json.loads(f.read().strip())
-
-        if isinstance(cookies_data, list):
-            cookies = cookies_data
-        elif isinstance(cookies_data, dict) and 'cookies' in cookies_data:
-            cookies = cookies_data['cookies']
-        else:
+        cookies = _read_cookies(cookies_file)
+        if not cookies:
             return False
 
-        driver.get("https://market.yandex.ru")
-        time.sleep(0.5)
+        throttled_get(driver, "https://market.yandex.ru")
 
         loaded_count = 0
         for cookie in cookies:
@@ -404,6 +598,14 @@ def load_cookies_for_auth(driver):
                 if cookie.get('secure', False):
                     clean_cookie['secure'] = True
 
+                # Без срока Chromium считает cookie сессионной и теряет её при
+                # повторном открытии профиля (шаблон профиля остался бы без авторизации)
+                expiry = _cookie_expiry(cookie)
+                if expiry is not None:
+                    if expiry <= time.time():
+                        continue
+                    clean_cookie['expiry'] = expiry
+
                 driver.add_cookie(clean_cookie)
                 loaded_count += 1
             except:
@@ -411,7 +613,6 @@ def load_cookies_for_auth(driver):
 
         if loaded_count > 0:
             driver.refresh()
-            time.sleep(0.5)
             logger.info(f"✅ Загружено {loaded_count} cookies")
             return loaded_count > 0
 
@@ -421,6 +622,181 @@ def load_cookies_for_auth(driver):
         logger.warning(f"Ошибка при загрузке cookies: {e}")
         return False
 
+
+def _cookie_expiry(cookie: Dict[str, Any]) -> Optional[int]:
+    """Срок cookie в секундах: 'expiry' (Selenium) или 'expirationDate' (выгрузка из расширений)."""
+    value = cookie.get('expiry', cookie.get('expirationDate'))
+    try:
+        return int(float(value)) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _cookie_applies_to(cookie: Dict[str, Any], host: str) -> bool:
+    domain = str(cookie.get('domain') or '').lstrip('.').lower()
+    return not domain or host == domain or host.endswith('.' + domain)
+
+
+def template_auth_ok(driver, host: str = "market.yandex.ru") -> bool:
+    """
+    Профиль из шаблона действительно авторизован: все действующие cookies
+    из cookies.json для хоста есть в браузере (проверка после перехода на хост).
+    """
+    cookies_file = _find_cookies_file()
+    if cookies_file is None:
+        return False
+    try:
+        expected = {
+            str(cookie['name']) for cookie in _read_cookies(cookies_file)
+            if isinstance(cookie, dict) and 'name' in cookie and _cookie_applies_to(cookie, host)
+            and (_cookie_expiry(cookie) is None or _cookie_expiry(cookie) > time.time())
+        }
+        present = {cookie.get('name') for cookie in driver.get_cookies()}
+    except Exception as e:
+        logger.debug(f"Проверка авторизации профиля не удалась: {e}")
+        return False
+    missing = expected - present
+    if missing:
+        logger.debug(f"В профиле нет cookies: {', '.join(sorted(missing)[:5])}")
+    return bool(expected) and not missing
+
+
+def _profile_template_dir(browser: str = "edge") -> Path:
+    return AUTH_APP_DIR / f"{browser}_profile_template"
+
+
+def _cookies_signature(cookies_file: Path) -> Dict[str, Any]:
+    stat = cookies_file.stat()
+    return {'cookies_file': str(cookies_file), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def get_auth_profile_template(browser: str = "edge") -> Optional[Path]:
+    """Возвращает готовый шаблон профиля, если он собран под текущий cookies.json"""
+    template_dir = _profile_template_dir(browser)
+    marker = template_dir / PROFILE_TEMPLATE_MARKER
+    cookies_file = _find_cookies_file()
+
+    if cookies_file is None or not marker.exists():
+        return None
+
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            baked = json.load(f)
+    except Exception:
+        return None
+
+    signature = _cookies_signature(cookies_file)
+    if any(baked.get(k) != v for k, v in signature.items()):
+        return None
+
+    return template_dir
+
+
+def _ignore_template_junk(directory: str, names: List[str]) -> List[str]:
+    return [name for name in names if name in PROFILE_TEMPLATE_SKIP]
+
+
+def clone_profile_template(template_dir: Path, target_dir: Path) -> None:
+    """
+    Копирует шаблон профиля в новый user-data-dir.
+
+    Жёсткие ссылки здесь не годятся: Edge дописывает SQLite-файлы (Cookies и др.)
+    прямо на месте и испортил бы общий шаблон. Поэтому шаблон держится
+    маленьким (без кэшей), а копия делается обычным copytree.
+    """
+    shutil.copytree(template_dir, target_dir, ignore=_ignore_template_junk, dirs_exist_ok=True)
+    try:
+        (target_dir / PROFILE_TEMPLATE_MARKER).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def bake_auth_profile_template(headless: bool = True, driver_path: Optional[str] = None,
+                               browser: str = "edge", force: bool = False) -> Optional[Path]:
+    """
+    Однократно "запекает" авторизованный профиль: подгружает cookies.json в чистый
+    профиль и сохраняет его как шаблон. Новые драйверы с use_auth=True стартуют
+    с копии шаблона и не тратят время на загрузку cookies.
+    """
+    with _TEMPLATE_LOCK:
+        if not force:
+            template_dir = get_auth_profile_template(browser)
+            if template_dir:
+                return template_dir
+
+        cookies_file = _find_cookies_file()
+        if cookies_file is None:
+            logger.warning("Cookies НЕ найдены, шаблон профиля не создан")
+            return None
+
+        template_dir = _profile_template_dir(browser)
+        logger.info("🍪 Собираю шаблон авторизованного профиля...")
+
+        driver = create_driver(headless=headless, driver_path=driver_path, use_auth=True,
+                               browser=browser, use_template=False)
+        profile_path = driver.profile_path
+        try:
+            loaded = load_cookies_for_auth(driver)
+        finally:
+            # Edge сбрасывает cookies на диск при штатном закрытии
+            try:
+                driver.quit()
+            except:
+                pass
+
+        if not loaded:
+            cleanup_single_profile(profile_path)
+            CREATED_PROFILES.discard(profile_path)
+            logger.warning("Не удалось загрузить cookies, шаблон профиля не создан")
+            return None
+
+        time.sleep(0.5)
+        shutil.rmtree(template_dir, ignore_errors=True)
+        shutil.copytree(profile_path, template_dir, ignore=_ignore_template_junk)
+        shutil.rmtree(profile_path, ignore_errors=True)
+        CREATED_PROFILES.discard(profile_path)
+
+        with open(template_dir / PROFILE_TEMPLATE_MARKER, 'w', encoding='utf-8') as f:
+            json.dump({**_cookies_signature(cookies_file), 'baked_at': time.time()}, f)
+
+        logger.info(f"✅ Шаблон профиля готов: {template_dir}")
+        return template_dir
+
+EXTRACT_PRICES_JS = """
+var result = {
+    prices: [],
+    labels: []
+};
+
+var valuelines = document.querySelectorAll("span.ds-valueLine");
+var targetElements = Array.from(valuelines).slice(0, 4);
+
+for (var i = 0; i < targetElements.length; i++) {
+    var element = targetElements[i];
+    var priceText = element.textContent.trim();
+    result.prices.push(priceText);
+
+    // Поиск подписей в соседних элементах
+    var labelText = "";
+    var parent = element.parentElement;
+
+    if (parent && parent.parentElement) {
+        var textLines = parent.parentElement.querySelectorAll(".ds-textLine");
+        for (var j = 0; j < Math.min(textLines.length, 3); j++) {
+            var text = textLines[j].textContent.trim().toLowerCase();
+            if (text && text.length < 25) {
+                labelText = text;
+                break;
+            }
+        }
+    }
+
+    result.labels.push(labelText);
+}
+
+return result;
+"""
+
 def extract_prices_fast(driver):
     """Быстрое извлечение цен: массово считывает первые 4 ds.valueLine + подписи"""
     price_data = {
@@ -434,44 +810,8 @@ def extract_prices_fast(driver):
     try:
         logger.debug("Извлечение цен из карточки товара...")
 
-
-        script = """
-        var result = {
-            prices: [],
-            labels: []
-        };
-
-        var valuelines = document.querySelectorAll("span.ds-valueLine");
-        var targetElements = Array.from(valuelines).slice(0, 4);
-
-        for (var i = 0; i < targetElements.length; i++) {
-            var element = targetElements[i];
-            var priceText = element.textContent.trim();
-            result.prices.push(priceText);
-
-            // Поиск подписей в соседних элементах
-            var labelText = "";
-            var parent = element.parentElement;
-
-            if (parent && parent.parentElement) {
-                var textLines = parent.parentElement.querySelectorAll(".ds-textLine");
-                for (var j = 0; j < Math.min(textLines.length, 3); j++) {
-                    var text = textLines[j].textContent.trim().toLowerCase();
-                    if (text && text.length < 25) {
-                        labelText = text;
-                        break;
-                    }
-                }
-            }
-
-            result.labels.push(labelText);
-        }
-
-        return result;
-        """
-
         try:
-            bulk_data = driver.execute_script(script)
+            bulk_data = driver.execute_script(EXTRACT_PRICES_JS)
         except Exception as e:
             logger.warning(f"JavaScript ошибка, используем fallback: {e}")
             # Fallback
@@ -486,106 +826,140 @@ def extract_prices_fast(driver):
                 bulk_data['prices'].append(valueline.text.strip())
                 bulk_data['labels'].append("")
 
-        if not bulk_data or not bulk_data.get('prices'):
-            return price_data
-
-        prices = bulk_data['prices']
-        labels = bulk_data['labels']
-
-        # Формируем данные для классификации
-        prices_with_labels = []
-        for i, (price_text, label_text) in enumerate(zip(prices, labels)):
-            prices_with_labels.append({
-                'text': price_text,
-                'label': label_text.lower(),
-                'index': i + 1
-            })
-
-        # Классификация по подписям
-        regular_found = False
-        vat_found = False
-
-        # 1. Ищем "пэй" для обычной цены
-        for item in prices_with_labels:
-            if 'пэй' in item['label'] or 'pay' in item['label']:
-                price_data['обычная цена'] = item['text']
-                regular_found = True
-                break
-
-        # 2. Ищем "с НДС" для юрлиц
-        for item in prices_with_labels:
-            if 'с ндс' in item['label'] or 'ндс' in item['label'] or 'для юрлиц' in item['label']:
-                price_data['цена для юрлиц'] = item['text']
-                vat_found = True
-                break
-
-        # 3. Если не нашли "пэй" → первая цена как обычная
-        if not regular_found and prices_with_labels:
-            price_data['обычная цена'] = prices_with_labels[0]['text']
-
-        return price_data
+        return classify_price_lines(bulk_data)
 
     except Exception as e:
         logger.error(f"Ошибка извлечения цен: {e}")
         return price_data
 
-def extract_products_smart(driver) -> List[Dict[str, Any]]:
-    products = []
 
-    try:
-        script = """
-        const selectors = [
-            'a[data-auto="snippet-link"]',
-            'a[data-zone-name="title"]',
-            'a[href*="/product--"]',
-            'span[role="link"][data-auto="snippet-title"]'
-        ];
-
-        const nodes = [];
-        selectors.forEach((selector) => {
-            document.querySelectorAll(selector).forEach((node) => nodes.push(node));
-        });
-
-        const seen = new Set();
-        const products = [];
-
-        for (let i = 0; i < nodes.length; i++) {
-            const node = nodes[i];
-            const title = (node.textContent || '').trim();
-            if (!title) continue;
-
-            let link = node.closest('a[href]');
-            if (!link && node.parentElement) {
-                link = node.parentElement.querySelector('a[href]');
-            }
+def classify_price_lines(bulk_data: Optional[Dict[str, List[str]]]) -> Dict[str, str]:
+    """Раскладывает первые ds-valueLine карточки на обычную цену и цену для юрлиц по подписям."""
+    price_data = {
+        'обычная цена': '',
+        'цена для юрлиц': ''
+    }
 
-            const rawUrl = link && link.href ? link.href : '';
-            if (!rawUrl) continue;
+    if not bulk_data or not bulk_data.get('prices'):
+        return price_data
 
-            const normalizedUrl = rawUrl.split('?')[0];
-            if (seen.has(normalizedUrl)) continue;
-            seen.add(normalizedUrl);
+    prices = bulk_data['prices']
+    labels = bulk_data['labels']
+
+    # Формируем данные для классификации
+    prices_with_labels = []
+    for i, (price_text, label_text) in enumerate(zip(prices, labels)):
+        prices_with_labels.append({
+            'text': price_text,
+            'label': label_text.lower(),
+            'index': i + 1
+        })
+
+    # Классификация по подписям
+    regular_found = False
+    vat_found = False
+
+    # 1. Ищем "пэй" для обычной цены
+    for item in prices_with_labels:
+        if 'пэй' in item['label'] or 'pay' in item['label']:
+            price_data['обычная цена'] = item['text']
+            regular_found = True
+            break
 
-            products.push({
-                title: title,
-                url: normalizedUrl,
-                index: products.length + 1
-            });
+    # 2. Ищем "с НДС" для юрлиц
+    for item in prices_with_labels:
+        if 'с ндс' in item['label'] or 'ндс' in item['label'] or 'для юрлиц' in item['label']:
+            price_data['цена для юрлиц'] = item['text']
+            vat_found = True
+            break
 
-            if (products.length >= 6) break;
+    # 3. Если не нашли "пэй" → первая цена как обычная
+    if not regular_found and prices_with_labels:
+        price_data['обычная цена'] = prices_with_labels[0]['text']
+
+    return price_data
+
+EXTRACT_PRODUCTS_JS = """
+const selectors = [
+    'a[data-auto="snippet-link"]',
+    'a[data-zone-name="title"]',
+    'a[href*="/product--"]',
+    'span[role="link"][data-auto="snippet-title"]'
+];
+
+const nodes = [];
+selectors.forEach((selector) => {
+    document.querySelectorAll(selector).forEach((node) => nodes.push(node));
+});
+
+// Цена в сниппете выдачи: поднимаемся от ссылки до блока, где есть цена,
+// но не дальше границы сниппета (блок не должен содержать чужих товаров)
+const priceSelectors = '[data-auto="snippet-price-current"], [data-auto="price-value"], span.ds-valueLine';
+const linkSelectors = 'a[data-auto="snippet-link"], a[href*="/product--"]';
+const snippetPrice = (node) => {
+    let el = node;
+    for (let depth = 0; el && depth < 10; depth++, el = el.parentElement) {
+        const urls = new Set();
+        el.querySelectorAll(linkSelectors).forEach((a) => urls.add((a.href || '').split('?')[0]));
+        if (urls.size > 1) break;
+        const priceNode = el.querySelector(priceSelectors);
+        if (priceNode) {
+            const text = (priceNode.textContent || '').replace(/\s+/g, ' ').trim();
+            const match = text.match(/\d[\d \u00a0\u2009]*(?:[.,]\d+)?\s*₽/);
+            return match ? match[0].trim() : text;
         }
+    }
+    return '';
+};
+
+const seen = new Set();
+const products = [];
+
+for (let i = 0; i < nodes.length; i++) {
+    const node = nodes[i];
+    const title = (node.textContent || '').trim();
+    if (!title) continue;
+
+    let link = node.closest('a[href]');
+    if (!link && node.parentElement) {
+        link = node.parentElement.querySelector('a[href]');
+    }
+
+    const rawUrl = link && link.href ? link.href : '';
+    if (!rawUrl) continue;
+
+    const normalizedUrl = rawUrl.split('?')[0];
+    if (seen.has(normalizedUrl)) continue;
+    seen.add(normalizedUrl);
+
+    products.push({
+        title: title,
+        url: normalizedUrl,
+        index: products.length + 1,
+        snippet_price: snippetPrice(node)
+    });
+
+    if (products.length >= 6) break;
+}
 
-        return products;
-        """
+return products;
+"""
 
-        products_data = driver.execute_script(script, PRODUCT_LINK_SELECTORS)
+def extract_products_smart(driver) -> Optional[List[Dict[str, Any]]]:
+    """Кандидаты со страницы выдачи; None - скрипт извлечения не отработал."""
+    products = []
+
+    try:
+
+        products_data = driver.execute_script(EXTRACT_PRODUCTS_JS, PRODUCT_LINK_SELECTORS)
 
         if products_data:
             products = [
                 {
                     'title': p['title'],
                     'url': p['url'],
-                    'index': p['index']
+                    'index': p['index'],
+                    'snippet_price': p.get('snippet_price') or ''
                 }
                 for p in products_data[:5]
                 if p.get('url') and p.get('title')
@@ -597,6 +971,7 @@ def extract_products_smart(driver) -> List[Dict[str, Any]]:
 
     except Exception as e:
         logger.warning(f"Ошибка извлечения товаров: {e}")
+        return None
 
     return products
 
@@ -637,35 +1012,106 @@ def parse_price_to_number(price_str: str) -> float:
     except:
         return float('inf')
 
-def collect_prices_from_all_products(driver, products: List[Dict[str, Any]], search_term: str) -> Dict[str, str]:
-    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+CARD_TABS_TIMEOUT = 12
 
-    if not products:
-        logger.warning("Нет товаров для обработки")
-        return result
+# Вкладка готова, только когда уже ушла с about:blank: пустая вкладка тоже 'complete'
+CARD_TAB_NAVIGATED_JS = "return !!location.href && location.href !== 'about:blank';"
+CARD_PRICE_NODES_JS = "return arguments[0].some((s) => !!document.querySelector(s));"
+CARD_TAB_READY_JS = (
+    "if (!location.href || location.href === 'about:blank') return false;"
+    " return document.readyState === 'complete'"
+    " || arguments[0].some((s) => !!document.querySelector(s));"
+)
 
-    scored_products = []
-    for product in products:
-        score = _score_product_relevance(search_term, product.get('title', ''))
-        product_copy = dict(product)
-        product_copy['relevance_score'] = score
-        scored_products.append(product_copy)
 
-    max_score = max((p['relevance_score'] for p in scored_products), default=0)
-    if max_score > 0:
-        filtered_products = [p for p in scored_products if p['relevance_score'] == max_score]
-        logger.info(f"Отобрано релевантных карточек: {len(filtered_products)} из {len(products)} (score={max_score})")
+def _build_card_result(product: Dict[str, Any], index: int, prices: Dict[str, str],
+                       unavailable: bool = False) -> Dict[str, Any]:
+    """
+    Данные одной карточки для сравнения цен + лог найденных цен.
+    unavailable=True - карточка явно сообщает, что товара нет в продаже.
+    """
+    price_info = []
+    if prices.get('обычная цена'):
+        price_info.append(f"Обычная: {prices['обычная цена']}")
+    if prices.get('цена для юрлиц'):
+        price_info.append(f"Юрлица: {prices['цена для юрлиц']}")
+
+    if price_info:
+        logger.info(f"     {', '.join(price_info)}")
+    elif unavailable:
+        logger.info("     нет в продаже")
     else:
-        filtered_products = scored_products
-        logger.info("Релевантные токены не найдены, проверяю исходные карточки")
+        logger.info(f"     цены не найдены")
+
+    return {
+        'title': product['title'],
+        'url': product['url'],
+        'index': index,
+        'обычная цена': prices.get('обычная цена', ''),
+        'цена для юрлиц': prices.get('цена для юрлиц', ''),
+        'regular_price_num': parse_price_to_number(prices.get('обычная цена', '')),
+        'vat_price_num': parse_price_to_number(prices.get('цена для юрлиц', '')),
+        'нет в продаже': unavailable and not prices.get('обычная цена'),
+    }
 
-    # Контейнеры для всех найденных цен
-    all_products_data = []
 
-    logger.info(f"Собираю цены с {len(filtered_products)} карточек товаров:")
+def _short_title(title: str) -> str:
+    return title[:45] + "..." if len(title) > 45 else title
+
+
+def _extract_card_prices(driver, price_engine: str = "dom", label: str = "",
+                         card_url: Optional[str] = None) -> Dict[str, str]:
+    """
+    Цены открытой карточки выбранным движком.
+    "dom" ждёт узлы с ценами и читает разметку. "cdp" берёт цену из JSON-ответа
+    с id карточки, как только он пришёл, не дожидаясь отрисовки; DOM читается,
+    только если такой цены нет (или нет цены для юрлиц в сессии с авторизацией).
+    """
+    if price_engine != "cdp":
+        # Ждём только узлы с ценами, а не полную загрузку страницы
+        wait_for_any_selector(driver, CARD_PRICE_SELECTORS, stage="card")
+        prices = extract_prices_fast(driver)
+        log_blocked_requests(driver, label)
+        return prices
+
+    need_vat = bool(getattr(driver, "business_auth", False))
+    watcher = NetworkPriceWatcher(driver, card_url)
+    deadline = time.time() + READY_TIMEOUTS["card"]
+    dom_ready = False
+    while True:
+        prices = watcher.poll()
+        if prices['обычная цена'] and (prices['цена для юрлиц'] or not need_vat):
+            break
+        # Разметка с ценой уже есть, а JSON с ценой карточки нет - дальше ждать нечего
+        if dom_ready or time.time() >= deadline or STOP_PARSING:
+            logger.debug("CDP не дал цену карточки, использую DOM")
+            dom_prices = extract_prices_fast(driver)
+            prices = {
+                'обычная цена': prices['обычная цена'] or dom_prices.get('обычная цена', ''),
+                'цена для юрлиц': prices['цена для юрлиц'] or dom_prices.get('цена для юрлиц', ''),
+            }
+            break
+        try:
+            dom_ready = bool(driver.execute_script(CARD_PRICE_NODES_JS, CARD_PRICE_SELECTORS))
+        except WebDriverException:
+            pass
+        time.sleep(0.2)
+
+    log_blocked_requests(driver, label, events=watcher.events)
+    return prices
+
 
-    # Проходим по отфильтрованным товарам и собираем цены
-    for i, product in enumerate(filtered_products, 1):
+def _collect_cards_sequential(driver, products: List[Dict[str, Any]],
+                              price_engine: str = "dom", http_cards: bool = False,
+                              start: int = 1) -> List[Dict[str, Any]]:
+    """
+    Карточки по очереди в одной вкладке.
+    http_cards=True - сначала обычный HTTP-запрос с cookies браузера,
+    браузер открывает карточку только если в ответе нет цены или это антибот.
+    """
+    all_products_data = []
+
+    for i, product in enumerate(products, start):
         if STOP_PARSING:
             break
 
@@ -674,13 +1120,29 @@ def collect_prices_from_all_products(driver, products: List[Dict[str, Any]], sea
             continue
 
         try:
-            short_title = product['title'][:45] + "..." if len(product['title']) > 45 else product['title']
-            logger.info(f"  {i}. {short_title}")
+            logger.info(f"  {i}. {_short_title(product['title'])}")
+
+            # Карточка уже встречалась в другом запросе - страницу не грузим
+            prices = cached_card_prices(product['url'], mode=_cache_mode(driver))
+            if prices is not None:
+                all_products_data.append(_build_card_result(product, i, prices))
+                continue
 
+            if http_cards:
+                prices = fetch_card_prices(driver, product['url'])
+                if prices:
+                    PRICE_CACHE.put_card(product['url'], prices, _cache_mode(driver))
+                    all_products_data.append(_build_card_result(product, i, prices))
+                    continue
+
+            if price_engine == "cdp":
+                # Сбрасываем события предыдущей страницы
+                drain_network_events(driver)
+
+            note_page(driver)
             for retry in range(2):
                 try:
-                    driver.get(product['url'])
-                    time.sleep(1.2)
+                    throttled_get(driver, product['url'])
                     break
                 except (WebDriverException, TimeoutException):
                     if retry == 1:
@@ -692,44 +1154,138 @@ def collect_prices_from_all_products(driver, products: List[Dict[str, Any]], sea
             if STOP_PARSING:
                 break
 
+            prices = _extract_card_prices(driver, price_engine, f"товар {i}: ", product['url'])
+            PRICE_CACHE.put_card(product['url'], prices, _cache_mode(driver))
+            unavailable = not prices.get('обычная цена') and card_unavailable(driver)
+            all_products_data.append(_build_card_result(product, i, prices, unavailable))
+
+        except StaleElementReferenceException as e:
+            logger.warning(f"     StaleElement ошибка")
+            continue
+        except Exception as e:
+            logger.warning(f"     Ошибка: {e}")
+            continue
+
+    return all_products_data
+
+
+def _collect_cards_in_tabs(driver, products: List[Dict[str, Any]],
+                           timeout: float = CARD_TABS_TIMEOUT, start: int = 1) -> List[Dict[str, Any]]:
+    """
+    Все карточки открываются сразу в отдельных вкладках того же браузера
+    и грузятся параллельно; цены снимаются с каждой вкладки, как только
+    она готова. Время фазы ~ самая медленная карточка, а не сумма.
+    Капча во вкладке запоминается в driver.card_block_reason.
+    """
+    all_products_data = []
+    original_handle = driver.current_window_handle
+    tabs: Dict[str, tuple] = {}
+
+    try:
+        for i, product in enumerate(products, start):
+            if STOP_PARSING:
+                break
+            if not product.get('url'):
+                logger.debug(f"Товар {i}: нет ссылки, пропуск")
+                continue
+            prices = cached_card_prices(product['url'], f"товар {i}: ", _cache_mode(driver))
+            if prices is not None:
+                all_products_data.append(_build_card_result(product, i, prices))
+                continue
+            try:
+                driver.switch_to.new_window('tab')
+                # Навигация через JS не блокирует до полной загрузки страницы;
+                # вкладки грузятся в фоне, поэтому берём только токен без места в лимите загрузок
+                wait_turn(product['url'])
+                driver.execute_script("window.location.href = arguments[0];", product['url'])
+                note_page(driver)
+                tabs[driver.current_window_handle] = (i, product)
+            except WebDriverException as e:
+                logger.warning(f"     Не удалось открыть вкладку для товара {i}: {e}")
+
+        deadline = time.time() + timeout
+        while tabs and not STOP_PARSING:
+            timed_out = time.time() >= deadline
+            for handle in list(tabs):
+                i, product = tabs[handle]
+                try:
+                    driver.switch_to.window(handle)
+                    # Новая вкладка до перехода стоит на about:blank, и она уже 'complete'
+                    ready = driver.execute_script(CARD_TAB_READY_JS, CARD_PRICE_SELECTORS)
+                    if not ready and not timed_out:
+                        continue
+
+                    logger.info(f"  {i}. {_short_title(product['title'])}")
+                    # Капча во вкладке не видна с исходной вкладки - проверяем каждую до закрытия
+                    reason = detect_block(driver)
+                    if reason:
+                        logger.warning(f"🚧 Маркет заблокировал карточку {i}: {reason}")
+                        driver.card_block_reason = reason
+                    elif not ready and not driver.execute_script(CARD_TAB_NAVIGATED_JS):
+                        logger.warning(f"     Вкладка товара {i} так и не перешла на карточку - пропуск")
+                    else:
+                        prices = extract_prices_fast(driver)
+                        PRICE_CACHE.put_card(product['url'], prices, _cache_mode(driver))
+                        unavailable = not prices.get('обычная цена') and card_unavailable(driver)
+                        all_products_data.append(_build_card_result(product, i, prices, unavailable))
+                        log_blocked_requests(driver, f"товар {i}: ")
+                except Exception as e:
+                    logger.warning(f"     Ошибка вкладки товара {i}: {e}")
+
+                tabs.pop(handle, None)
+                try:
+                    driver.close()
+                except WebDriverException:
+                    pass
+
+            if tabs:
+                time.sleep(0.2)
+
+    finally:
+        for handle in list(tabs):
             try:
-                WebDriverWait(driver, 5).until(
-                    lambda d: d.execute_script("return document.readyState") == "complete"
-                )
-            except:
+                driver.switch_to.window(handle)
+                driver.close()
+            except WebDriverException:
                 pass
+        try:
+            driver.switch_to.window(original_handle)
+        except WebDriverException:
+            pass
 
-            prices = extract_prices_fast(driver)
+    all_products_data.sort(key=lambda p: p['index'])
+    return all_products_data
 
-            product_data = {
-                'title': product['title'],
-                'url': product['url'],
-                'index': i,
-                'обычная цена': prices.get('обычная цена', ''),
-                'цена для юрлиц': prices.get('цена для юрлиц', ''),
-                'regular_price_num': parse_price_to_number(prices.get('обычная цена', '')),
-                'vat_price_num': parse_price_to_number(prices.get('цена для юрлиц', ''))
-            }
 
-            all_products_data.append(product_data)
+def score_products(products: List[Dict[str, Any]], search_term: str) -> List[Dict[str, Any]]:
+    """Копии карточек с оценкой релевантности запросу (relevance_score)."""
+    scored_products = []
+    for product in products:
+        score = _score_product_relevance(search_term, product.get('title', ''))
+        product_copy = dict(product)
+        product_copy['relevance_score'] = score
+        scored_products.append(product_copy)
+    return scored_products
 
-            price_info = []
-            if prices.get('обычная цена'):
-                price_info.append(f"Обычная: {prices['обычная цена']}")
-            if prices.get('цена для юрлиц'):
-                price_info.append(f"Юрлица: {prices['цена для юрлиц']}")
 
-            if price_info:
-                logger.info(f"     {', '.join(price_info)}")
-            else:
-                logger.info(f"     цены не найдены")
+def select_relevant_products(products: List[Dict[str, Any]], search_term: str) -> List[Dict[str, Any]]:
+    """Оставляет карточки с максимальной релевантностью запросу."""
+    scored_products = score_products(products, search_term)
 
-        except StaleElementReferenceException as e:
-            logger.warning(f"     StaleElement ошибка")
-            continue
-        except Exception as e:
-            logger.warning(f"     Ошибка: {e}")
-            continue
+    max_score = max((p['relevance_score'] for p in scored_products), default=0)
+    if max_score > 0:
+        filtered_products = [p for p in scored_products if p['relevance_score'] == max_score]
+        logger.info(f"Отобрано релевантных карточек: {len(filtered_products)} из {len(products)} (score={max_score})")
+    else:
+        filtered_products = scored_products
+        logger.info("Релевантные токены не найдены, проверяю исходные карточки")
+
+    return filtered_products
+
+
+def choose_best_product(all_products_data: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Выбирает карточку с наименьшей обычной ценой."""
+    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
 
     if not all_products_data:
         logger.warning("Ни один товар не дал результата")
@@ -762,6 +1318,79 @@ def collect_prices_from_all_products(driver, products: List[Dict[str, Any]], sea
 
     return result
 
+
+def cards_not_available(all_products_data: List[Dict[str, Any]]) -> bool:
+    """Все открытые карточки явно без товара - промах "не найдено" подтверждён."""
+    return bool(all_products_data) and all(p['нет в продаже'] for p in all_products_data)
+
+
+def snippet_price_results(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Данные для сравнения из цен сниппетов выдачи (без цены для юрлиц)."""
+    return [
+        _build_card_result(product, i, {'обычная цена': product['snippet_price'], 'цена для юрлиц': ''})
+        for i, product in enumerate(products, 1)
+        if product.get('snippet_price')
+    ]
+
+
+def collect_prices_from_all_products(driver, products: List[Dict[str, Any]], search_term: str,
+                                     parallel_tabs: bool = False, price_engine: str = "dom",
+                                     http_cards: bool = False,
+                                     snippet_prices: bool = False) -> Optional[Dict[str, str]]:
+    """
+    Собирает цены с релевантных карточек и выбирает наименьшую.
+    parallel_tabs=True - карточки грузятся одновременно в отдельных вкладках.
+    price_engine - "dom" (разметка карточки) или "cdp" (JSON-ответы сети).
+    События сети не привязаны к вкладке, поэтому "cdp" работает в последовательном режиме.
+    http_cards=True - карточки сначала запрашиваются по HTTP (последовательный режим).
+    snippet_prices=True - цены берутся из сниппетов выдачи, карточки открываются,
+    только если ни у одного кандидата цены в выдаче нет.
+    None - цен нет, но и явной отметки "нет в продаже" на карточках нет
+    (карточки не загрузились), такой результат нельзя считать промахом.
+    """
+    result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+
+    if not products:
+        logger.warning("Нет товаров для обработки")
+        return result
+
+    filtered_products = select_relevant_products(products, search_term)
+
+    if snippet_prices:
+        logger.info(f"Беру цены из выдачи ({len(filtered_products)} сниппетов):")
+        all_products_data = snippet_price_results(filtered_products)
+        if all_products_data:
+            return choose_best_product(all_products_data)
+        logger.info("В сниппетах нет цен, открываю карточки")
+
+    # Бюджет: при явном лидере открываем только его, остальные - резерв
+    primary, reserve = CANDIDATE_BUDGET.plan(score_products(products, search_term), search_term)
+    baseline = len(filtered_products)
+
+    all_products_data = _collect_cards(driver, primary, parallel_tabs, price_engine, http_cards)
+    loaded = len(primary)
+    if reserve and not STOP_PARSING and not any(p['regular_price_num'] != float('inf') for p in all_products_data):
+        logger.info(f"У выбранных карточек нет цены, открываю резерв ({len(reserve)})")
+        all_products_data += _collect_cards(driver, reserve, parallel_tabs, price_engine, http_cards,
+                                            start=len(primary) + 1)
+        loaded += len(reserve)
+    CANDIDATE_BUDGET.record(baseline, loaded)
+
+    result = choose_best_product(all_products_data)
+    if not any(result.values()) and not cards_not_available(all_products_data):
+        return None
+    return result
+
+
+def _collect_cards(driver, products: List[Dict[str, Any]], parallel_tabs: bool, price_engine: str,
+                   http_cards: bool, start: int = 1) -> List[Dict[str, Any]]:
+    """Цены карточек выбранным способом (вкладки или по очереди)."""
+    if parallel_tabs and not http_cards and len(products) > 1:
+        logger.info(f"Собираю цены с {len(products)} карточек товаров (параллельные вкладки):")
+        return _collect_cards_in_tabs(driver, products, start=start)
+    logger.info(f"Собираю цены с {len(products)} карточек товаров:")
+    return _collect_cards_sequential(driver, products, price_engine, http_cards, start=start)
+
 def smart_search_input(driver, search_term: str, max_retries: int = 3) -> bool:
     """Надёжный поиск с fallback на прямой переход к странице результатов."""
     normalized_term = _normalize_search_term(search_term)
@@ -803,9 +1432,7 @@ def update_search_query(driver, search_term: str, max_retries: int = 3) -> bool:
             return False
 
         try:
-            WebDriverWait(driver, 5).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
+            wait_for_any_selector(driver, SEARCH_INPUT_SELECTORS, stage="home")
 
             searchbox = None
             for selector in search_selectors:
@@ -821,8 +1448,7 @@ def update_search_query(driver, search_term: str, max_retries: int = 3) -> bool:
             if not searchbox:
                 logger.warning(f"Попытка {retry + 1}: поле поиска не найдено на странице результатов")
                 if retry < max_retries - 1:
-                    driver.get("https://market.yandex.ru")
-                    time.sleep(1)
+                    throttled_get(driver, "https://market.yandex.ru")
                     continue
                 return False
 
@@ -840,6 +1466,8 @@ def update_search_query(driver, search_term: str, max_retries: int = 3) -> bool:
                 searchbox,
                 search_term,
             )
+            # Отправка формы - такой же переход на маркет, как driver.get
+            wait_turn(SEARCH_URL_TEMPLATE)
             searchbox.send_keys(Keys.RETURN)
 
             WebDriverWait(driver, 8).until(lambda d: 'search' in (d.current_url or ''))
@@ -875,9 +1503,7 @@ def perform_new_search(driver, search_term: str, max_retries: int = 3) -> bool:
             return False
 
         try:
-            WebDriverWait(driver, 5).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
+            wait_for_any_selector(driver, SEARCH_INPUT_SELECTORS, stage="home")
 
             searchbox = None
             for selector_type, selector in selectors:
@@ -892,8 +1518,7 @@ def perform_new_search(driver, search_term: str, max_retries: int = 3) -> bool:
             if not searchbox:
                 logger.warning(f"Попытка {retry + 1}: поле поиска не найдено на главной")
                 if retry < max_retries - 1:
-                    driver.get("https://market.yandex.ru")
-                    time.sleep(1)
+                    throttled_get(driver, "https://market.yandex.ru")
                     continue
                 return False
 
@@ -911,6 +1536,8 @@ def perform_new_search(driver, search_term: str, max_retries: int = 3) -> bool:
                 searchbox,
                 search_term,
             )
+            # Отправка формы - такой же переход на маркет, как driver.get
+            wait_turn(SEARCH_URL_TEMPLATE)
             searchbox.send_keys(Keys.RETURN)
 
             WebDriverWait(driver, 8).until(lambda d: 'search' in (d.current_url or ''))
@@ -931,12 +1558,212 @@ def perform_new_search(driver, search_term: str, max_retries: int = 3) -> bool:
 
     return False
 
+def prepare_market_session(driver, use_business_auth: bool = True) -> bool:
+    """
+    Открывает маркет и один раз подгружает cookies в свежий браузер.
+    Возвращает, работает ли браузер с авторизацией.
+    """
+    throttled_get(driver, "https://market.yandex.ru/")
+    wait_for_any_selector(driver, SEARCH_INPUT_SELECTORS, stage="home")
+
+    if not use_business_auth or STOP_PARSING:
+        return False
+    # Профиль из шаблона уже авторизован - но только если cookies пережили копирование
+    if getattr(driver, "auth_from_template", False):
+        if template_auth_ok(driver):
+            return True
+        logger.warning("Профиль из шаблона без авторизации, загружаю cookies в браузер")
+    return load_cookies_for_auth(driver)
+
+
+def create_market_driver(headless: bool = True, driver_path: Optional[str] = None,
+                         use_business_auth: bool = True, price_engine: str = "dom"):
+    """Создаёт браузер с открытой сессией маркета (для get_prices и пула)."""
+    driver = create_driver(headless=headless, driver_path=driver_path, use_auth=use_business_auth,
+                           capture_network=price_engine == "cdp")
+    # По нему кэш отличает цены с авторизацией от цен без неё
+    driver.business_auth = use_business_auth
+    try:
+        driver.business_auth = prepare_market_session(driver, use_business_auth)
+    except Exception:
+        close_market_driver(driver)
+        raise
+    return driver
+
+
+def _cache_mode(driver) -> str:
+    """Режим кэша цен для браузера (см. price_cache.PRICE_MODE_*)."""
+    return price_mode(getattr(driver, "business_auth", False))
+
+
+def close_market_driver(driver) -> None:
+    """Закрывает браузер и отдаёт его профиль фоновому уборщику."""
+    # Отслеживаем профиль и процессы текущего драйвера для точечной очистки
+    current_profile_path = getattr(driver, "profile_path", None)
+    owner_pids = collect_driver_pids(driver)
+
+    try:
+        driver.quit()
+    except:
+        pass
+
+    # Удаление профиля - в фоне, после выхода процессов браузера
+    if current_profile_path:
+        PROFILE_REAPER.submit(current_profile_path, owner_pids)
+
+
+def create_driver_pool(size: int = 1, headless: bool = True, driver_path: Optional[str] = None,
+                       use_business_auth: bool = True, price_engine: str = "dom") -> DriverPool:
+    """Пул браузеров маркета на весь прогон parse_tender_excel."""
+    return DriverPool(
+        factory=lambda: create_market_driver(headless, driver_path, use_business_auth, price_engine),
+        size=size,
+        finalizer=close_market_driver,
+        health_check=recycle_reason,
+    )
+
+
+def _search_market_products(driver, product_name: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Поиск товара на маркете и кандидаты из выдачи.
+    None - поиск не выполнен, [] - выдача пустая.
+    """
+    # Переход на маркет (только если не на странице поиска)
+    if 'market.yandex.ru' not in driver.current_url:
+        try:
+            throttled_get(driver, "https://market.yandex.ru")
+        except Exception as e:
+            logger.error(f"Ошибка перехода на маркет: {e}")
+            return None
+
+    if STOP_PARSING:
+        return None
+
+    # УЛУЧШЕННЫЙ поиск с определением состояния страницы
+    search_success = smart_search_input(driver, product_name)
+    note_page(driver)
+    if not search_success:
+        logger.error("Не удалось выполнить поиск")
+        return None
+
+    if STOP_PARSING:
+        return None
+
+    # Извлечение товаров (как только появились сниппеты выдачи)
+    if wait_for_any_selector(driver, PRODUCT_LINK_SELECTORS, stage="search"):
+        products = extract_products_smart(driver)
+        if products:
+            return products
+
+    # Пустая выдача - только при явной отметке, иначе страница не догрузилась или сломалась
+    if search_results_empty(driver):
+        return []
+    logger.warning("Выдача не загрузилась, промах не сохраняю")
+    return None
+
+
+def search_candidates(driver, product_name: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Этап поиска: свежая выдача маркета с записью в кэш поиска.
+    None - поиск не удался или маркет заблокировал запрос,
+    [] - выдача явно пустая, товар не найден (промах сохраняется в кэш).
+    """
+    # Маркет блокирует - ждём конца паузы предохранителя, а не тратим браузер
+    if not CIRCUIT_BREAKERS["yandex"].wait(lambda: STOP_PARSING):
+        return None
+
+    products = _search_market_products(driver, product_name)
+    if STOP_PARSING:
+        return None
+    if not products:
+        # Капча выглядит как пустая выдача или неудачный поиск - сначала проверяем страницу
+        reason = detect_block(driver)
+        if reason:
+            logger.warning(f"🚧 Маркет заблокировал поиск: {reason}")
+            note_result(driver, False)
+            remember_miss("yandex", product_name, MISS_BLOCKED)
+            report_block("yandex", driver, reason)
+            return None
+    if products is None:
+        note_result(driver, False)
+        return None
+
+    CIRCUIT_BREAKERS["yandex"].record_success()
+    if not products:
+        logger.warning("Товары не найдены")
+        remember_miss("yandex", product_name, MISS_NOT_FOUND)
+        return products
+
+    PRICE_CACHE.put_candidates("yandex", product_name, products)
+    return products
+
+
+def price_candidates(driver, product_name: str, products: List[Dict[str, Any]],
+                     parallel_tabs: bool = False, price_engine: str = "dom",
+                     http_cards: bool = False, snippet_prices: bool = False) -> Optional[Dict[str, str]]:
+    """
+    Этап карточек: лучшая цена среди кандидатов с записью результата или промаха в кэш.
+    None - карточки не загрузились (не блокировка и не подтверждённое отсутствие товара).
+    """
+    empty = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+    if not CIRCUIT_BREAKERS["yandex"].wait(lambda: STOP_PARSING):
+        return empty
+
+    driver.card_block_reason = None
+    result = collect_prices_from_all_products(driver, products, product_name,
+                                              parallel_tabs=parallel_tabs,
+                                              price_engine=price_engine,
+                                              http_cards=http_cards,
+                                              snippet_prices=snippet_prices)
+    if STOP_PARSING:
+        return result or empty
+
+    if result and any(result.values()):
+        note_result(driver, True)
+        CIRCUIT_BREAKERS["yandex"].record_success()
+        # Цены из сниппетов неполные (без захода в карточку) - в общий кэш не пишем
+        if not snippet_prices:
+            PRICE_CACHE.put("yandex", product_name, result, _cache_mode(driver))
+    else:
+        reason = detect_block(driver) or driver.card_block_reason
+        if reason:
+            logger.warning(f"🚧 Маркет заблокировал карточки: {reason}")
+            note_result(driver, False)
+            remember_miss("yandex", product_name, MISS_BLOCKED)
+            report_block("yandex", driver, reason)
+            return empty
+        if result is None:
+            logger.warning("Карточки не загрузились, промах не сохраняю")
+            note_result(driver, False)
+            return None
+        note_result(driver, True)
+        CIRCUIT_BREAKERS["yandex"].record_success()
+        remember_miss("yandex", product_name, MISS_NOT_FOUND)
+    return result
+
+
 def get_prices(product_name: str, headless: bool = True, driver_path: Optional[str] = None,
-              timeout: int = 15, use_business_auth: bool = True) -> Dict[str, str]:
-    """Главная функция получения цен с выбором наименьшей из 5 карточек"""
+              timeout: int = 15, use_business_auth: bool = True, driver=None,
+              parallel_tabs: bool = False, price_engine: str = "dom",
+              http_cards: bool = False, snippet_prices: bool = False,
+              raise_errors: bool = False) -> Dict[str, str]:
+    """
+    Главная функция получения цен с выбором наименьшей из 5 карточек.
+
+    Если передан driver (например, из DriverPool), браузер используется как есть
+    и не закрывается: сессия и cookies остаются для следующих товаров.
+    parallel_tabs=True - карточки открываются одновременно во вкладках.
+    price_engine - "dom" или "cdp" (цены из сетевых ответов страницы).
+    http_cards=True - карточки по HTTP с сессией браузера, браузер - только как fallback.
+    snippet_prices=True - цена из сниппетов выдачи без захода в карточки (без цены для юрлиц).
+    raise_errors=True - ошибка обработки не превращается молча в пустой результат,
+    а поднимается как FetchFailed (для AIMD-контроллера параллельности).
+    """
     result = {"цена": "", "цена для юрлиц": "", "ссылка": ""}
-    driver = None
-    current_profile_path = None
+    owns_driver = driver is None
+
+    if price_engine not in PRICE_ENGINES:
+        raise ValueError(f"price_engine должен быть одним из {PRICE_ENGINES}")
 
     # Совместимость со старым позиционным вызовом: get_prices(name, headless, timeout, use_business_auth)
     if isinstance(driver_path, (int, float)):
@@ -948,83 +1775,108 @@ def get_prices(product_name: str, headless: bool = True, driver_path: Optional[s
     if STOP_PARSING:
         return result
 
-    try:
-        driver = create_driver(headless=headless, driver_path=driver_path, use_auth=use_business_auth)
-
-        driver.get("https://market.yandex.ru/")
-        time.sleep(0.5)
-
-        # Отслеживаем профиль текущего драйвера для точечной очистки
-        current_profile_path = getattr(driver, "profile_path", None)
+    # Постоянный кэш прошлых запусков - до запуска браузера
+    cached = cached_prices("yandex", product_name, price_mode(use_business_auth))
+    if cached is not None:
+        return cached
+    # Недавно не нашли или упёрлись в блокировку - не тратим браузер
+    if cached_miss("yandex", product_name):
+        return result
 
-        # Загрузка cookies для авторизации и поиска
-        if use_business_auth and not STOP_PARSING:
-            load_cookies_for_auth(driver)
+    try:
+        if owns_driver:
+            driver = create_market_driver(headless=headless, driver_path=driver_path,
+                                          use_business_auth=use_business_auth,
+                                          price_engine=price_engine)
 
         if STOP_PARSING:
             return result
 
-        # Переход на маркет (только если не на странице поиска)
-        current_url = driver.current_url
-        if 'market.yandex.ru' not in current_url:
-            try:
-                driver.get("https://market.yandex.ru")
-                time.sleep(0.8)
-            except Exception as e:
-                logger.error(f"Ошибка перехода на маркет: {e}")
+        # Кандидаты из кэша поиска: выдачу не открываем, сразу идём в карточки
+        products = cached_candidates("yandex", product_name)
+        from_search_cache = products is not None
+        if not from_search_cache:
+            products = search_candidates(driver, product_name)
+            if products is None and raise_errors and not STOP_PARSING \
+                    and PRICE_CACHE.get_miss("yandex", product_name) != MISS_BLOCKED:
+                raise FetchFailed("поиск не удался")
+            if not products:
                 return result
 
         if STOP_PARSING:
             return result
 
-        # УЛУЧШЕННЫЙ поиск с определением состояния страницы
-        search_success = smart_search_input(driver, product_name)
-        if not search_success:
-            logger.error("Не удалось выполнить поиск")
-            return result
-
-        if STOP_PARSING:
-            return result
-
-        # Извлечение товаров
-        products = extract_products_smart(driver)
-        if not products:
-            logger.warning("Товары не найдены")
-            return result
-
-        if STOP_PARSING:
-            return result
-
         # Собираем цены со ВСЕХ товаров и выбираем НАИМЕНЬШУЮ
-        result = collect_prices_from_all_products(driver, products, product_name)
-
+        priced = price_candidates(driver, product_name, products, parallel_tabs=parallel_tabs,
+                                  price_engine=price_engine, http_cards=http_cards,
+                                  snippet_prices=snippet_prices)
+        if priced is not None:
+            result = priced
+
+        if from_search_cache and not result.get('цена') and not STOP_PARSING:
+            # Карточки из кэша устарели - повторяем поиск
+            logger.info("Кандидаты из кэша поиска без цен, ищу заново")
+            PRICE_CACHE.forget_candidates("yandex", product_name)
+            products = search_candidates(driver, product_name)
+            if products is None:
+                if raise_errors and not STOP_PARSING \
+                        and PRICE_CACHE.get_miss("yandex", product_name) != MISS_BLOCKED:
+                    raise FetchFailed("поиск не удался")
+                return result
+            if not products:
+                return result
+            priced = price_candidates(driver, product_name, products, parallel_tabs=parallel_tabs,
+                                      price_engine=price_engine, http_cards=http_cards,
+                                      snippet_prices=snippet_prices)
+            if priced is not None:
+                result = priced
+
+        if priced is None and raise_errors and not STOP_PARSING:
+            raise FetchFailed("карточки не загрузились")
         return result
 
     except Exception as e:
         logger.error(f"Ошибка обработки товара {product_name[:30]}...: {e}")
+        if driver is not None:
+            note_result(driver, False)
+        if raise_errors:
+            raise FetchFailed(str(e)) from e
         return result
 
     finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
-
-        # Очистка профиля по завершении
-        if current_profile_path:
-            success = cleanup_single_profile(current_profile_path)
-            if success:
-                CREATED_PROFILES.discard(current_profile_path)
-
-def _make_product_cache_key(product_name: str) -> str:
-    """Ключ кэша для повторяющихся наименований товаров."""
-    return re.sub(r"\s+", " ", str(product_name or "")).strip().lower()
+        if owns_driver and driver:
+            close_market_driver(driver)
 
 def parse_tender_excel(input_file: str, output_file: str, headless: bool = True,
                       workers: int = 1, driver_path: Optional[str] = None,
-                      auto_save: bool = True, use_business_auth: bool = False) -> pd.DataFrame:
-    """ОСНОВНАЯ функция парсинга с автосохранением и ТЕНДЕРНЫМ ФОРМАТОМ"""
+                      auto_save: bool = True, use_business_auth: bool = False,
+                      pool_size: int = 1, parallel_tabs: bool = False,
+                      price_engine: str = "dom", http_cards: bool = False,
+                      engine: str = "selenium", max_pages: int = 8,
+                      scheduler: str = "rows", search_workers: int = 1,
+                      card_workers: int = 2, snippet_prices: bool = False,
+                      resume: bool = False, adaptive_workers: bool = True,
+                      min_workers: int = 1) -> pd.DataFrame:
+    """
+    ОСНОВНАЯ функция парсинга с автосохранением и ТЕНДЕРНЫМ ФОРМАТОМ.
+
+    pool_size - сколько браузеров держать открытыми на весь прогон
+    (браузеры переиспользуются между строками тендера).
+    parallel_tabs - грузить карточки товара одновременно во вкладках.
+    price_engine - "dom" или "cdp": откуда брать цены карточки.
+    http_cards - грузить карточки по HTTP, браузер только как запасной вариант.
+    engine - "selenium" (потоки и пул драйверов) или "async" (один браузер,
+    до max_pages вкладок из одного event loop, см. cdp_engine).
+    scheduler - "rows" (воркер ведёт товар от поиска до карточек) или "pipeline"
+    (search_workers браузеров только ищут, card_workers - только открывают карточки).
+    snippet_prices - цены из сниппетов выдачи без захода в карточки; работает только
+    без авторизации, когда цена для юрлиц не нужна.
+    resume - продолжить прерванный прогон: строки из журнала (см. run_journal)
+    восстанавливаются, парсятся только незавершённые.
+    adaptive_workers - сколько из workers браузеров работают одновременно, решает
+    AIMD-контроллер (от min_workers, рост при здоровых товарах, резкое снижение
+    при блокировках и зависаниях); False - всегда workers.
+    """
     global STOP_PARSING, CURRENT_DATAFRAME, CURRENT_OUTPUT_FILE, CURRENT_INPUT_FILE
 
     # Настройка автосохранения при завершении
@@ -1044,73 +1896,286 @@ def parse_tender_excel(input_file: str, output_file: str, headless: bool = True,
         'наименование': items['name'],
         'цена': '',
         'цена для юрлиц': '',
-        'ссылка': ''
+        'ссылка': '',
+        # Отметка строки без результата (БЛОКИРОВКА); в ячейки цен не пишется
+        'статус': ''
     })
 
     CURRENT_DATAFRAME = df  # Для автосохранения
 
     effective_workers = max(1, int(workers or 1))
-    if effective_workers != 1:
-        logger.warning("Параметр workers сейчас не используется: обработка выполняется последовательно")
 
     auth_text = "с авторизацией" if use_business_auth else "без авторизации"
     logger.info(f"Начинаю обработку {len(df)} товаров {auth_text}")
     logger.info("🔄 Автосохранение при принудительном завершении АКТИВНО")
     logger.info("📋 РЕЗУЛЬТАТ: тендерная таблица с колонкой 'Яндекс Маркет'")
     logger.info("Режим: поиск наименьшей цены среди 5 карточек")
+    logger.info(f"🧵 Параллельных воркеров: {effective_workers}")
+
+    total = len(df)
+    df_lock = threading.Lock()
+    completed_count = 0
+
+    # План работ: одинаковые товары (с точностью до регистра, порядка слов и единиц)
+    # парсятся один раз, результат раскладывается по всем их строкам
+    plan = build_work_plan(df['наименование'])
+    plan.log_summary()
+    CANDIDATE_BUDGET.reset_stats()
+    RATE_LIMITERS["yandex"].reset_stats()
+    CIRCUIT_BREAKERS["yandex"].reset()
+
+    # Адаптивная параллельность: потоков effective_workers, работают одновременно controller.limit
+    controller = CONCURRENCY_CONTROLLERS["yandex"]
+    if adaptive_workers and effective_workers > 1:
+        low = min(max(1, int(min_workers or 1)), effective_workers)
+        controller.reset(low, effective_workers)
+        logger.info(f"🎛️ Адаптивная параллельность: от {low} до {effective_workers} браузеров")
+    else:
+        controller.reset(effective_workers, effective_workers)
+
+    # Журнал готовых строк: каждая строка сразу на диске, после падения можно продолжить
+    journal = RunJournal(journal_path_for(input_file, "yandex"), tender_fingerprint(df['наименование']))
+    restored: Dict[int, Dict[str, str]] = {}
+    if resume:
+        names = {row: name for row, name in enumerate(df['наименование'], start=1)}
+        restored = restored_rows(journal, names)
+        for idx, prices in restored.items():
+            df.at[idx - 1, 'цена'] = prices['цена']
+            df.at[idx - 1, 'цена для юрлиц'] = prices['цена для юрлиц']
+            df.at[idx - 1, 'ссылка'] = prices['ссылка']
+        completed_count = len(restored)
+        logger.info(f"⏯️ Продолжение прогона: из журнала восстановлено строк {len(restored)} из {total}")
+    journal.open(resume=resume)
+
+    # В работу идут только товары, у которых остались незавершённые строки
+    pending_items: List[WorkItem] = []
+    for item in plan.items:
+        item.rows = [idx for idx in item.rows if idx not in restored]
+        if item.rows:
+            pending_items.append(item)
+
+    # Один раз собираем авторизованный профиль вместо загрузки cookies в каждый браузер
+    if use_business_auth:
+        try:
+            bake_auth_profile_template(headless=headless, driver_path=driver_path)
+        except Exception as e:
+            logger.warning(f"Шаблон профиля не создан, cookies будут загружаться в каждый браузер: {e}")
+
+    # Цена для юрлиц есть только в карточке - со сниппетами её не получить
+    if snippet_prices and use_business_auth:
+        logger.info("Цены из выдачи отключены: с авторизацией нужна цена для юрлиц из карточек")
+        snippet_prices = False
+    elif snippet_prices:
+        logger.info("⚡ Цены из сниппетов выдачи: карточки открываются только без цены в выдаче")
+
+    use_async_engine = engine == "async"
+    use_pipeline = not use_async_engine and scheduler == "pipeline"
+
+    # Каждому воркеру - свой изолированный браузер
+    pool = None
+    search_pool = None
+    if use_pipeline:
+        # Конвейер: отдельные браузеры для поиска и для карточек
+        search_pool = create_driver_pool(search_workers, headless, driver_path, use_business_auth, price_engine)
+        pool = create_driver_pool(card_workers, headless, driver_path, use_business_auth, price_engine)
+        logger.info(f"⚙️ Конвейер: браузеров поиска {search_pool.size}, браузеров карточек {pool.size}")
+    elif not use_async_engine:
+        pool = create_driver_pool(max(pool_size, effective_workers), headless, driver_path, use_business_auth,
+                                  price_engine)
+        logger.info(f"🧩 Пул браузеров: до {pool.size} шт. на весь прогон")
+
+    # Общая очередь уникальных товаров
+    work_queue: "queue.Queue[WorkItem]" = queue.Queue()
+    for item in pending_items:
+        work_queue.put(item)
+
+    def fetch_prices(product_name: str) -> Dict[str, str]:
+        """Цены товара: постоянный кэш, затем браузер из пула."""
+        # Товар есть в постоянном кэше - браузер из пула не нужен
+        prices = cached_prices("yandex", product_name, price_mode(use_business_auth))
+        if prices is not None:
+            return prices
+        if cached_miss("yandex", product_name):
+            return {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+
+        def in_browser() -> Dict[str, str]:
+            with pool.borrow() as driver:
+                return get_prices(product_name, headless, driver_path, 20, use_business_auth,
+                                  driver=driver, parallel_tabs=parallel_tabs,
+                                  price_engine=price_engine, http_cards=http_cards,
+                                  snippet_prices=snippet_prices, raise_errors=True)
+
+        # Браузер берётся из пула только когда контроллер разрешил ещё один одновременный товар
+        return controller.call(in_browser, product_name, should_stop=lambda: STOP_PARSING)
+
+    def item_blocked(product_name: str, prices: Dict[str, str]) -> bool:
+        """Пустой результат из-за капчи (промах записан под именем товара из плана, а не строки)."""
+        return not any(prices.values()) and PRICE_CACHE.get_miss("yandex", product_name) == MISS_BLOCKED
+
+    def store_row(idx: int, prices: Dict[str, str], blocked: bool = False) -> None:
+        row_idx = idx - 1
+        name = df.at[row_idx, 'наименование']
+        # Пустой результат из-за капчи - это не "не найдено": строку отмечаем и повторим при --resume
+        if blocked:
+            with df_lock:
+                df.at[row_idx, 'статус'] = BLOCKED_MARK
+            journal.record(idx, name, prices, status=STATUS_BLOCKED)
+            logger.info(f"Результат {idx}/{total}: 🚧 маркет заблокировал запрос")
+            return
+
+        with df_lock:
+            df.at[row_idx, 'статус'] = ''
+            df.at[row_idx, 'цена'] = prices.get('цена', '')
+            df.at[row_idx, 'цена для юрлиц'] = prices.get('цена для юрлиц', '')
+            df.at[row_idx, 'ссылка'] = prices.get('ссылка', '')
+        journal.record(idx, name, prices)
+
+        # Лог результата
+        price_summary = []
+        if prices.get('цена'):
+            price_summary.append(f"Лучшая цена: {prices['цена'][:15]}")
+        if prices.get('цена для юрлиц'):
+            price_summary.append(f"Для юрлиц: {prices['цена для юрлиц'][:15]}")
+
+        if price_summary:
+            logger.info(f"Результат {idx}/{total}: {', '.join(price_summary)}")
+        else:
+            logger.info(f"Результат {idx}/{total}: цены не найдены")
 
-    cache: Dict[str, Dict[str, str]] = {}
+    def process_item(number: int, item: WorkItem) -> None:
+        rows_text = f" (строк: {len(item.rows)})" if len(item.rows) > 1 else ""
+        try:
+            logger.info(f"Обработка: {number}/{len(pending_items)} - {item.name[:40]}...{rows_text}")
+            prices = fetch_prices(item.name)
+        except Exception as e:
+            logger.error(f"Ошибка товара {item.rows[0]}: {e}")
+            prices = None
+        finish_item(item, prices)
+
+    def finish_item(item: WorkItem, prices: Optional[Dict[str, str]]) -> None:
+        """Раскладывает результат товара по всем его строкам (None - ошибка)."""
+        blocked = prices is not None and item_blocked(item.name, prices)
+        for idx in item.rows:
+            if prices is None:
+                with df_lock:
+                    df.at[idx - 1, 'цена'] = "ОШИБКА"
+                    df.at[idx - 1, 'цена для юрлиц'] = "ОШИБКА"
+                journal.record(idx, df.at[idx - 1, 'наименование'], None)
+            else:
+                store_row(idx, prices, blocked)
+            row_done()
+
+    def row_done() -> None:
+        nonlocal completed_count
+        # Автосохранение каждые 3 готовых товара В ТЕНДЕРНОМ ФОРМАТЕ
+        with df_lock:
+            completed_count += 1
+            done = completed_count
+            if auto_save and done % 3 == 0:
+                try:
+                    save_results_into_tender_format(input_file, output_file, df)
+                    logger.info(f"Автосохранение тендера: {done}/{total}")
+                except Exception as e:
+                    logger.warning(f"Ошибка автосохранения: {e}")
 
-    try:
-        for idx, row in enumerate(df.itertuples(index=False), start=1):
-            if STOP_PARSING:
-                logger.info("Парсинг остановлен")
-                break
+    taken = itertools.count(1)
 
+    def worker_loop(worker_id: int) -> None:
+        while not STOP_PARSING:
             try:
-                product_name = row.наименование
-                logger.info(f"Обработка: {idx}/{len(df)} - {product_name[:40]}...")
-
-                cache_key = _make_product_cache_key(product_name)
-                if cache_key in cache:
-                    prices = cache[cache_key]
-                    logger.info(f"Повтор товара, использую кэш: {product_name[:40]}...")
-                else:
-                    prices = get_prices(product_name, headless, driver_path, 20, use_business_auth)
-                    if any(prices.get(k) for k in ("цена", "цена для юрлиц", "ссылка")):
-                        cache[cache_key] = prices.copy()
-
-                row_idx = idx - 1
-                df.at[row_idx, 'цена'] = prices.get('цена', '')
-                df.at[row_idx, 'цена для юрлиц'] = prices.get('цена для юрлиц', '')
-                df.at[row_idx, 'ссылка'] = prices.get('ссылка', '')
-
-                # Лог результата
-                price_summary = []
-                if prices.get('цена'):
-                    price_summary.append(f"Лучшая цена: {prices['цена'][:15]}")
-                if prices.get('цена для юрлиц'):
-                    price_summary.append(f"Для юрлиц: {prices['цена для юрлиц'][:15]}")
-
-                if price_summary:
-                    logger.info(f"Результат {idx}/{len(df)}: {', '.join(price_summary)}")
-                else:
-                    logger.info(f"Результат {idx}/{len(df)}: цены не найдены")
-
-                # Автосохранение каждые 3 товара В ТЕНДЕРНОМ ФОРМАТЕ
-                if auto_save and idx % 3 == 0:
-                    try:
-                        save_results_into_tender_format(input_file, output_file, df)
-                        logger.info(f"Автосохранение тендера: {idx}/{len(df)}")
-                    except Exception as e:
-                        logger.warning(f"Ошибка автосохранения: {e}")
-
-            except Exception as e:
-                logger.error(f"Ошибка товара {idx}: {e}")
-                df.at[idx - 1, 'цена'] = "ОШИБКА"
-                df.at[idx - 1, 'цена для юрлиц'] = "ОШИБКА"
+                item = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            process_item(next(taken), item)
+
+        logger.info(f"Парсинг остановлен (воркер {worker_id})")
+
+    def run_async_engine() -> None:
+        # Импорт здесь: cdp_engine сам импортирует tender_parser
+        import cdp_engine
+
+        items_by_name = {item.name: item for item in pending_items}
+
+        def on_result(product_name: str, prices: Optional[Dict[str, str]]) -> None:
+            finish_item(items_by_name[product_name], prices)
+
+        cdp_engine.run_batch(list(items_by_name), max_pages=max_pages, headless=headless,
+                             use_business_auth=use_business_auth, on_result=on_result,
+                             snippet_prices=snippet_prices)
+
+    def run_pipeline() -> None:
+        def search_stage(item: WorkItem):
+            prices = cached_prices("yandex", item.name, price_mode(use_business_auth))
+            if prices is not None:
+                return None, prices
+            if cached_miss("yandex", item.name):
+                return None, {"цена": "", "цена для юрлиц": "", "ссылка": ""}
+
+            logger.info(f"Поиск: {item.name[:40]}...")
+            products = cached_candidates("yandex", item.name)
+            if products is None:
+                with search_pool.borrow() as driver:
+                    products = search_candidates(driver, item.name)
+            if products is None and not STOP_PARSING \
+                    and PRICE_CACHE.get_miss("yandex", item.name) != MISS_BLOCKED:
+                # Сбой поиска - не "не найдено": строка уйдёт в ошибки и повторится при --resume
+                raise FetchFailed("поиск не удался")
+            return products, None
+
+        def card_stage(item: WorkItem, products: List[Dict[str, Any]]) -> Dict[str, str]:
+            logger.info(f"Карточки: {item.name[:40]}...")
+            with pool.borrow() as driver:
+                prices = price_candidates(driver, item.name, products, parallel_tabs=parallel_tabs,
+                                          price_engine=price_engine, http_cards=http_cards,
+                                          snippet_prices=snippet_prices)
+            if prices is None:
+                PRICE_CACHE.forget_candidates("yandex", item.name)
+                raise FetchFailed("карточки не загрузились")
+            if not prices.get('цена'):
+                # Кандидаты могли устареть - в следующий раз искать заново
+                PRICE_CACHE.forget_candidates("yandex", item.name)
+            return prices
+
+        pipeline = PipelineScheduler(search_stage, card_stage, finish_item,
+                                     search_workers=search_workers, card_workers=card_workers,
+                                     should_stop=lambda: STOP_PARSING)
+        try:
+            pipeline.run(pending_items)
+        finally:
+            pipeline.log_stats()
+
+    try:
+        if use_async_engine:
+            run_async_engine()
+        elif use_pipeline:
+            run_pipeline()
+        elif effective_workers == 1:
+            worker_loop(1)
+        else:
+            threads = [
+                threading.Thread(target=worker_loop, args=(worker_id,),
+                                 name=f"tender-worker-{worker_id}", daemon=True)
+                for worker_id in range(1, effective_workers + 1)
+            ]
+            for thread in threads:
+                thread.start()
+            # join с таймаутом, чтобы главный поток продолжал принимать сигналы
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
 
     finally:
+        journal.close()
+        CANDIDATE_BUDGET.log_stats()
+        log_rate_stats()
+        CIRCUIT_BREAKERS["yandex"].log_stats()
+        controller.log_stats()
+        if pool is not None:
+            if pool.recycled:
+                logger.info(f"♻️ Браузеров перезапущено за прогон: {pool.recycled}")
+            pool.close()
+        if search_pool is not None:
+            search_pool.close()
         cleanup_profiles()
         CURRENT_DATAFRAME = None  # Очищаем глобальную переменную
 
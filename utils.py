@@ -7,6 +7,8 @@ from openpyxl.cell.cell import MergedCell
 import os
 import shutil
 
+from block_guard import BLOCKED_MARK
+
 from pathlib import Path
 import sys
 
@@ -211,6 +213,9 @@ def save_results_into_tender_format(original_path: str, output_path: str,
     - КРАСНЫЙ: наша цена > победителя (разница < 0)
     - ЗЕЛЁНЫЙ: наша цена < победителя на >10% (разница > 10%)
     - ЖЁЛТЫЙ: наша цена < победителя на 1-10% (разница 1-10%)
+
+    Товар со статусом BLOCKED_MARK (маркет показал капчу) получает эту отметку
+    вместо цены, разница для него не считается.
     """
     print(f"📋 Создаю колонки для '{column_name}' в тендерной таблице...")
 
@@ -268,6 +273,7 @@ def save_results_into_tender_format(original_path: str, output_path: str,
         # Заполняем данные
         filled_count = 0
         link_count = 0
+        blocked_count = 0
 
         for idx, (_, item) in enumerate(df.iterrows()):
             position = idx + 1
@@ -284,6 +290,23 @@ def save_results_into_tender_format(original_path: str, output_path: str,
                 print(f"⚠️ Не найдена строка товара #{position}")
                 continue
 
+            # Блокировка - не "нет цены": пишем отметку, разницу не считаем
+            if item.get('статус') == BLOCKED_MARK:
+                c = ws.cell(base_row + 1, marketplace_col)
+                if not isinstance(c, MergedCell):
+                    c.value = BLOCKED_MARK
+                    c.alignment = Alignment(horizontal='right')
+                diff_cell = ws.cell(base_row + 1, difference_col)
+                if not isinstance(diff_cell, MergedCell):
+                    diff_cell.value = None
+                    diff_cell.fill = PatternFill(fill_type=None)
+                blocked_count += 1
+                continue
+            # Отметка блокировки с прошлого прогона в уже существующем файле
+            c = ws.cell(base_row + 1, marketplace_col)
+            if not isinstance(c, MergedCell) and c.value == BLOCKED_MARK:
+                c.value = None
+
             price = item.get('цена', '')
             price_vat = item.get('цена для юрлиц', '')
             link = item.get('ссылка', '')
@@ -386,6 +409,8 @@ def save_results_into_tender_format(original_path: str, output_path: str,
 
         print(f"✅ Заполнено: {filled_count} товаров")
         print(f"🔗 Сохранено ссылок: {link_count}")
+        if blocked_count:
+            print(f"🚧 Заблокировано маркетом: {blocked_count} товаров")
         print(f"💾 Сохранено: {output_path}")
 
         return True
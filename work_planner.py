@@ -0,0 +1,123 @@
+# work_planner.py - ПЛАН РАБОТ: ДЕДУПЛИКАЦИЯ НАИМЕНОВАНИЙ ТЕНДЕРА ДО ПАРСИНГА
+
+import logging
+import re
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+# Написания единиц измерения -> одно каноническое (только сразу после числа)
+UNIT_ALIASES: Dict[str, str] = {
+    "гб": "gb", "гбайт": "gb", "gb": "gb",
+    "тб": "tb", "тбайт": "tb", "tb": "tb",
+    "мб": "mb", "мбайт": "mb", "mb": "mb",
+    "гбит": "gbit", "gbit": "gbit", "gbps": "gbit",
+    "мбит": "mbit", "mbit": "mbit", "mbps": "mbit",
+    "мм": "mm", "mm": "mm",
+    "см": "cm", "cm": "cm",
+    "м": "m", "метр": "m", "метра": "m", "метров": "m", "m": "m",
+    "км": "km", "km": "km",
+    "вт": "w", "w": "w",
+    "квт": "kw", "kw": "kw",
+    "в": "v", "вольт": "v", "v": "v",
+    "а": "a", "a": "a",
+    "мач": "mah", "mah": "mah",
+    "гц": "hz", "hz": "hz",
+    "мгц": "mhz", "mhz": "mhz",
+    "ггц": "ghz", "ghz": "ghz",
+    "дюйм": "in", "дюйма": "in", "дюймов": "in", '"': "in", "in": "in",
+    "кг": "kg", "kg": "kg",
+    "г": "g", "гр": "g", "g": "g",
+    "л": "l", "l": "l",
+    "мл": "ml", "ml": "ml",
+    "шт": "pcs", "штук": "pcs", "штуки": "pcs", "pcs": "pcs",
+    "порт": "port", "порта": "port", "портов": "port", "port": "port", "ports": "port",
+}
+
+# Единица - целый токен: после неё не может идти буква или цифра ("16gb2" - не единица)
+_NUMBER_UNIT_RE = re.compile(r'(\d+(?:\.\d+)?)(\s*)([a-zа-я]+|")(?!\w)')
+
+
+def _join_unit(match: "re.Match") -> str:
+    number, spaced, unit = match.group(1), match.group(2), match.group(3)
+    canonical = UNIT_ALIASES.get(unit)
+    # Однобуквенная единица через пробел - скорее предлог или начало слова
+    # ("16 в 1", "500 л..."), а не вольты/литры: такие не склеиваем
+    if canonical is None or (spaced and len(unit) == 1 and unit.isalpha()):
+        return f"{number} {unit}"
+    return f"{number}{canonical} "
+
+
+def canonicalize_name(name: str) -> str:
+    """
+    Каноническая форма наименования для дедупликации: регистр, ё/е, пробелы,
+    написание единиц ("16 Гб" = "16GB") и порядок слов не важны.
+    """
+    text = str(name or "").lower().replace("ё", "е")
+    # Десятичная запятая -> точка, дефисы внутри моделей убираем (RJ-45 = RJ45)
+    text = re.sub(r"(\d),(\d)", r"\1.\2", text)
+    text = re.sub(r"(?<=\w)-(?=\w)", "", text)
+    text = _NUMBER_UNIT_RE.sub(_join_unit, text)
+    text = re.sub(r'[^\w."]+', " ", text)
+    tokens = [t.strip('."') for t in text.split()]
+    return " ".join(sorted(t for t in tokens if t))
+
+
+class WorkItem:
+    """Одна уникальная единица работы и все строки тендера, которые её ждут."""
+
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+        self.rows: List[int] = []
+
+    def __repr__(self) -> str:
+        return f"WorkItem({self.name!r}, rows={self.rows})"
+
+
+class WorkPlan:
+    """
+    Уникальный набор товаров тендера. Парсится каждый items[i].name один раз,
+    результат раскладывается по всем items[i].rows (номера строк с 1).
+    """
+
+    def __init__(self, items: List[WorkItem], total_rows: int):
+        self.items = items
+        self.total_rows = total_rows
+        self._by_key = {item.key: item for item in items}
+
+    @property
+    def unique(self) -> int:
+        return len(self.items)
+
+    @property
+    def saved(self) -> int:
+        return self.total_rows - self.unique
+
+    def item_for(self, name: str) -> WorkItem:
+        return self._by_key[canonicalize_name(name)]
+
+    def log_summary(self) -> None:
+        percent = (self.saved * 100 // self.total_rows) if self.total_rows else 0
+        logger.info(
+            f"📋 План: строк {self.total_rows}, уникальных товаров {self.unique}, "
+            f"дубликатов {self.saved} ({percent}% работы сэкономлено)"
+        )
+        for item in self.items:
+            if len(item.rows) > 1:
+                logger.debug(f"  {item.name[:40]}... -> строки {item.rows}")
+
+
+def build_work_plan(names: Iterable[str]) -> WorkPlan:
+    """Группирует строки тендера по каноническому наименованию (порядок - по первой строке)."""
+    by_key: Dict[str, WorkItem] = {}
+    total = 0
+    for row, name in enumerate(names, start=1):
+        total += 1
+        key = canonicalize_name(name)
+        item = by_key.get(key)
+        if item is None:
+            # Для поиска берём исходное написание первой строки, а не каноническую форму
+            item = by_key[key] = WorkItem(key, str(name or ""))
+        item.rows.append(row)
+    return WorkPlan(list(by_key.values()), total)